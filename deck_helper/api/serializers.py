@@ -1,23 +1,38 @@
 from rest_framework import serializers
 from rest_framework.exceptions import APIException
 
-from cards.models import Card
+from cards.models import Card, CardClass
 from core.services.deck_codes import get_clean_deckstring
 from core.exceptions import DecodeError, UnsupportedCards
-from decks.models import Deck, Inclusion
+from decks.models import Deck, Format, Inclusion, SimilarDeck
 
 
-class FilterCardListSerializer(serializers.ListSerializer):
+class SparseFieldsetMixin:
+    """
+    Выбор полей ответа параметрами запроса: ``fields`` - только перечисленные поля,
+    ``exclude`` - все, кроме перечисленных (имена через запятую, неизвестные имена игнорируются)
 
-    def to_representation(self, data):
-        data = data.filter(collectible=True)
-        return super().to_representation(data)
+    Применяется только к сериализатору, которому передан запрос в контексте (не к вложенным);
+    исключенные поля не вычисляются.
+    """
+    fields_query_param = 'fields'
+    exclude_query_param = 'exclude'
 
-    def update(self, instance, validated_data):
-        pass
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if (request := kwargs.get('context', {}).get('request')) is None:
+            return
+        params = request.query_params
+        if only := params.get(self.fields_query_param):
+            keep = set(only.split(','))
+            for name in set(self.fields) - keep:
+                self.fields.pop(name)
+        if exclude := params.get(self.exclude_query_param):
+            for name in set(exclude.split(',')) & set(self.fields):
+                self.fields.pop(name)
 
 
-class BaseCardSerializer(serializers.ModelSerializer):
+class BaseCardSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
 
     card_type = serializers.CharField(source='get_card_type_display')
     card_set = serializers.SlugRelatedField(slug_field='name', read_only=True)
@@ -31,7 +46,6 @@ class BaseCardSerializer(serializers.ModelSerializer):
 class CardListSerializer(BaseCardSerializer):
 
     class Meta:
-        list_serializer_class = FilterCardListSerializer
         model = Card
         fields = ('dbf_id', 'card_id', 'name', 'collectible', 'card_type', 'card_class', 'rarity')
         ref_name = 'CardList'
@@ -48,6 +62,66 @@ class CardDetailSerializer(BaseCardSerializer):
         ref_name = 'Card'
 
 
+class CardAutocompleteSerializer(serializers.Serializer):
+    """ Подсказка для поиска карт (см. ``core.services.autocomplete``) """
+    dbf_id = serializers.IntegerField()
+    card_id = serializers.CharField()
+    name = serializers.CharField()
+    slug = serializers.CharField()
+
+    class Meta:
+        ref_name = 'CardAutocomplete'
+
+
+class CardFacetsSerializer(serializers.Serializer):
+    """ Кол-во найденных карт по значениям фильтров (см. ``core.services.card_facets``) """
+    rarity = serializers.DictField(child=serializers.IntegerField())
+    card_type = serializers.DictField(child=serializers.IntegerField())
+    card_class = serializers.DictField(child=serializers.IntegerField(), help_text='By class id')
+    card_set = serializers.DictField(child=serializers.IntegerField(), help_text='By card set id')
+    tribe = serializers.DictField(child=serializers.IntegerField(), help_text='By tribe id')
+    mechanic = serializers.DictField(child=serializers.IntegerField(), help_text='By mechanic id')
+
+    class Meta:
+        ref_name = 'CardFacets'
+
+
+class CardBulkQuerySerializer(serializers.Serializer):
+    """ Параметры запроса нескольких карт: ``dbf_id`` и/или ``card_id`` через запятую """
+    max_ids = 300
+
+    ids = serializers.CharField(help_text=f'Comma-separated "dbf_id" or "card_id" values (max. {max_ids})')
+
+    def validate_ids(self, value: str) -> list[str]:
+        ids = list(dict.fromkeys(filter(None, (card_id.strip() for card_id in value.split(',')))))
+        if not ids:
+            raise serializers.ValidationError('No card ids')
+        if len(ids) > self.max_ids:
+            raise serializers.ValidationError(f'Too many card ids (max. {self.max_ids})')
+        return ids
+
+
+class TrendQuerySerializer(serializers.Serializer):
+    """ Параметры запроса динамики популярности """
+    days = serializers.IntegerField(min_value=1, max_value=365, default=30, help_text='Number of last days')
+
+
+class DeckTrendQuerySerializer(TrendQuerySerializer):
+    dclass = serializers.SlugRelatedField(queryset=CardClass.objects.filter(collectible=True), slug_field='name',
+                                          required=False, help_text='Class name')
+    dformat = serializers.SlugRelatedField(queryset=Format.objects.all(), slug_field='name',
+                                           required=False, help_text='Format name')
+
+
+class TrendPointSerializer(serializers.Serializer):
+    """ Кол-во новых колод за день (см. ``core.services.popularity``) """
+    day = serializers.DateField()
+    num_decks = serializers.IntegerField()
+
+    class Meta:
+        ref_name = 'TrendPoint'
+
+
 class CardInDeckSerializer(BaseCardSerializer):
 
     class Meta:
@@ -77,27 +151,36 @@ class DeckSerializer(serializers.ModelSerializer):
     cost = serializers.SerializerMethodField()
 
     def get_cards(self, instance):
-        cards = instance.inclusions.filter(is_native=True).order_by('card__cost', 'card__name')
-        return InclusionSerializer(cards, many=True).data
+        return InclusionSerializer(instance.analytics.native_inclusions, many=True).data
 
     def get_cost(self, instance):
         return instance.craft_cost['basic']
 
 
-class DeckListSerializer(DeckSerializer):
+class DeckListSerializer(SparseFieldsetMixin, DeckSerializer):
 
     class Meta:
         model = Deck
-        fields = ('id', 'deck_format', 'deck_class', 'string', 'created')
+        fields = ('id', 'deck_format', 'deck_class', 'string', 'created', 'cost')
 
 
-class DeckDetailSerializer(DeckSerializer):
+class DeckDetailSerializer(SparseFieldsetMixin, DeckSerializer):
 
     class Meta:
         model = Deck
         fields = ('id', 'deck_format', 'deck_class', 'string', 'created', 'cost', 'cards')
 
 
+class SimilarDeckSerializer(serializers.ModelSerializer):
+    """ Похожая колода и число совпадающих с исходной колодой карт """
+
+    deck = DeckListSerializer(source='neighbour')
+
+    class Meta:
+        model = SimilarDeck
+        fields = ('deck', 'score')
+
+
 class DeckCreateSerializer(DeckSerializer):
 
     class Meta:
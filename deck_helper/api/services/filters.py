@@ -1,7 +1,10 @@
+from django.conf import settings
+from django.db.models import Exists, OuterRef
 from django_filters import rest_framework as filters
 
 from cards.models import Card, CardClass, CardSet
-from decks.models import Deck, Format
+from core.services.deck_bitmaps import DeckSet, all_cards, any_card, deck_bitmap_index
+from decks.models import Deck, DeckQuerySet, Format, Inclusion
 from .utils import generate_choicefield_description as gcd
 
 
@@ -14,11 +17,16 @@ class CharInFilter(filters.BaseInFilter, filters.CharFilter):
     pass
 
 
+class NumberInFilter(filters.BaseInFilter, filters.NumberFilter):
+    """ Фильтрация по разделенным запятыми числовым значениям """
+    pass
+
+
 class CardFilter(filters.FilterSet):
 
     card_id = filters.CharFilter()
     dbf_id = filters.NumberFilter()
-    name = filters.CharFilter(field_name='name', lookup_expr='icontains')
+    name = filters.CharFilter(method='search_by_name', help_text='Search by name and text in any language')
     classes = CharInFilter(field_name='card_class__name', lookup_expr='in', help_text='Comma-separated class names')
     ctype = filters.ChoiceFilter(field_name='card_type', choices=Card.CardTypes.choices,
                                  help_text=gcd(Card, 'CardTypes'))
@@ -36,6 +44,10 @@ class CardFilter(filters.FilterSet):
         fields = ('card_id', 'dbf_id', 'name', 'classes', 'ctype', 'cset', 'rarity', 'cost', 'attack', 'health',
                   'durability', 'armor')
 
+    def search_by_name(self, queryset, name, value):
+        """ Поиск карт по названию и тексту на всех языках, по убыванию релевантности """
+        return queryset.search_by_name(value)
+
 
 class DeckFilter(filters.FilterSet):
 
@@ -44,17 +56,50 @@ class DeckFilter(filters.FilterSet):
     dformat = filters.ModelChoiceFilter(queryset=Format.objects.all(),
                                         field_name='deck_format', to_field_name='name', help_text='Format name')
     date = filters.DateTimeFromToRangeFilter(field_name='created', help_text='Creation date (dd.mm.yyyy)')
-    cards = filters.CharFilter(field_name='cards', method='filter_decks_by_cards',
-                               help_text='Comma-separated "dbf_id" values')
+    cards = NumberInFilter(method='filter_decks_by_cards', help_text='Comma-separated "dbf_id" values')
+    cards_match = filters.ChoiceFilter(choices=DeckQuerySet.CardsMatch.choices, method='filter_cards_options',
+                                       help_text='Whether decks must contain all (default) or any of the "cards"')
+    min_copies = filters.NumberFilter(method='filter_cards_options', min_value=1,
+                                      help_text='Minimum number of copies of each of the "cards" (1 by default)')
+    without_cards = NumberInFilter(method='filter_decks_without_cards',
+                                   help_text='Comma-separated "dbf_id" values of cards the decks must not contain')
 
     class Meta:
         model = Deck
-        fields = ('dformat', 'dclass', 'date', 'cards')
+        fields = ('dformat', 'dclass', 'date', 'cards', 'cards_match', 'min_copies', 'without_cards')
 
-    def filter_decks_by_cards(self, queryset, name, value):
-        """ Позволяет фильтровать колоды по картам, указывая их ``dbf_id`` через запятую """
+    @staticmethod
+    def get_indexed_deck_ids(expression: DeckSet | None) -> list[int] | None:
+        """
+        Id колод выражения по битовому индексу (``core.services.deck_bitmaps``), если их не больше
+        ``settings.DECK_BITMAP_MAX_IDS``; иначе ``None`` - колоды отбираются подзапросом в БД
+        """
+        if expression is None:
+            return None
+        return deck_bitmap_index.deck_ids(expression, limit=settings.DECK_BITMAP_MAX_IDS)
 
-        for dbf_id in value.split(","):
-            queryset = queryset.filter(cards__dbf_id=dbf_id)
+    def filter_decks_by_cards(self, queryset, name, value):
+        """
+        Позволяет фильтровать колоды по картам, указывая их ``dbf_id`` через запятую;
+        учитывает параметры ``cards_match`` и ``min_copies``
+        """
+        match = self.form.cleaned_data.get('cards_match') or DeckQuerySet.CardsMatch.ALL
+        min_copies = int(self.form.cleaned_data.get('min_copies') or 1)
+        if min_copies == 1:     # число экземпляров карт в индексе не хранится
+            expression = all_cards(value) if match == DeckQuerySet.CardsMatch.ALL else any_card(value)
+            if (deck_ids := self.get_indexed_deck_ids(expression)) is not None:
+                return queryset.filter(pk__in=deck_ids)
+        return queryset.containing(value, match=match, min_copies=min_copies)
 
+    def filter_cards_options(self, queryset, name, value):
+        """ Параметры ``cards_match`` и ``min_copies`` применяются в ``filter_decks_by_cards`` """
         return queryset
+
+    def filter_decks_without_cards(self, queryset, name, value):
+        """ Исключает колоды, содержащие хотя бы одну из карт """
+        if not value:
+            return queryset
+        if (deck_ids := self.get_indexed_deck_ids(any_card(value))) is not None:
+            return queryset.exclude(pk__in=deck_ids)
+        # колод с картами много: коррелированный подзапрос (по индексу вхождений), а не список id в параметрах
+        return queryset.filter(~Exists(Inclusion.objects.filter(deck=OuterRef('pk'), card_id__in=value)))
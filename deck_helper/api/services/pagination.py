@@ -0,0 +1,167 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as Base64Error
+
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+try:
+    import coreapi
+    import coreschema
+except ImportError:
+    coreapi, coreschema = None, None
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset-пагинация: следующая страница - записи, идущие после последней записи текущей страницы
+    в порядке ``ordering`` (составной ключ, последнее поле - уникальное)
+
+    В отличие от ``CursorPagination`` из DRF, позиция - значения всех полей ключа, а не смещение
+    среди записей с одинаковым значением первого поля, поэтому запрос любой страницы использует индекс.
+    Пустые значения (NULL) считаются меньше любых других.
+    """
+    ordering: tuple[str, ...] = ()
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request) -> int:
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_ordering(self, queryset) -> tuple[str, ...]:
+        """ Ключ пагинации для ``queryset``; по умолчанию - ``ordering`` """
+        return self.ordering
+
+    def get_order_by(self) -> list:
+        return [
+            F(field[1:]).desc(nulls_last=True) if field.startswith('-') else F(field).asc(nulls_first=True)
+            for field in self.ordering
+        ]
+
+    def get_after_condition(self, position: list) -> Q:
+        """ Условие "запись идет после ``position``": (a, b) > (x, y) <=> a > x или (a = x и b > y) """
+        condition = Q(pk__in=[])
+        equal = Q()
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            if value is None:
+                # по убыванию после NULL ничего нет, по возрастанию - все непустые значения
+                after = Q(pk__in=[]) if field.startswith('-') else Q(**{f'{name}__isnull': False})
+                same = Q(**{f'{name}__isnull': True})
+            elif field.startswith('-'):
+                after = Q(**{f'{name}__lt': value}) | Q(**{f'{name}__isnull': True})
+                same = Q(**{name: value})
+            else:
+                after = Q(**{f'{name}__gt': value})
+                same = Q(**{name: value})
+            condition |= equal & after
+            equal &= same
+        return condition
+
+    def decode_cursor(self, request) -> list | None:
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+        except (Base64Error, UnicodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering) or \
+                not all(value is None or isinstance(value, (str, int, float)) for value in position):
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def encode_cursor(self, instance) -> str:
+        position = [getattr(instance, field.lstrip('-')) for field in self.ordering]
+        # дата и время - с микросекундами (DjangoJSONEncoder округляет их до миллисекунд)
+        encoded = json.dumps(position, default=lambda value: value.isoformat())
+        return urlsafe_b64encode(encoded.encode('ascii')).decode('ascii')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset)
+        queryset = queryset.order_by(*self.get_order_by())
+        if (position := self.decode_cursor(request)) is not None:
+            try:
+                queryset = queryset.filter(self.get_after_condition(position))
+            except (ValidationError, ValueError, TypeError):
+                raise NotFound(self.invalid_cursor_message)
+
+        page = list(queryset[:page_size + 1])
+        self.has_next = len(page) > page_size
+        self.page = page[:page_size]
+        return self.page
+
+    def get_next_link(self) -> str | None:
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_fields(self, view):
+        assert coreapi is not None, 'coreapi must be installed to use `get_schema_fields()`'
+        assert coreschema is not None, 'coreschema must be installed to use `get_schema_fields()`'
+        return [
+            coreapi.Field(
+                name=self.cursor_query_param,
+                required=False,
+                location='query',
+                schema=coreschema.String(description='The pagination cursor value ("next" link of the previous page)'),
+            ),
+            coreapi.Field(
+                name=self.page_size_query_param,
+                required=False,
+                location='query',
+                schema=coreschema.Integer(description=f'Number of results to return per page '
+                                                      f'(max. {self.max_page_size})'),
+            ),
+        ]
+
+
+class CardPagination(KeysetPagination):
+    """ Keyset-пагинация карт: по возрастанию стоимости, результаты поиска - по убыванию релевантности """
+    ordering = ('cost', 'dbf_id')
+    search_ordering = ('-search_rank', 'dbf_id')
+    page_size = 100
+
+    def get_ordering(self, queryset) -> tuple[str, ...]:
+        # поиск по названию (CardQuerySet.search_by_name) аннотирует карты релевантностью
+        if 'search_rank' in queryset.query.annotations:
+            return self.search_ordering
+        return super().get_ordering(queryset)
+
+
+class DeckPagination(KeysetPagination):
+    """ Keyset-пагинация колод: от новых к старым """
+    ordering = ('-created', '-id')
+    page_size = 18
+
+
+class SimilarDeckPagination(KeysetPagination):
+    """ Keyset-пагинация похожих колод: по убыванию числа совпадений карт """
+    ordering = ('-score', '-neighbour_id')
+    page_size = 18
@@ -0,0 +1,30 @@
+from rest_framework.renderers import JSONRenderer
+
+
+class ColumnarJSONRenderer(JSONRenderer):
+    """
+    Компактный JSON для списков (``?format=columnar`` или ``Accept: application/vnd.columnar+json``):
+    вместо списка объектов - имена полей (``columns``) и строки значений (``rows``), так что
+    имена полей передаются один раз, а не в каждом объекте
+
+    Постраничный ответ ``{"next": ..., "results": [...]}`` превращается в
+    ``{"next": ..., "columns": [...], "rows": [[...], ...]}``; ответы, не содержащие списка объектов,
+    отдаются как обычный JSON.
+    """
+    media_type = 'application/vnd.columnar+json'
+    format = 'columnar'
+
+    @staticmethod
+    def to_columns(objects: list) -> dict | None:
+        if not all(isinstance(obj, dict) for obj in objects):
+            return None
+        columns = list(objects[0]) if objects else []
+        return {'columns': columns, 'rows': [[obj.get(column) for column in columns] for obj in objects]}
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, list):
+            data = self.to_columns(data) or data
+        elif isinstance(data, dict) and isinstance(data.get('results'), list):
+            if (columns := self.to_columns(data['results'])) is not None:
+                data = {key: value for key, value in data.items() if key != 'results'} | columns
+        return super().render(data, accepted_media_type, renderer_context)
@@ -0,0 +1,42 @@
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+
+class NDJSONStreamMixin:
+    """
+    Потоковая выгрузка всего списка в формате NDJSON (по объекту JSON в строке): ``?stream=ndjson``
+
+    Объекты загружаются порциями по ``stream_chunk_size`` в порядке первичного ключа
+    (keyset по ``pk``), так что в памяти не бывает больше одной порции, а ``prefetch_related``
+    выполняется для каждой порции (``QuerySet.iterator()`` в Django 4.0 его не поддерживает).
+    Пагинация при выгрузке не применяется.
+    """
+    stream_query_param = 'stream'
+    stream_chunk_size = 1000
+
+    def iter_stream_objects(self, queryset):
+        queryset = queryset.order_by('pk')
+        last_pk = None
+        while True:
+            chunk = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+            chunk = list(chunk[:self.stream_chunk_size])
+            yield from chunk
+            if len(chunk) < self.stream_chunk_size:
+                return
+            last_pk = chunk[-1].pk
+
+    def iter_stream_lines(self, queryset):
+        serializer_class = self.get_serializer_class()
+        context = self.get_serializer_context()
+        for instance in self.iter_stream_objects(queryset):
+            data = serializer_class(instance, context=context).data
+            yield json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get(self.stream_query_param) != 'ndjson':
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        return StreamingHttpResponse(self.iter_stream_lines(queryset), content_type='application/x-ndjson')
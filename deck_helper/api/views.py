@@ -1,27 +1,107 @@
+from django.db.models import Q
+from django.utils.translation import get_language
 from rest_framework import viewsets, mixins
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
 
 from . import serializers
 from .services.filters import CardFilter, DeckFilter
 from .services.utils import DjangoFilterBackend
+from .services.pagination import CardPagination, DeckPagination, SimilarDeckPagination
+from .services.streaming import NDJSONStreamMixin
+from core.mixins import ConditionalGetMixin
+from core.services.autocomplete import suggest_cards
+from core.services.card_facets import count_queryset_facets
+from core.services.catalog import card_catalog
+from core.services.popularity import get_card_trend, get_deck_trend
 from cards.models import Card
-from decks.models import Deck
+from decks.models import Deck, SimilarDeck
 
 
-class CardViewSet(viewsets.ReadOnlyModelViewSet):
+class CardViewSet(ConditionalGetMixin, NDJSONStreamMixin, viewsets.ReadOnlyModelViewSet):
     """ Getting Hearthstone cards """
+    conditional_actions = ('list', 'retrieve', 'facets', 'autocomplete', 'bulk')
     queryset = Card.objects.all()
     filter_backends = (DjangoFilterBackend,)
     filterset_class = CardFilter
+    pagination_class = CardPagination
     lookup_field = 'dbf_id'
+    autocomplete_limit = 10
+
+    def get_queryset(self):
+        match self.action:
+            case 'list':
+                # в списке - только коллекционные карты
+                return self.queryset.filter(collectible=True).select_related('card_set').prefetch_related('card_class')
+            case 'facets':
+                return self.queryset.filter(collectible=True)
+            case _:
+                return self.queryset.select_related('card_set').prefetch_related('card_class', 'tribe', 'mechanic')
 
     def get_serializer_class(self):
         if self.action == 'list':
             return serializers.CardListSerializer
-        elif self.action == 'retrieve':
+        elif self.action in ('retrieve', 'bulk'):
             return serializers.CardDetailSerializer
+        elif self.action == 'autocomplete':
+            return serializers.CardAutocompleteSerializer
+        elif self.action == 'facets':
+            return serializers.CardFacetsSerializer
+        elif self.action == 'trend':
+            return serializers.TrendPointSerializer
+
+    @action(detail=False, methods=['get'])
+    def autocomplete(self, request):
+        """
+        Подсказки для поиска карт по началу названия ``q`` (из индекса в памяти, без запросов к БД);
+        фильтры: ``collectible`` (true/false), ``card_class`` (id класса), ``language`` (en/ru)
+        """
+        suggestions = suggest_cards(request.query_params, request.query_params.get('language', get_language()),
+                                    limit=self.autocomplete_limit)
+        serializer = self.get_serializer(suggestions, many=True)
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['get'])
+    def bulk(self, request):
+        """
+        Несколько карт одним запросом: ``ids`` - ``dbf_id`` и/или ``card_id`` через запятую (не больше 300).
+        Карты возвращаются по запрошенным id, для ненайденных id - ``null``
+        """
+        query = serializers.CardBulkQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        ids = query.validated_data['ids']
+        dbf_ids = [int(card_id) for card_id in ids if card_id.isdigit()]
+        cards = list(self.get_queryset().filter(Q(dbf_id__in=dbf_ids) | Q(card_id__in=ids)))
+
+        data = dict.fromkeys(ids)
+        for card, card_data in zip(cards, self.get_serializer(cards, many=True).data):
+            for card_id in (str(card.dbf_id), card.card_id):
+                if card_id in data:
+                    data[card_id] = card_data
+        return Response(data)
+
+    @action(detail=True, methods=['get'])
+    def trend(self, request, dbf_id=None):
+        """ Кол-во новых колод с картой по дням за последние ``days`` (по умолчанию 30) дней """
+        if not dbf_id.isdigit() or int(dbf_id) not in card_catalog:
+            raise NotFound()
+        query = serializers.TrendQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        serializer = self.get_serializer(get_card_trend(int(dbf_id), query.validated_data['days']), many=True)
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        """ Кол-во карт, подходящих под фильтры запроса, по редкостям, типам, классам, наборам, расам и механикам """
+        queryset = self.filter_queryset(self.get_queryset())
+        serializer = self.get_serializer(count_queryset_facets(queryset))
+        return Response(serializer.data)
 
 
 class DeckViewSet(
+    ConditionalGetMixin,
+    NDJSONStreamMixin,
     mixins.ListModelMixin,
     mixins.RetrieveModelMixin,
     mixins.CreateModelMixin,
@@ -29,6 +109,13 @@ class DeckViewSet(
 ):
     filter_backends = (DjangoFilterBackend,)
     filterset_class = DeckFilter
+    pagination_class = DeckPagination
+    # колода не меняется после создания: детальная информация зависит только от нее и данных о картах
+    conditional_actions = ('retrieve',)
+
+    @classmethod
+    def get_etag_parts(cls, request, *args, **kwargs) -> tuple:
+        return kwargs.get('pk'),
 
     def get_serializer_class(self):
         match self.action:
@@ -36,11 +123,38 @@ class DeckViewSet(
                 return serializers.DeckListSerializer
             case 'create':
                 return serializers.DeckCreateSerializer
+            case 'trend':
+                return serializers.TrendPointSerializer
             case _:
                 return serializers.DeckDetailSerializer
 
+    @action(detail=False, methods=['get'])
+    def trend(self, request):
+        """ Кол-во новых колод (класса ``dclass`` и формата ``dformat``) по дням за последние ``days`` дней """
+        query = serializers.DeckTrendQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+        trend = get_deck_trend(
+            params['days'],
+            deck_class_id=params['dclass'].pk if 'dclass' in params else None,
+            deck_format_id=params['dformat'].pk if 'dformat' in params else None,
+        )
+        serializer = self.get_serializer(trend, many=True)
+        return Response(serializer.data)
+
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk=None):
+        """ Похожие колоды (по убыванию числа совпадающих карт), keyset-пагинация """
+        deck = self.get_object()
+        paginator = SimilarDeckPagination()
+        page = paginator.paginate_queryset(SimilarDeck.objects.neighbours(deck), request, view=self)
+        serializer = serializers.SimilarDeckSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
     def get_queryset(self):
-        pk = self.kwargs.get('pk')
-        if pk:
-            return Deck.nameless.filter(pk=pk)
-        return Deck.nameless.all()
+        # стоимость берется из сводки колоды, список карт (только в детальной информации) - из Prefetch
+        queryset = Deck.nameless.select_related('summary', 'deck_class', 'deck_format')
+        # список карт может быть исключен из ответа параметрами fields/exclude (см. SparseFieldsetMixin)
+        if self.action in ('list', 'similar') or 'cards' not in self.get_serializer().fields:
+            return queryset
+        return queryset.with_analytics()
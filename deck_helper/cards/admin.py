@@ -1,4 +1,5 @@
 from django.contrib import admin
+from django.db.models import Q
 from modeltranslation.admin import TranslationAdmin
 
 from .models import Card, CardClass, Tribe, CardSet, Mechanic
@@ -63,6 +64,20 @@ class CardAdmin(TranslationAdmin):
     search_fields = ('name', 'card_set__name', 'text')
     save_on_top = True
 
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Поиск по ``search_fields``, дополненный поиском по названию и тексту карт на всех языках
+        (см. ``CardQuerySet.search_by_name``)
+        """
+        found, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if not search_term.strip():
+            return found, may_have_duplicates
+        # подзапросы id вместо объединения querysets: у результатов полнотекстового поиска свои аннотации
+        found = queryset.filter(
+            Q(pk__in=found.values('pk')) | Q(pk__in=queryset.search_by_name(search_term).values('pk'))
+        )
+        return found, False
+
 
 @admin.register(CardClass)
 class CardClassAdmin(TranslationAdmin):
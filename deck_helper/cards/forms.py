@@ -36,3 +36,15 @@ class CardSearchFilterForm(forms.Form):
     card_class.widget.attrs.update({'class': 'form-input'})
     card_set.widget.attrs.update({'class': 'form-input'})
     mechanic.widget.attrs.update({'class': 'form-input'})
+
+    def set_facet_counts(self, facets: dict[str, dict]):
+        """ Дополняет варианты выбора фильтров кол-вом найденных карт (см. ``core.services.card_facets``) """
+        for name, counts in facets.items():
+            field = self.fields[name]
+            if isinstance(field, forms.ModelChoiceField):
+                field.label_from_instance = lambda obj, counts=counts: f'{obj} ({counts.get(obj.pk, 0)})'
+            else:
+                field.choices = [
+                    (value, f'{label} ({counts.get(value, 0)})' if value else label)
+                    for value, label in field.choices
+                ]
@@ -0,0 +1,44 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+from core.services.card_search import SEARCH_CONFIGS, get_search_vector
+
+
+def get_search_indexes() -> list[GinIndex]:
+    """ GIN-индексы полнотекстового поиска и поиска по триграммам названий для каждого языка """
+    indexes = []
+    for language in SEARCH_CONFIGS:
+        indexes.append(GinIndex(get_search_vector(language), name=f'card_search_{language}_idx'))
+        indexes.append(GinIndex(fields=[f'name_{language}'], opclasses=['gin_trgm_ops'],
+                                name=f'card_name_{language}_trgm_idx'))
+    return indexes
+
+
+def create_search_indexes(apps, schema_editor):
+    # индексы создаются только в PostgreSQL, в остальных СУБД используется поиск подстроки
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Card = apps.get_model('cards', 'Card')
+    for index in get_search_indexes():
+        schema_editor.add_index(Card, index)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Card = apps.get_model('cards', 'Card')
+    for index in get_search_indexes():
+        schema_editor.remove_index(Card, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0003_alter_card_card_type'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.0.4 on 2026-10-18 07:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0004_card_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='card',
+            index=models.Index(fields=['cost', 'dbf_id'], name='card_cost_dbf_id_idx'),
+        ),
+    ]
@@ -4,11 +4,14 @@ from django.urls import reverse_lazy
 from django.utils.translation import gettext_lazy as _
 from django.core.validators import MinValueValidator
 
+from core.services.card_search import search_cards
+
 
 class CardQuerySet(QuerySet):
 
     def search_by_name(self, name):
-        return self.filter(name__icontains=name)
+        """ Поиск по названию и тексту карты на всех языках, по убыванию релевантности """
+        return search_cards(self, name)
 
     def search_by_rarity(self, rarity):
         return self.filter(rarity=rarity)
@@ -20,11 +23,11 @@ class CardQuerySet(QuerySet):
         return self.filter(card_type=type_)
 
     def search_by_tribe(self, tribe):
-        try:
-            supertribe = Tribe.objects.get(service_name='All')
-            return self.filter(Q(tribe=tribe) | Q(tribe=supertribe))
-        except Tribe.DoesNotExist:
+        from core.services.catalog import card_catalog  # импорт здесь во избежание перекрестного импорта
+
+        if (supertribe_id := card_catalog.all_tribe_id) is None:
             return self.filter(tribe=tribe)
+        return self.filter(Q(tribe=tribe) | Q(tribe=supertribe_id))
 
     def search_by_class(self, class_):
         return self.filter(card_class=class_)
@@ -216,6 +219,10 @@ class Card(BaseCard):
         verbose_name = _('Hearthstone card')
         verbose_name_plural = _('Hearthstone cards')
         ordering = ['-cost']
+        indexes = [
+            # keyset-пагинация карт в API (см. ``api.services.pagination.CardPagination``)
+            models.Index(fields=['cost', 'dbf_id'], name='card_cost_dbf_id_idx'),
+        ]
 
     def __str__(self):
         return self.name if self.collectible else f'[{self.name}]'
@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import CardListView, CardDetailView
+from .views import CardListView, CardDetailView, card_autocomplete
 
 
 app_name = 'cards'      # пространство имен urlpatterns
@@ -7,4 +7,5 @@ app_name = 'cards'      # пространство имен urlpatterns
 urlpatterns = [
     path('list/', CardListView.as_view(), name='card_list'),
     path('detail/<slug:card_slug>', CardDetailView.as_view(), name='card_detail'),
+    path('autocomplete/', card_autocomplete, name='card_autocomplete'),
 ]
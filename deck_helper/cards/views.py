@@ -1,14 +1,19 @@
+from django.http import HttpRequest, JsonResponse
 from django.views import generic
 from django.core.paginator import Paginator
-from django.utils.translation import gettext_lazy as _
+from django.utils.translation import gettext_lazy as _, get_language
 
 from .models import Card
 from .forms import CardSearchFilterForm
-from core.mixins import CacheMixin
+from core.mixins import CacheMixin, ConditionalGetMixin
+from core.services.page_cache import CacheScope, page_cache
+from core.services.autocomplete import suggest_cards
+from core.services.card_facets import count_facets
 
 
-class CardListView(CacheMixin, generic.ListView):
+class CardListView(ConditionalGetMixin, CacheMixin, generic.ListView):
     """ Список карт Hearthsone """
+    conditional_private = True
     model = Card
     context_object_name = 'cards'
     template_name = 'cards/card_list.html'
@@ -26,8 +31,14 @@ class CardListView(CacheMixin, generic.ListView):
                        'card_set': self.request.GET.get('card_set', ''),
                        'mechanic': self.request.GET.get('mechanic')}
 
+        # фасеты текущей выборки: один запрос id карт, кол-ва считаются по каталогу карт
+        dbf_ids = list(self.object_list.prefetch_related(None).order_by().values_list('dbf_id', flat=True))
+        form = CardSearchFilterForm(initial=prev_values)
+        form.set_facet_counts(count_facets(dbf_ids))
+
         context |= {'title': _('Hearthstone cards'),
-                    'form': CardSearchFilterForm(initial=prev_values)}
+                    'form': form,
+                    'num_results': len(dbf_ids)}
         return context
 
     def get_queryset(self):
@@ -72,13 +83,21 @@ class CardListView(CacheMixin, generic.ListView):
         return object_list
 
 
-class CardDetailView(CacheMixin, generic.DetailView):
+class CardDetailView(ConditionalGetMixin, CacheMixin, generic.DetailView):
     """ Детальная информация о карте Hearthstone """
+    conditional_private = True
+    conditional_last_modified = False
+    cache_scopes = (CacheScope.CARDS, CacheScope.DECKS)     # на странице - колоды с картой
     model = Card
     slug_url_kwarg = 'card_slug'
     context_object_name = 'card'
     template_name = 'cards/card_detail.html'
 
+    @classmethod
+    def get_etag_parts(cls, request, *args, **kwargs) -> tuple:
+        # на странице карты - колоды с этой картой: ETag меняется вместе с поколением кэша колод, без запроса к БД
+        return page_cache.get_namespace((CacheScope.DECKS,)),
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         inclusions = self.object.inclusions.nameless().order_by('-deck__created')
@@ -93,3 +112,8 @@ class CardDetailView(CacheMixin, generic.DetailView):
             'page_obj': page_obj,
         }
         return context
+
+
+def card_autocomplete(request: HttpRequest):
+    """ Подсказки для поиска карт по началу названия (параметры - см. ``suggest_cards``) """
+    return JsonResponse({'results': suggest_cards(request.GET, get_language())})
@@ -8,3 +8,7 @@ class UnsupportedCards(Exception):
 
 class UpdateError(Exception):
     pass
+
+
+class SimilarDecksRebuilding(Exception):
+    pass
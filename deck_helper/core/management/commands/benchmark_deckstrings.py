@@ -0,0 +1,103 @@
+from django.core.management.base import BaseCommand
+import base64
+import json
+import timeit
+from io import BytesIO
+from typing import IO
+
+from core.exceptions import DecodeError
+from core.services.deck_codes import (
+    DECKSTRING_VERSION,
+    ParsedCard,
+    ParsedAdditionalCard,
+    ParsedCardList,
+    ParsedDeckstring,
+    parse_deckstring,
+    parse_deckstrings,
+)
+from core.services.deck_utils import DATA_FOLDER
+
+
+def _legacy_read_varint(stream: IO) -> int:
+    shift = 0
+    result = 0
+    while True:
+        try:
+            c = stream.read(1)
+            if c == "":
+                raise EOFError("Unexpected EOF")
+            i = ord(c)
+
+            result |= (i & 0x7f) << shift
+            shift += 7
+            if not (i & 0x80):
+                break
+        except Exception:
+            raise DecodeError('Invalid deck code')
+
+    return result
+
+
+def _legacy_parse_deckstring(deckstring) -> ParsedDeckstring:
+    """ Прежняя реализация (``BytesIO`` + побайтовое чтение) - эталон для сравнения """
+    data = BytesIO(base64.b64decode(deckstring))
+    if data.read(1) != b"\0":
+        raise DecodeError('Invalid deck code')
+    if _legacy_read_varint(data) != DECKSTRING_VERSION:
+        raise DecodeError('Unsupported deckstring version')
+
+    parsed = ParsedDeckstring()
+    parsed.format_ = _legacy_read_varint(data)
+    for i in range(_legacy_read_varint(data)):
+        parsed.heroes.append(_legacy_read_varint(data))
+
+    parsed_cards = ParsedCardList()
+    for i in range(_legacy_read_varint(data)):
+        parsed_cards.native.append(ParsedCard(dbf_id=_legacy_read_varint(data), number=1))
+    for i in range(_legacy_read_varint(data)):
+        parsed_cards.native.append(ParsedCard(dbf_id=_legacy_read_varint(data), number=2))
+    for i in range(_legacy_read_varint(data)):
+        parsed_cards.native.append(ParsedCard(dbf_id=_legacy_read_varint(data), number=_legacy_read_varint(data)))
+    try:
+        _legacy_read_varint(data)
+        for i in range(_legacy_read_varint(data)):
+            card = ParsedAdditionalCard(dbf_id=_legacy_read_varint(data), source_dbf_id=_legacy_read_varint(data))
+            parsed_cards.additional.append(card)
+    except DecodeError:
+        pass
+
+    parsed.cards = parsed_cards
+    return parsed
+
+
+class Command(BaseCommand):
+    help = 'Compares the deckstring decoder with the previous BytesIO-based implementation'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-n', '--number', type=int, default=200, help='Number of passes over the deck data')
+        parser.add_argument('-f', '--file', nargs='?', default='initial_decks.json', help='Deck data file')
+
+    def handle(self, *args, **options):
+        with open(DATA_FOLDER / options['file'], 'r', encoding='utf-8') as f:
+            deckstrings = [deck['string'] for deck in json.load(f)]
+
+        number = options['number']
+        total = number * len(deckstrings)
+        timings = {
+            'legacy (BytesIO)': timeit.timeit(
+                lambda: [_legacy_parse_deckstring(d) for d in deckstrings], number=number
+            ),
+            'parse_deckstring': timeit.timeit(
+                lambda: [parse_deckstring(d) for d in deckstrings], number=number
+            ),
+            'parse_deckstrings': timeit.timeit(
+                lambda: list(parse_deckstrings(deckstrings)), number=number
+            ),
+        }
+
+        self.stdout.write(f'{total} deckstrings decoded per implementation')
+        baseline = timings['legacy (BytesIO)']
+        for name, seconds in timings.items():
+            self.stdout.write(
+                f'{name:<20} {seconds:8.3f}s  {seconds / total * 1e6:7.2f} us/deck  x{baseline / seconds:.2f}'
+            )
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.urls import get_resolver
+
+from core.services.page_cache import page_cache
+
+
+class Command(BaseCommand):
+    help = 'Shows page cache hits and misses per view'
+
+    def handle(self, *args, **options):
+        get_resolver().url_patterns     # загрузка представлений: они регистрируются в page_cache при импорте
+        for view, stats in page_cache.get_stats().items():
+            total = stats['hits'] + stats['misses']
+            hit_rate = stats['hits'] / total * 100 if total else 0
+            self.stdout.write(f'{view:<25} hits {stats["hits"]:>8}  misses {stats["misses"]:>8}  {hit_rate:5.1f}%')
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from core.services.popularity import rebuild_popularity
+
+
+class Command(BaseCommand):
+    help = 'Recomputes daily card and deck popularity counters from all nameless decks'
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Popularity counters: {rebuild_popularity()} rows')
@@ -1,9 +1,82 @@
-from django.views.decorators.cache import cache_page
+import hashlib
+from functools import wraps
+
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 from django.conf import settings
+from django.utils.translation import get_language
+
+from core.services.catalog import card_catalog
+from core.services.page_cache import CacheScope, page_cache
 
 
 class CacheMixin:
-    """ Подключает кэширование для CBV """
+    """ Подключает кэширование для CBV (с ключами в пространстве имен версии данных, см. ``page_cache``) """
+    cache_timeout = settings.CACHE_TTL_LONG
+    # области данных, при обновлении которых страница устаревает
+    cache_scopes = (CacheScope.CARDS,)
+
     @classmethod
     def as_view(cls, **initkwargs):
-        return cache_page(settings.CACHE_TTL)(super().as_view(**initkwargs))
+        return page_cache.cache_page(cls.cache_timeout, name=cls.__name__, scopes=cls.cache_scopes)(
+            super().as_view(**initkwargs)
+        )
+
+
+class ConditionalGetMixin:
+    """
+    Условные GET-запросы для CBV и ViewSet'ов DRF, ответы которых меняются только при обновлении БД карт
+
+    ETag строится по состоянию ``HearthstoneState`` (из каталога карт, без запроса к БД), языку
+    и ``get_etag_parts``; Last-Modified - время обновления БД. На запрос с актуальным ETag
+    отправляется ``304 Not Modified``, ответы разрешено кэшировать ``settings.HTTP_CACHE_MAX_AGE`` секунд.
+    """
+    # ответ зависит от пользователя (страницы сайта): ETag учитывает пользователя, кэш - только в браузере
+    conditional_private = False
+    # Last-Modified не отправляется, если ответ зависит не только от данных о картах
+    conditional_last_modified = True
+    # для ViewSet'ов: действия, к ответам которых применяются условные запросы
+    conditional_actions = ('list', 'retrieve')
+
+    @classmethod
+    def get_etag_parts(cls, request, *args, **kwargs) -> tuple:
+        """ Дополнительные данные, от которых зависит ответ (например, id объекта) """
+        return ()
+
+    @classmethod
+    def get_etag(cls, request, *args, **kwargs) -> str | None:
+        if (state := card_catalog.state) is None:
+            return None
+        # представление ответа зависит от языка и формата (API DRF: JSON или HTML)
+        parts = [*state, get_language(), request.headers.get('Accept', ''),
+                 *cls.get_etag_parts(request, *args, **kwargs)]
+        if cls.conditional_private:
+            parts.append(request.user.pk)
+        return hashlib.md5(':'.join(map(str, parts)).encode()).hexdigest()
+
+    @classmethod
+    def get_last_modified(cls, request, *args, **kwargs):
+        if not cls.conditional_last_modified or (state := card_catalog.state) is None:
+            return None
+        return state[1]
+
+    @classmethod
+    def as_view(cls, actions=None, **initkwargs):
+        if actions is None:
+            view = super().as_view(**initkwargs)
+        else:
+            view = super().as_view(actions, **initkwargs)
+            if actions.get('get') not in cls.conditional_actions:
+                return view
+
+        visibility = {'private': True} if cls.conditional_private else {'public': True}
+        conditional_view = cache_control(max_age=settings.HTTP_CACHE_MAX_AGE, **visibility)(
+            condition(etag_func=cls.get_etag, last_modified_func=cls.get_last_modified)(view)
+        )
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method in ('GET', 'HEAD'):
+                return conditional_view(request, *args, **kwargs)
+            return view(request, *args, **kwargs)
+        return wrapper
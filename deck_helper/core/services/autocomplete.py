@@ -0,0 +1,115 @@
+import threading
+from bisect import bisect_left
+
+from core.services.catalog import CardRecord, card_catalog
+from core.services.images.config import SUPPORTED_LANGUAGES
+
+DEFAULT_LANGUAGE = 'en'
+
+
+def normalize(text: str) -> str:
+    """ Приведение названия (или начала названия) к виду, в котором оно хранится в индексе """
+    return ' '.join(text.casefold().replace('ё', 'е').split())
+
+
+class CardNameIndex:
+    """
+    Префиксный индекс названий карт для подсказок при вводе
+
+    Для каждого языка из ``SUPPORTED_LANGUAGES`` хранится отсортированный массив ключей
+    (нормализованный суффикс названия, dbf_id, позиция суффикса) - по суффиксу на начало каждого слова названия,
+    так что "pill" находит "Spectral Pillager". Поиск - двоичный поиск первого ключа с префиксом
+    и перебор следующих за ним ключей.
+
+    Индекс строится по каталогу карт и перестраивается, когда каталог перезагружается
+    (например, после ``update_db``).
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        # (ключи по языкам, записи каталога) - заменяются целиком, чтобы читатели не видели их рассогласованными
+        self.__index: tuple[dict[str, list[tuple[str, int, int]]], dict[int, CardRecord]] = ({}, {})
+        self.__generation: int | None = None
+
+    @staticmethod
+    def __build_keys(records: dict[int, CardRecord], language: str) -> list[tuple[str, int, int]]:
+        keys = []
+        for record in records.values():
+            name = normalize(record.get_name(language))
+            position = 0
+            while position != -1:
+                keys.append((name[position:], record.dbf_id, position))
+                position = name.find(' ', position)
+                position = position if position == -1 else position + 1
+        keys.sort()
+        return keys
+
+    def __ensure_built(self) -> tuple[dict[str, list[tuple[str, int, int]]], dict[int, CardRecord]]:
+        generation = card_catalog.generation
+        if self.__generation != generation:
+            with self.__lock:
+                if self.__generation != generation:
+                    records = {record.dbf_id: record for record in card_catalog}
+                    keys = {language: self.__build_keys(records, language) for language in SUPPORTED_LANGUAGES}
+                    self.__index = (keys, records)
+                    self.__generation = generation
+        return self.__index
+
+    def warm_up(self):
+        """ Строит индекс заранее (при старте процесса), чтобы первый запрос не ждал загрузки """
+        self.__ensure_built()
+
+    def suggest(self, prefix: str, language: str | None = None, *, limit: int = 10,
+                collectible: bool | None = None, class_id: int | None = None) -> list[CardRecord]:
+        """
+        Карты, название которых (или одно из слов названия) начинается с ``prefix``
+
+        Карты, название которых начинается с ``prefix``, идут первыми, далее - по алфавиту
+
+        :param language: язык названий; по умолчанию - английский
+        :param collectible: только коллекционные (``True``) или только неколлекционные (``False``) карты
+        :param class_id: только карты класса ``class_id``
+        """
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        language = (language or '')[:2]     # 'en-us' -> 'en'
+        if language not in SUPPORTED_LANGUAGES:
+            language = DEFAULT_LANGUAGE
+
+        all_keys, all_records = self.__ensure_built()
+        keys = all_keys[language]
+        matches: dict[int, bool] = {}    # dbf_id -> совпадает ли начало названия
+        for index in range(bisect_left(keys, (prefix,)), len(keys)):
+            key, dbf_id, position = keys[index]
+            if not key.startswith(prefix):
+                break
+            record = all_records[dbf_id]
+            if collectible is not None and record.collectible != collectible:
+                continue
+            if class_id is not None and class_id not in record.class_ids:
+                continue
+            matches[dbf_id] = matches.get(dbf_id, False) or position == 0
+
+        records = [all_records[dbf_id] for dbf_id in matches]
+        records.sort(key=lambda record: (not matches[record.dbf_id], record.get_name(language).casefold()))
+        return records[:limit]
+
+
+card_name_index = CardNameIndex()
+
+
+def suggest_cards(params, language: str | None = None, limit: int = 10) -> list[dict]:
+    """
+    Подсказки по параметрам запроса: ``q`` - начало названия, ``collectible`` (``true``/``false``),
+    ``card_class`` - id класса. Некорректные значения фильтров игнорируются
+    """
+    collectible = {'true': True, 'false': False}.get(params.get('collectible'))
+    card_class = params.get('card_class', '')
+    class_id = int(card_class) if card_class.isdigit() else None
+    records = card_name_index.suggest(params.get('q', ''), language, limit=limit,
+                                      collectible=collectible, class_id=class_id)
+    return [
+        {'dbf_id': record.dbf_id, 'card_id': record.card_id, 'name': record.get_name(language), 'slug': record.slug}
+        for record in records
+    ]
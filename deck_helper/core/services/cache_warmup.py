@@ -0,0 +1,94 @@
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.urls import resolve, reverse
+from django.utils import translation
+from django.utils.http import urlencode
+
+from core.services.catalog import card_catalog
+from core.services.popularity import get_popular_card_ids
+from decks.models import Deck, DeckUsage
+
+
+def _get_deck_filters() -> list[dict]:
+    """ Фильтры списка колод: без фильтров и для каждой пары класс/формат, по которой есть колоды """
+    return [{}] + [
+        {'deck_class': deck_class_id, 'deck_format': deck_format_id}
+        for deck_class_id, deck_format_id in DeckUsage.objects.values_list('deck_class_id', 'deck_format_id')
+        .order_by('deck_class_id', 'deck_format_id').distinct()
+    ]
+
+
+def get_warmup_urls() -> list[str]:
+    """
+    Адреса самых посещаемых страниц, кэшируемых целиком, на всех языках сайта: список карт, страницы самых
+    популярных карт, первые ``settings.CACHE_WARMUP_DECK_PAGES`` страниц списка колод без фильтров
+    и для каждой пары класс/формат
+    """
+    popular_ids = [dbf_id for dbf_id in get_popular_card_ids(limit=settings.CACHE_WARMUP_POPULAR_CARDS)
+                   if dbf_id in card_catalog]
+    deck_filters = _get_deck_filters()
+
+    urls = []
+    for language in dict(settings.LANGUAGES):
+        with translation.override(language):
+            urls.append(reverse('cards:card_list'))
+            urls.extend(reverse('cards:card_detail', kwargs={'card_slug': card_catalog[dbf_id].slug})
+                        for dbf_id in popular_ids)
+            deck_list_url = reverse('decks:all_decks')
+            for params in deck_filters:
+                for page in range(1, settings.CACHE_WARMUP_DECK_PAGES + 1):
+                    query = (params | {'page': page}) if page > 1 else params
+                    urls.append(f'{deck_list_url}?{urlencode(query)}' if query else deck_list_url)
+    return urls
+
+
+def get_warmup_deck_ids() -> list[int]:
+    """ id колод с первых ``settings.CACHE_WARMUP_DECK_PAGES`` страниц списка колод (см. ``get_warmup_urls``) """
+    from decks.views import NamelessDecksListView  # импорт здесь во избежание перекрестного импорта
+
+    limit = settings.CACHE_WARMUP_DECK_PAGES * NamelessDecksListView.paginate_by
+    deck_ids = {}
+    for params in _get_deck_filters():
+        deck_ids.update(dict.fromkeys(Deck.nameless.filter(**params).values_list('pk', flat=True)[:limit]))
+    return list(deck_ids)
+
+
+def _get(url: str, **extra) -> HttpResponse:
+    """ GET-запрос анонимного посетителя: представление вызывается напрямую, без middleware """
+    request = RequestFactory().get(url, **extra)
+    request.user = AnonymousUser()
+    match = resolve(request.path_info)
+    response = match.func(request, *match.args, **match.kwargs)
+    if hasattr(response, 'render') and not response.is_rendered:
+        response.render()   # TemplateResponse попадает в кэш страниц после отрисовки
+    return response
+
+
+def warm_up_url(url: str) -> int:
+    """
+    Запрашивает страницу, кэшируемую целиком (см. ``core.services.page_cache``), чтобы она попала в кэш.
+    Возвращает код ответа
+
+    Ключ кэша страницы содержит полный адрес запроса, поэтому прогретая страница обслуживает только запросы
+    к ``settings.CACHE_WARMUP_HOST`` по схеме из ``settings.CACHE_WARMUP_SECURE``; хост задается явно.
+    """
+    if not settings.CACHE_WARMUP_HOST:
+        raise ImproperlyConfigured('CACHE_WARMUP_HOST must be set to warm up whole pages')
+    language = translation.get_language_from_path(url) or settings.LANGUAGE_CODE
+    with translation.override(language):
+        response = _get(url, HTTP_HOST=settings.CACHE_WARMUP_HOST, secure=bool(settings.CACHE_WARMUP_SECURE))
+    return response.status_code
+
+
+def warm_up_deck(deck_id: int):
+    """
+    Отрисовывает страницу колоды на всех языках сайта, чтобы в кэш попали ее фрагменты, зависящие только
+    от карт колоды (см. ``decks.views.get_deck_cache_context``). Ключи фрагментов не содержат ни адреса,
+    ни cookies, поэтому прогретые фрагменты используются на страницах колоды для всех посетителей
+    """
+    for language in dict(settings.LANGUAGES):
+        with translation.override(language):
+            _get(reverse('decks:deck_detail', kwargs={'deck_id': deck_id}))
@@ -0,0 +1,34 @@
+from collections import Counter
+from typing import Iterable
+
+from core.services.catalog import card_catalog
+
+# фасет -> функция, возвращающая значения фасета для записи каталога
+FACETS = {
+    'rarity': lambda record: (record.rarity,),
+    'card_type': lambda record: (record.card_type,),
+    'card_class': lambda record: record.class_ids,
+    'card_set': lambda record: (record.set_id,) if record.set_id is not None else (),
+    'tribe': lambda record: record.tribe_ids,
+    'mechanic': lambda record: record.mechanic_ids,
+}
+
+
+def count_facets(dbf_ids: Iterable[int]) -> dict[str, dict]:
+    """
+    Кол-во карт ``dbf_ids`` по значениям каждого фасета (редкость, тип, класс, набор, раса, механика)
+
+    Считается по каталогу карт в памяти: ``{'rarity': {'L': 12, ...}, 'card_class': {<id класса>: 40, ...}, ...}``
+    """
+    counters = {facet: Counter() for facet in FACETS}
+    for dbf_id in dbf_ids:
+        if (record := card_catalog.get(dbf_id)) is None:
+            continue
+        for facet, get_values in FACETS.items():
+            counters[facet].update(get_values(record))
+    return {facet: dict(counter) for facet, counter in counters.items()}
+
+
+def count_queryset_facets(queryset) -> dict[str, dict]:
+    """ Фасеты карт queryset'а: id карт загружаются одним запросом, остальное берется из каталога """
+    return count_facets(queryset.prefetch_related(None).order_by().values_list('dbf_id', flat=True))
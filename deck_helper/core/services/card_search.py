@@ -0,0 +1,77 @@
+from django.db import connection
+from django.db.models import Case, F, FloatField, Q, QuerySet, Value, When
+from django.db.models.functions import Greatest
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+    TrigramSimilarity,
+)
+
+# языки переводов карт (modeltranslation) и соответствующие конфигурации полнотекстового поиска PostgreSQL
+SEARCH_CONFIGS = {
+    'en': 'english',
+    'ru': 'russian',
+}
+
+
+def get_search_vector(language: str) -> SearchVector:
+    """
+    Документ полнотекстового поиска по карте: название (вес A) и текст (вес B) на языке ``language``
+
+    То же выражение используется в GIN-индексах (см. миграцию ``cards.0004_card_search_indexes``)
+    """
+    config = SEARCH_CONFIGS[language]
+    return (SearchVector(f'name_{language}', weight='A', config=config)
+            + SearchVector(f'text_{language}', weight='B', config=config))
+
+
+def _search_postgresql(queryset: QuerySet, query: str) -> QuerySet:
+    """ Полнотекстовый поиск и поиск по триграммам названий на всех языках, с ранжированием """
+    condition = Q()
+    ranks = []
+    for language, config in SEARCH_CONFIGS.items():
+        search_query = SearchQuery(query, config=config, search_type='websearch')
+        queryset = queryset.annotate(**{f'search_{language}': get_search_vector(language)})
+        condition |= Q(**{f'search_{language}': search_query})
+        condition |= Q(**{f'name_{language}__trigram_similar': query})
+        ranks.append(SearchRank(F(f'search_{language}'), search_query))
+        ranks.append(TrigramSimilarity(f'name_{language}', query))
+
+    return queryset.filter(condition).annotate(search_rank=Greatest(*ranks)).order_by('-search_rank', 'dbf_id')
+
+
+def _search_fallback(queryset: QuerySet, query: str) -> QuerySet:
+    """ Поиск подстроки в названиях и текстах на всех языках; точные совпадения и совпадения начала - выше """
+    condition = Q()
+    exact, prefix, in_name = Q(), Q(), Q()
+    for language in SEARCH_CONFIGS:
+        condition |= Q(**{f'name_{language}__icontains': query}) | Q(**{f'text_{language}__icontains': query})
+        exact |= Q(**{f'name_{language}__iexact': query})
+        prefix |= Q(**{f'name_{language}__istartswith': query})
+        in_name |= Q(**{f'name_{language}__icontains': query})
+
+    search_rank = Case(
+        When(exact, then=Value(3.0)),
+        When(prefix, then=Value(2.0)),
+        When(in_name, then=Value(1.0)),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+    return queryset.filter(condition).annotate(search_rank=search_rank).order_by('-search_rank', 'dbf_id')
+
+
+def search_cards(queryset: QuerySet, query: str) -> QuerySet:
+    """
+    Поиск карт по названию и тексту на всех языках; результаты упорядочены по релевантности
+    (аннотация ``search_rank``)
+
+    В PostgreSQL используется полнотекстовый поиск и поиск по триграммам (GIN-индексы),
+    в остальных СУБД - поиск подстроки
+    """
+    query = query.strip()
+    if not query:
+        return queryset
+    if connection.vendor == 'postgresql':
+        return _search_postgresql(queryset, query)
+    return _search_fallback(queryset, query)
@@ -0,0 +1,186 @@
+import threading
+import time
+from dataclasses import dataclass
+from typing import Iterator
+
+from django.conf import settings
+from django.utils.translation import get_language
+
+from core.models import HearthstoneState
+from cards.models import Card, CardClass, Tribe
+
+HERO_SKINS_SET = 'Hero Skins'   # набор, карты которого нельзя включить в колоду (см. IncludibleCardManager)
+
+
+@dataclass(slots=True, frozen=True)
+class CardRecord:
+    """ Компактная неизменяемая запись каталога карт """
+    dbf_id: int
+    card_id: str
+    slug: str
+    name_en: str
+    name_ru: str
+    cost: int | None
+    rarity: str
+    card_type: str
+    class_ids: tuple[int, ...]
+    class_slugs: tuple[str, ...]
+    set_id: int | None
+    tribe_ids: tuple[int, ...]
+    mechanic_ids: tuple[int, ...]
+    collectible: bool
+    includible: bool
+    image_en: str
+    image_ru: str
+    thumbnail: str
+
+    @property
+    def name(self) -> str:
+        """ Название карты на текущем языке """
+        return self.get_name(get_language())
+
+    def get_name(self, language: str | None) -> str:
+        if language and language.startswith('ru') and self.name_ru:
+            return self.name_ru
+        return self.name_en
+
+    @property
+    def class_id(self) -> int | None:
+        """ Основной класс карты (класс с наименьшим id, как ``card_class.all().first()``) """
+        return self.class_ids[0] if self.class_ids else None
+
+
+class CardCatalog:
+    """
+    Каталог карт, общий для процесса: dbf_id -> ``CardRecord``
+
+    Данные о картах меняются только при обновлении БД (``update_db``), поэтому каталог
+    загружается один раз при первом обращении и перезагружается, если изменилось
+    состояние ``HearthstoneState`` (версия или время обновления). Состояние проверяется
+    не чаще, чем раз в ``settings.CARD_CATALOG_CHECK_INTERVAL`` секунд.
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__records: dict[int, CardRecord] | None = None
+        self.__all_tribe_id: int | None = None
+        self.__state: tuple | None = None
+        self.__checked_at = 0.0
+        self.__generation = 0
+
+    @staticmethod
+    def __get_state() -> tuple | None:
+        return HearthstoneState.objects.filter(pk=1).values_list('version', 'last_updated').first()
+
+    @staticmethod
+    def __load_relations(relation, field: str) -> dict[int, list[int]]:
+        """ Связи карт с классами, расами или механиками: dbf_id -> список id (по возрастанию) """
+        result: dict[int, list[int]] = {}
+        for card_id, related_id in relation.through.objects.order_by(field).values_list('card_id', field):
+            result.setdefault(card_id, []).append(related_id)
+        return result
+
+    def __load(self, state: tuple | None):
+        """ Загружает каталог из БД (по одному запросу на классы, связи карт с классами, расами и механиками, карты) """
+        class_slugs = {
+            pk: ''.join(service_name.lower().split())
+            for pk, service_name in CardClass.objects.values_list('pk', 'service_name')
+        }
+        card_classes = self.__load_relations(Card.card_class, 'cardclass_id')
+        card_tribes = self.__load_relations(Card.tribe, 'tribe_id')
+        card_mechanics = self.__load_relations(Card.mechanic, 'mechanic_id')
+
+        records = {}
+        fields = ('dbf_id', 'card_id', 'slug', 'name_en', 'name_ru', 'cost', 'rarity', 'card_type', 'card_set_id',
+                  'collectible', 'card_set__service_name', 'image_en', 'image_ru', 'thumbnail')
+        for (dbf_id, card_id, slug, name_en, name_ru, cost, rarity, card_type, set_id,
+             collectible, set_name, image_en, image_ru, thumbnail) in Card.objects.values_list(*fields):
+            class_ids = tuple(card_classes.get(dbf_id, ()))
+            records[dbf_id] = CardRecord(
+                dbf_id=dbf_id,
+                card_id=card_id,
+                slug=slug,
+                name_en=name_en or '',
+                name_ru=name_ru or '',
+                cost=cost,
+                rarity=rarity,
+                card_type=card_type,
+                class_ids=class_ids,
+                class_slugs=tuple(class_slugs[pk] for pk in class_ids),
+                set_id=set_id,
+                tribe_ids=tuple(card_tribes.get(dbf_id, ())),
+                mechanic_ids=tuple(card_mechanics.get(dbf_id, ())),
+                collectible=collectible,
+                includible=collectible and set_name != HERO_SKINS_SET,
+                image_en=image_en or '',
+                image_ru=image_ru or '',
+                thumbnail=thumbnail or '',
+            )
+
+        self.__records = records
+        self.__all_tribe_id = Tribe.objects.filter(service_name='All').values_list('pk', flat=True).first()
+        self.__state = state
+        self.__generation += 1
+
+    def __ensure_loaded(self) -> dict[int, CardRecord]:
+        now = time.monotonic()
+        if self.__records is not None and now - self.__checked_at < settings.CARD_CATALOG_CHECK_INTERVAL:
+            return self.__records
+
+        with self.__lock:
+            if self.__records is None or now - self.__checked_at >= settings.CARD_CATALOG_CHECK_INTERVAL:
+                state = self.__get_state()
+                if self.__records is None or state != self.__state:
+                    self.__load(state)
+                self.__checked_at = now
+            return self.__records
+
+    def invalidate(self):
+        """ Сбрасывает каталог; он будет загружен заново при следующем обращении """
+        with self.__lock:
+            self.__records = None
+            self.__checked_at = 0.0
+
+    def get(self, dbf_id: int) -> CardRecord | None:
+        return self.__ensure_loaded().get(dbf_id)
+
+    def __getitem__(self, dbf_id: int) -> CardRecord:
+        try:
+            return self.__ensure_loaded()[dbf_id]
+        except KeyError:
+            raise Card.DoesNotExist(f'Card {dbf_id} does not exist')
+
+    def __contains__(self, dbf_id: int) -> bool:
+        return dbf_id in self.__ensure_loaded()
+
+    def __iter__(self) -> Iterator[CardRecord]:
+        return iter(self.__ensure_loaded().values())
+
+    def __len__(self) -> int:
+        return len(self.__ensure_loaded())
+
+    def get_includible_ids(self, dbf_ids) -> set[int]:
+        """ Возвращает те из ``dbf_ids``, которые принадлежат картам, доступным для включения в колоду """
+        records = self.__ensure_loaded()
+        return {dbf_id for dbf_id in dbf_ids if (record := records.get(dbf_id)) and record.includible}
+
+    @property
+    def state(self) -> tuple | None:
+        """ Состояние ``HearthstoneState`` (версия, время обновления), по которому загружен каталог """
+        self.__ensure_loaded()
+        return self.__state
+
+    @property
+    def generation(self) -> int:
+        """ Номер загрузки каталога; увеличивается при каждой перезагрузке (для построенных по каталогу индексов) """
+        self.__ensure_loaded()
+        return self.__generation
+
+    @property
+    def all_tribe_id(self) -> int | None:
+        """ id расы "Все" (Tribe с ``service_name='All'``), если она есть в БД """
+        self.__ensure_loaded()
+        return self.__all_tribe_id
+
+
+card_catalog = CardCatalog()
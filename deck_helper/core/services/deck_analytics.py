@@ -0,0 +1,162 @@
+from typing import Iterable
+
+from cards.models import Card, Mechanic
+
+# стоимость создания карты (во внутриигровой валюте) по редкости: (обычная, золотая)
+CRAFT_PRICES = {
+    Card.Rarities.UNKNOWN: (0, 0),
+    Card.Rarities.NO_RARITY: (0, 0),
+    Card.Rarities.COMMON: (40, 400),
+    Card.Rarities.RARE: (100, 800),
+    Card.Rarities.EPIC: (100, 1600),
+    Card.Rarities.LEGENDARY: (1600, 3200),
+}
+MANA_CURVE_SIZE = 11    # стоимости 0..9 и "10+"
+
+# (стоимость, редкость, тип, кол-во экземпляров, входит ли карта в колоду по умолчанию)
+CardRow = tuple[int | None, str, str, int, bool]
+
+
+def get_mana_curve_index(cost: int | None) -> int:
+    """ Номер столбца кривой маны для карты со стоимостью ``cost`` """
+    return min(max(cost or 0, 0), MANA_CURVE_SIZE - 1)
+
+
+def summarize_cards(rows: Iterable[CardRow]) -> dict:
+    """
+    Сводные показатели колоды (см. ``decks.models.DeckSummary``)
+
+    Хайлендер - колода, все основные карты которой включены в единственном экземпляре.
+    """
+    craft_cost, craft_cost_gold, card_count = 0, 0, 0
+    mana_curve = [0] * MANA_CURVE_SIZE
+    type_counts: dict[str, int] = {}
+    rarity_counts: dict[str, int] = {}
+    is_highlander = True
+    for cost, rarity, card_type, number, is_native in rows:
+        price, price_gold = CRAFT_PRICES.get(rarity, (0, 0))
+        craft_cost += price * number
+        craft_cost_gold += price_gold * number
+        mana_curve[get_mana_curve_index(cost)] += number
+        type_counts[card_type] = type_counts.get(card_type, 0) + number
+        rarity_counts[rarity] = rarity_counts.get(rarity, 0) + number
+        if is_native:
+            card_count += number
+            is_highlander = is_highlander and number == 1
+
+    return {
+        'craft_cost': craft_cost,
+        'craft_cost_gold': craft_cost_gold,
+        'mana_curve': mana_curve,
+        'card_count': card_count,
+        'type_counts': type_counts,
+        'rarity_counts': rarity_counts,
+        'is_highlander': is_highlander and card_count > 0,
+    }
+
+
+class DeckAnalytics:
+    """
+    Аналитика колоды: список карт, стоимость создания, кривая маны,
+    распределение карт по типам, редкостям, наборам и механикам
+
+    Список карт загружается один раз (см. ``inclusions_queryset``),
+    все показатели считаются за один проход по нему.
+    """
+
+    def __init__(self, inclusions: Iterable):
+        """
+        :param inclusions: вхождения карт колоды (``Inclusion``) с загруженными картами,
+                           их наборами, классами и механиками
+        """
+        self.native_inclusions = []
+        self.native_cards: list[Card] = []
+        self.additional_cards: list[Card] = []
+
+        basic, gold = 0, 0
+        mana_curve = [0] * MANA_CURVE_SIZE
+        types: dict[str, int] = {}
+        rarities: dict[str, int] = {}
+        sets: dict = {}
+        mechanics: dict[Mechanic, int] = {}
+
+        for inclusion in sorted(inclusions, key=lambda inc: (inc.card.cost or 0, inc.card.name)):
+            # карта дополняется данными о вхождении, как в ``Deck.included_cards``
+            card = inclusion.card
+            number = inclusion.number
+            card.number = number
+            if inclusion.is_native:
+                self.native_inclusions.append(inclusion)
+                self.native_cards.append(card)
+            else:
+                card.source = inclusion.source_card_id
+                self.additional_cards.append(card)
+
+            price, price_gold = CRAFT_PRICES.get(card.rarity, (0, 0))
+            basic += price * number
+            gold += price_gold * number
+            mana_curve[get_mana_curve_index(card.cost)] += number
+            types[card.card_type] = types.get(card.card_type, 0) + number
+            rarities[card.rarity] = rarities.get(card.rarity, 0) + number
+            sets[card.card_set] = sets.get(card.card_set, 0) + number
+            for mech in card.mechanic.all():
+                mechanics[mech] = mechanics.get(mech, 0) + number
+
+        self.craft_cost = {'basic': basic, 'gold': gold}
+        self.mana_curve = tuple(mana_curve)
+        self.card_count = sum(card.number for card in self.native_cards)
+        self.types_statistics = self.__to_statistics(types, Card.CardTypes)
+        self.rarity_statistics = self.__to_statistics(rarities, Card.Rarities)
+        self.sets_statistics = self.__to_statistics(sets)
+        self.mechanics_statistics = sorted(
+            ({'mech': mech, 'num_cards': num_cards} for mech, num_cards in mechanics.items()),
+            key=lambda stat: stat['num_cards'],
+            reverse=True,
+        )
+
+    @staticmethod
+    def __to_statistics(counter: dict, choices=None) -> list[dict]:
+        """
+        Преобразует счетчик в список словарей ``{'name', 'data', 'num_cards'}``,
+        отсортированный по убыванию кол-ва карт
+        """
+        result = [
+            {'name': choices(data) if choices else data, 'data': data, 'num_cards': num_cards}
+            for data, num_cards in counter.items()
+        ]
+        return sorted(result, key=lambda stat: stat['num_cards'], reverse=True)
+
+    @staticmethod
+    def inclusions_queryset(inclusions):
+        """ Дополняет queryset вхождений карт данными, необходимыми для аналитики """
+        return inclusions.select_related(
+            'card',
+            'card__card_set',
+        ).prefetch_related(
+            'card__card_class',
+            'card__tribe',
+            'card__mechanic',
+        )
+
+    @classmethod
+    def for_decks(cls, decks) -> list:
+        """
+        Загружает аналитику сразу для всех колод ``decks`` (например, колод одной страницы)
+        постоянным числом запросов и прикрепляет ее к колодам (``deck.analytics``)
+
+        :return: список колод
+        """
+        from decks.models import Inclusion  # импорт здесь во избежание перекрестного импорта
+
+        decks = list(decks)
+        inclusions: dict[int, list] = {deck.pk: [] for deck in decks}
+        if inclusions:
+            for inclusion in cls.inclusions_queryset(Inclusion.objects.filter(deck__in=list(inclusions))):
+                inclusions[inclusion.deck_id].append(inclusion)
+        for deck in decks:
+            deck.analytics = cls(inclusions[deck.pk])
+        return decks
+
+    def get_additional_cards(self, source_id: int) -> list[Card]:
+        """ Возвращает доп. карты, добавленные в колоду картой ``source_id`` """
+        return [card for card in self.additional_cards if card.source == source_id]
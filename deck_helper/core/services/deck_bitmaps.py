@@ -0,0 +1,288 @@
+import threading
+from abc import ABC, abstractmethod
+from array import array
+from collections import defaultdict
+from collections.abc import Iterable, Iterator
+from operator import and_, or_, sub
+
+from decks.models import Deck, Inclusion
+
+# id колоды делится на номер блока (старшие биты) и позицию в блоке (младшие 16 бит), как в Roaring bitmap
+BLOCK_BITS = 16
+BLOCK_MASK = (1 << BLOCK_BITS) - 1
+# в блоке не больше стольких колод хранится отсортированный массив позиций (2 байта на колоду),
+# в более заполненном - битовая карта блока (8 КБ)
+ARRAY_MAX_SIZE = 4096
+
+Block = array | int
+
+
+def _block_bits(lows: Block | Iterable[int]) -> int:
+    """ Битовая карта блока: биты устанавливаются в изменяемом буфере, число создается один раз """
+    if isinstance(lows, int):
+        return lows
+    buffer = bytearray(1 << (BLOCK_BITS - 3))
+    for low in lows:
+        buffer[low >> 3] |= 1 << (low & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+def _make_block(lows: set[int]) -> Block | None:
+    """ Блок из позиций колод: массив для немногих колод, битовая карта для многих; ``None`` - пустой блок """
+    if not lows:
+        return None
+    if len(lows) <= ARRAY_MAX_SIZE:
+        return array('H', sorted(lows))
+    return _block_bits(lows)
+
+
+def _block_lows(block: Block) -> Iterator[int]:
+    """ Позиции колод блока по возрастанию """
+    if isinstance(block, array):
+        yield from block
+        return
+    bits = bin(block)[:1:-1]    # младший бит - первый
+    position = bits.find('1')
+    while position != -1:
+        yield position
+        position = bits.find('1', position + 1)
+
+
+def _block_size(block: Block) -> int:
+    return len(block) if isinstance(block, array) else block.bit_count()
+
+
+def _combine_blocks(operator, left: Block, right: Block) -> Block | None:
+    """ Пересечение, объединение или разность (``operator``) блоков """
+    if isinstance(left, array) and isinstance(right, array):
+        return _make_block(operator(set(left), set(right)))
+    left_bits, right_bits = _block_bits(left), _block_bits(right)
+    bits = left_bits & ~right_bits if operator is sub else operator(left_bits, right_bits)
+    if bits.bit_count() > ARRAY_MAX_SIZE:
+        return bits
+    return _make_block(set(_block_lows(bits)))
+
+
+class DeckBitmap:
+    """
+    Сжатое множество id колод (по образцу Roaring bitmap)
+
+    Id колод разбиты на блоки по 65536 id; память зависит от числа колод в множестве, а не от наибольшего id.
+    Множества неизменяемы: операции ``&``, ``|`` и ``-`` возвращают новое множество,
+    разделяя с исходными не затронутые операцией блоки.
+    """
+    __slots__ = ('blocks',)
+
+    def __init__(self, blocks: dict[int, Block] | None = None):
+        self.blocks = blocks or {}
+
+    @classmethod
+    def from_ids(cls, deck_ids: Iterable[int]) -> 'DeckBitmap':
+        lows_by_key = defaultdict(set)
+        for deck_id in deck_ids:
+            lows_by_key[deck_id >> BLOCK_BITS].add(deck_id & BLOCK_MASK)
+        return cls({key: _make_block(lows) for key, lows in lows_by_key.items()})
+
+    def __combine(self, operator, other: 'DeckBitmap', keys) -> 'DeckBitmap':
+        blocks = {}
+        for key in keys:
+            left, right = self.blocks.get(key), other.blocks.get(key)
+            if left is None or right is None:
+                # объединение или разность с пустым блоком: блок переходит в результат без изменений
+                block = left if right is None else right
+            else:
+                block = _combine_blocks(operator, left, right)
+            if block is not None:
+                blocks[key] = block
+        return DeckBitmap(blocks)
+
+    def __and__(self, other: 'DeckBitmap') -> 'DeckBitmap':
+        return self.__combine(and_, other, self.blocks.keys() & other.blocks.keys())
+
+    def __or__(self, other: 'DeckBitmap') -> 'DeckBitmap':
+        return self.__combine(or_, other, self.blocks.keys() | other.blocks.keys())
+
+    def __sub__(self, other: 'DeckBitmap') -> 'DeckBitmap':
+        return self.__combine(sub, other, self.blocks.keys())
+
+    def __len__(self):
+        return sum(map(_block_size, self.blocks.values()))
+
+    def __iter__(self) -> Iterator[int]:
+        """ Id колод по возрастанию """
+        for key in sorted(self.blocks):
+            base = key << BLOCK_BITS
+            for low in _block_lows(self.blocks[key]):
+                yield base | low
+
+
+EMPTY = DeckBitmap()
+
+
+class DeckSet(ABC):
+    """
+    Выражение над множествами безымянных колод: ``HasCard(a) & ~HasCard(b) & InFormat(f)``
+
+    Операции ``&``, ``|`` и ``~`` соответствуют пересечению, объединению и дополнению
+    (до множества всех колод индекса)
+    """
+
+    def __and__(self, other: 'DeckSet') -> 'DeckSet':
+        return _Operation(and_, self, other)
+
+    def __or__(self, other: 'DeckSet') -> 'DeckSet':
+        return _Operation(or_, self, other)
+
+    def __invert__(self) -> 'DeckSet':
+        return _Not(self)
+
+    @abstractmethod
+    def evaluate(self, index: 'DeckBitmapIndex') -> DeckBitmap:
+        """ Множество колод выражения """
+
+
+class HasCard(DeckSet):
+    """ Колоды, содержащие карту ``dbf_id`` """
+
+    def __init__(self, dbf_id: int):
+        self.dbf_id = int(dbf_id)
+
+    def evaluate(self, index):
+        return index.bitmaps['card'].get(self.dbf_id, EMPTY)
+
+
+class OfClass(DeckSet):
+    """ Колоды класса ``class_id`` """
+
+    def __init__(self, class_id: int):
+        self.class_id = int(class_id)
+
+    def evaluate(self, index):
+        return index.bitmaps['class'].get(self.class_id, EMPTY)
+
+
+class InFormat(DeckSet):
+    """ Колоды формата ``format_id`` """
+
+    def __init__(self, format_id: int):
+        self.format_id = int(format_id)
+
+    def evaluate(self, index):
+        return index.bitmaps['format'].get(self.format_id, EMPTY)
+
+
+class _Operation(DeckSet):
+
+    def __init__(self, operator, left: DeckSet, right: DeckSet):
+        self.operator = operator
+        self.left = left
+        self.right = right
+
+    def evaluate(self, index):
+        return self.operator(self.left.evaluate(index), self.right.evaluate(index))
+
+
+class _Not(DeckSet):
+
+    def __init__(self, operand: DeckSet):
+        self.operand = operand
+
+    def evaluate(self, index):
+        return index.universe - self.operand.evaluate(index)
+
+
+def any_card(dbf_ids: Iterable[int]) -> DeckSet | None:
+    """ Колоды, содержащие хотя бы одну из карт ``dbf_ids`` (``None``, если карты не указаны) """
+    result = None
+    for dbf_id in dbf_ids:
+        result = HasCard(dbf_id) if result is None else result | HasCard(dbf_id)
+    return result
+
+
+def all_cards(dbf_ids: Iterable[int]) -> DeckSet | None:
+    """ Колоды, содержащие каждую из карт ``dbf_ids`` (``None``, если карты не указаны) """
+    result = None
+    for dbf_id in dbf_ids:
+        result = HasCard(dbf_id) if result is None else result & HasCard(dbf_id)
+    return result
+
+
+class DeckBitmapIndex:
+    """
+    Множества безымянных колод (``DeckBitmap``) по картам, классам и форматам
+
+    Выражения ``DeckSet`` вычисляются операциями над множествами в памяти.
+    Индекс загружается из БД при первом обращении и дополняется новыми колодами
+    (по возрастанию id) перед каждым запросом.
+    """
+
+    # новые колоды дочитываются с небольшим перекрытием: транзакции с меньшими id могут завершиться позже
+    REFRESH_OVERLAP = 100
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.bitmaps: dict[str, dict[int, DeckBitmap]] = {'card': {}, 'class': {}, 'format': {}}
+        self.universe = EMPTY
+        self.__watermark = 0
+
+    def __refresh(self):
+        """ Добавляет в индекс колоды, созданные после последнего обновления """
+        # id колод сначала собираются по ключам: множество каждого ключа объединяется с новыми колодами
+        # один раз, при этом перестраиваются только блоки, в которые попали новые колоды
+        new_ids = {kind: defaultdict(list) for kind in self.bitmaps}
+        min_id = self.__watermark - self.REFRESH_OVERLAP
+        decks = Deck.nameless.filter(pk__gt=min_id).order_by().values_list('pk', 'deck_class_id', 'deck_format_id')
+        deck_ids = []
+        for deck_id, class_id, format_id in decks.iterator():
+            deck_ids.append(deck_id)
+            new_ids['class'][class_id].append(deck_id)
+            new_ids['format'][format_id].append(deck_id)
+        if not deck_ids:
+            return
+
+        inclusions = Inclusion.objects.filter(deck__name='', deck_id__gt=min_id).values_list('deck_id', 'card_id')
+        for deck_id, card_id in inclusions.iterator():
+            new_ids['card'][card_id].append(deck_id)
+
+        self.universe |= DeckBitmap.from_ids(deck_ids)
+        for kind, ids_by_key in new_ids.items():
+            bitmaps = self.bitmaps[kind]
+            for key, ids in ids_by_key.items():
+                bitmaps[key] = bitmaps.get(key, EMPTY) | DeckBitmap.from_ids(ids)
+        self.__watermark = max(self.__watermark, max(deck_ids))
+
+    def invalidate(self):
+        """ Сбрасывает индекс; он будет загружен заново при следующем запросе """
+        with self.__lock:
+            self.bitmaps = {'card': {}, 'class': {}, 'format': {}}
+            self.universe = EMPTY
+            self.__watermark = 0
+
+    def evaluate(self, expression: DeckSet) -> DeckBitmap:
+        """ Множество колод, удовлетворяющих выражению ``expression`` """
+        with self.__lock:
+            self.__refresh()
+            return expression.evaluate(self)
+
+    def count(self, expression: DeckSet) -> int:
+        """ Кол-во колод, удовлетворяющих выражению ``expression`` """
+        return len(self.evaluate(expression))
+
+    def deck_ids(self, expression: DeckSet, limit: int | None = None) -> list[int] | None:
+        """
+        Id колод (по возрастанию), удовлетворяющих выражению ``expression``;
+        ``None``, если колод больше ``limit``
+        """
+        deck_set = self.evaluate(expression)
+        if limit is not None and len(deck_set) > limit:
+            return None
+        return list(deck_set)
+
+    def card_counts(self) -> dict[int, int]:
+        """ Кол-во колод, содержащих каждую из карт индекса ({dbf_id: кол-во колод}) """
+        with self.__lock:
+            self.__refresh()
+            return {dbf_id: len(deck_set) for dbf_id, deck_set in self.bitmaps['card'].items()}
+
+
+deck_bitmap_index = DeckBitmapIndex()
@@ -1,6 +1,7 @@
 import base64
-from io import BytesIO
-from typing import IO, NamedTuple
+import binascii
+import hashlib
+from typing import Iterable, Iterator, NamedTuple
 from dataclasses import dataclass, field
 
 from django.utils.translation import gettext_lazy as _
@@ -8,6 +9,7 @@ from django.utils.translation import gettext_lazy as _
 from core.exceptions import DecodeError
 
 DECKSTRING_VERSION = 1
+DECK_DIGEST_LENGTH = 40     # длина hex-представления SHA-1
 
 CardList = list[int]
 CardIncludeList = list[tuple[int, int]]
@@ -24,13 +26,13 @@ class ParsedAdditionalCard(NamedTuple):
     number: int = 1
 
 
-@dataclass
+@dataclass(slots=True)
 class ParsedCardList:
     native: list[ParsedCard] = field(default_factory=list)
     additional: list[ParsedAdditionalCard] = field(default_factory=list)
 
 
-@dataclass
+@dataclass(slots=True)
 class ParsedDeckstring:
     cards: ParsedCardList | None = None
     heroes: list[int] = field(default_factory=list)
@@ -48,24 +50,112 @@ def get_clean_deckstring(deckstring: str) -> str:
     return deckstring.split('#')[-3].strip()
 
 
-def _read_varint(stream: IO) -> int:
-    shift = 0
-    result = 0
-    while True:
-        try:
-            c = stream.read(1)      # считываем по 1 байту в строку (1 символ)
-            if c == "":
-                raise EOFError("Unexpected EOF")
-            i = ord(c)
+def _read_varints(buffer: memoryview) -> list[int]:
+    """
+    Считывает все числа в формате varint за один проход по буферу
 
+    Каждый байт несет 7 бит числа (младшие биты - первыми);
+    старший бит байта (0x80) означает, что число продолжается в следующем байте.
+    Недочитанное в конце буфера число отбрасывается.
+    """
+    values = []
+    result = 0
+    shift = 0
+    for i in buffer:
+        if i & 0x80:
             result |= (i & 0x7f) << shift   # 0x7f = 0b01111111
             shift += 7
-            if not (i & 0x80):              # если 0 < i < 128
-                break
-        except Exception:
-            raise DecodeError(_('Invalid deck code'))
+        else:
+            values.append(result | (i << shift))
+            result = 0
+            shift = 0
+    return values
 
-    return result
+
+def _decode(deckstring) -> bytes:
+    """ Декстринг в байты """
+    try:
+        return base64.b64decode(deckstring)
+    except (binascii.Error, ValueError, TypeError):
+        raise DecodeError(_('Invalid deck code'))
+
+
+def _parse_buffer(buffer: memoryview) -> ParsedDeckstring:
+    """ Расшифровка байтов декстринга: проход по буферу без копирования, затем по числам со смещением """
+
+    # первый байт: должен быть \0
+    if not len(buffer) or buffer[0] != 0:
+        raise DecodeError(_('Invalid deck code'))
+
+    values = _read_varints(buffer)
+    try:
+        # второй байт: версия шифрования кодов колод
+        if values[1] != DECKSTRING_VERSION:
+            raise DecodeError(_('Unsupported deckstring version'))
+
+        # третий байт: формат (режим игры)
+        format_ = values[2]
+
+        # 4-й байт: число героев, упомянутых в декстринге
+        offset = 4 + values[3]
+        heroes = values[4:offset]
+
+        native = []
+        # карты в одном и в двух экземплярах
+        for number in (1, 2):
+            num_cards = values[offset]
+            offset += 1
+            end = offset + num_cards
+            native.extend(ParsedCard(dbf_id, number) for dbf_id in values[offset:end])
+            offset = end
+
+        # карты в n экземплярах: пары (dbf_id, число экземпляров)
+        num_cards_xn = values[offset]
+        offset += 1
+        end = offset + 2 * num_cards_xn
+        native.extend(map(ParsedCard, values[offset:end:2], values[offset + 1:end:2]))
+        offset = end
+        if offset > len(values):
+            raise IndexError
+    except IndexError:
+        raise DecodeError(_('Invalid deck code'))
+
+    additional = []
+    # Есть ли доп. скрытые карты? (флаг и их количество)
+    # Если буфер закончился - в колоде их нет
+    if offset + 1 < len(values):
+        offset += 1
+        # доп. карты в одном и в двух экземплярах: пары (dbf_id, dbf_id карты-источника);
+        # секции, которых нет в буфере, пусты, неполные записи в конце буфера отбрасываются
+        for number in (1, 2):
+            if offset >= len(values):
+                break
+            num_cards = values[offset]
+            offset += 1
+            end = offset + 2 * min(num_cards, (len(values) - offset) // 2)
+            additional.extend(
+                ParsedAdditionalCard(dbf_id, source_dbf_id, number)
+                for dbf_id, source_dbf_id in zip(values[offset:end:2], values[offset + 1:end:2])
+            )
+            offset = end
+
+        # доп. карты в n экземплярах: тройки (dbf_id, число экземпляров, dbf_id карты-источника)
+        if offset < len(values):
+            num_cards = values[offset]
+            offset += 1
+            end = offset + 3 * min(num_cards, (len(values) - offset) // 3)
+            additional.extend(
+                ParsedAdditionalCard(dbf_id, source_dbf_id, number)
+                for dbf_id, number, source_dbf_id in zip(
+                    values[offset:end:3], values[offset + 1:end:3], values[offset + 2:end:3]
+                )
+            )
+
+    return ParsedDeckstring(
+        cards=ParsedCardList(native=native, additional=additional),
+        heroes=heroes,
+        format_=format_,
+    )
 
 
 def parse_deckstring(deckstring) -> ParsedDeckstring:
@@ -75,62 +165,127 @@ def parse_deckstring(deckstring) -> ParsedDeckstring:
     :param deckstring: строка ASCII или байты
     :return: список кортежей[dbf_id, count]; список[dbf_id]; значение енума формата
     """
-    try:
-        decoded = base64.b64decode(deckstring)      # декстринг в байты
-    except Exception:
-        raise DecodeError('Invalid deck code')
-    data = BytesIO(decoded)                     # байты в поток байтов в оперативной памяти
+    decoded = _decode(deckstring)
+    with memoryview(decoded) as buffer:
+        return _parse_buffer(buffer)
 
-    # первый байт: должен быть \0
-    if data.read(1) != b"\0":
-        raise DecodeError('Invalid deck code')
 
-    # второй байт: версия шифрования кодов колод
-    version = _read_varint(data)
-    if version != DECKSTRING_VERSION:
-        raise DecodeError('Unsupported deckstring version')
+def parse_deckstrings(deckstrings: Iterable, *, skip_invalid: bool = False) -> Iterator[ParsedDeckstring | None]:
+    """
+    Пакетная расшифровка кодов колод (импорт, пересборка колод)
+
+    Результаты возвращаются лениво и в том же порядке, что и коды колод.
 
-    parsed = ParsedDeckstring()
+    :param deckstrings: последовательность строк ASCII или байтов
+    :param skip_invalid: вместо исключения ``DecodeError`` возвращать ``None`` для некорректных кодов
+    """
+    for deckstring in deckstrings:
+        try:
+            yield parse_deckstring(deckstring)
+        except DecodeError:
+            if not skip_invalid:
+                raise
+            yield None
 
-    # третий байт: формат (режим игры)
-    parsed.format_ = _read_varint(data)
 
-    # 4-й байт: число героев, упомянутых в декстринге
-    num_heroes = _read_varint(data)
-    for i in range(num_heroes):
-        parsed.heroes.append(_read_varint(data))
+def _write_varint(data: bytearray, value: int):
+    """ Записывает в буфер целое неотрицательное число в формате varint """
+    while True:
+        i = value & 0x7f
+        value >>= 7
+        if value:
+            data.append(i | 0x80)
+        else:
+            data.append(i)
+            return
 
-    parsed_cards = ParsedCardList()
-    # кол-во карт в одном экземпляре
-    num_cards_x1 = _read_varint(data)
-    for i in range(num_cards_x1):
-        card = ParsedCard(dbf_id=_read_varint(data), number=1)
-        parsed_cards.native.append(card)
 
-    num_cards_x2 = _read_varint(data)
-    for i in range(num_cards_x2):
-        card = ParsedCard(dbf_id=_read_varint(data), number=2)
-        parsed_cards.native.append(card)
+def write_deckstring(parsed: ParsedDeckstring) -> str:
+    """
+    Шифрование колоды в код (операция, обратная ``parse_deckstring``)
 
-    num_cards_xn = _read_varint(data)
-    for i in range(num_cards_xn):
-        card = ParsedCard(dbf_id=_read_varint(data), number=_read_varint(data))
-        parsed_cards.native.append(card)
+    Карты записываются в том порядке, в котором они перечислены в ``parsed``.
+    Секция доп. карт записывается только при их наличии.
+    """
+    data = bytearray(b'\0')
+    _write_varint(data, DECKSTRING_VERSION)
+    _write_varint(data, parsed.format_)
+
+    _write_varint(data, len(parsed.heroes))
+    for hero in parsed.heroes:
+        _write_varint(data, hero)
+
+    native = parsed.cards.native if parsed.cards else []
+    cards_x1 = [card.dbf_id for card in native if card.number == 1]
+    cards_x2 = [card.dbf_id for card in native if card.number == 2]
+    cards_xn = [card for card in native if card.number > 2]
+    for cardlist in (cards_x1, cards_x2):
+        _write_varint(data, len(cardlist))
+        for dbf_id in cardlist:
+            _write_varint(data, dbf_id)
+
+    _write_varint(data, len(cards_xn))
+    for dbf_id, number in cards_xn:
+        _write_varint(data, dbf_id)
+        _write_varint(data, number)
+
+    additional = parsed.cards.additional if parsed.cards else []
+    if additional:
+        _write_varint(data, 1)      # флаг наличия доп. карт
+        for number in (1, 2):
+            cardlist = [card for card in additional if card.number == number]
+            _write_varint(data, len(cardlist))
+            for dbf_id, source_dbf_id, _number in cardlist:
+                _write_varint(data, dbf_id)
+                _write_varint(data, source_dbf_id)
+        cards_xn = [card for card in additional if card.number > 2]
+        _write_varint(data, len(cards_xn))
+        for dbf_id, source_dbf_id, number in cards_xn:
+            _write_varint(data, dbf_id)
+            _write_varint(data, number)
+            _write_varint(data, source_dbf_id)
+
+    return base64.b64encode(data).decode('ascii')
+
+
+def canonicalize(parsed: ParsedDeckstring) -> ParsedDeckstring:
+    """
+    Приводит расшифрованную колоду к каноническому виду:
+    повторы карт объединяются, карты сортируются по ``dbf_id``.
+    Порядок героев сохраняется: класс колоды определяется по первому из них.
 
-    try:
-        # Есть ли доп. скрытые карты?
-        # Если нет - будет брошено DecodeError
-        _read_varint(data)
-
-        # Кол-во доп. карт
-        num_cards_additional = _read_varint(data)
-        for i in range(num_cards_additional):
-            card = ParsedAdditionalCard(dbf_id=_read_varint(data), source_dbf_id=_read_varint(data))
-            parsed_cards.additional.append(card)
-    except DecodeError:
-        # В колоде нет дополнительных карт
-        pass
-
-    parsed.cards = parsed_cards
-
-    return parsed
+    Одинаковые колоды, скопированные из разных клиентов, имеют одинаковый канонический вид.
+    """
+    native: dict[int, int] = {}
+    for dbf_id, number in parsed.cards.native if parsed.cards else []:
+        native[dbf_id] = native.get(dbf_id, 0) + number
+
+    additional: dict[tuple[int, int], int] = {}
+    for dbf_id, source_dbf_id, number in parsed.cards.additional if parsed.cards else []:
+        additional[(dbf_id, source_dbf_id)] = additional.get((dbf_id, source_dbf_id), 0) + number
+
+    return ParsedDeckstring(
+        cards=ParsedCardList(
+            native=[ParsedCard(dbf_id, number) for dbf_id, number in sorted(native.items())],
+            additional=[
+                ParsedAdditionalCard(dbf_id, source_dbf_id, number)
+                for (dbf_id, source_dbf_id), number in sorted(additional.items())
+            ],
+        ),
+        heroes=list(parsed.heroes),
+        format_=parsed.format_,
+    )
+
+
+def get_canonical_deckstring(deckstring) -> str:
+    """ Возвращает канонический код колоды (см. ``canonicalize``) """
+    return write_deckstring(canonicalize(parse_deckstring(deckstring)))
+
+
+def get_deck_digest(parsed: ParsedDeckstring) -> str:
+    """
+    Возвращает отпечаток колоды фиксированной длины (``DECK_DIGEST_LENGTH``):
+    хэш канонического кода, т.е. формата, героев и набора карт с количествами
+    """
+    canonical = write_deckstring(canonicalize(parsed))
+    return hashlib.sha1(canonical.encode('ascii')).hexdigest()
@@ -1,14 +1,14 @@
-from django.db.models import Q, Count
 from django.conf import settings
 from rest_framework import serializers
 
 from pathlib import Path
 import json
 
-from decks.models import Deck, Format, Inclusion, Render
-from cards.models import Card
+from decks.models import Deck, Render
 from core.services.images import DeckRender
-from core.services.deck_codes import parse_deckstring
+from core.services.similarity import rebuild_similar_decks
+from core.services.popularity import rebuild_popularity
+from core.services.deck_codes import parse_deckstring, canonicalize, write_deckstring, get_deck_digest
 
 DATA_FOLDER = Path(__file__).resolve().parent / 'data'
 
@@ -37,33 +37,6 @@ def get_render(deck_id: str, name: str, language: str) -> dict:
     }
 
 
-def find_similar_decks(target_deck: Deck):
-    """ Возвращает колоды того же формата и класса с большим числом совпадений карт (>= 20) """
-
-    if not target_deck:
-        return
-
-    return Deck.nameless.filter(
-        deck_format=target_deck.deck_format,
-        deck_class=target_deck.deck_class,
-    ).exclude(
-        string=target_deck.string
-    ).annotate(
-        num_matches=2 * Count(
-            'cards',
-            filter=Q(inclusions__number=2) & Q(cards__in=target_deck.cards.filter(inclusions__number=2))
-        ) + Count(
-            'cards',
-            filter=Q(inclusions__number=2) & Q(cards__in=target_deck.cards.filter(inclusions__number=1))
-        ) + Count(
-            'cards',
-            filter=Q(inclusions__number=1) & Q(cards__in=target_deck.cards.all())
-        ),
-    ).filter(
-        num_matches__gt=19
-    ).order_by('-num_matches')
-
-
 class DumpDeckListSerializer(serializers.ModelSerializer):
     created = serializers.DateTimeField()
 
@@ -72,28 +45,26 @@ class DumpDeckListSerializer(serializers.ModelSerializer):
         fields = ('id', 'string', 'created', 'name', 'user')
 
     def create(self, validated_data) -> None:
-        string, created = validated_data['string'], validated_data['created']
-        if Deck.objects.filter(string=string, created=created).exists():
+        """
+        Сохраняет колоду из дампа. Колода пропускается, если она уже есть в БД: безымянная - такая же колода,
+        именованная - колода с тем же названием, созданная в то же время (повторный импорт дампа)
+        """
+        parsed_deck = canonicalize(parse_deckstring(validated_data['string']))
+        digest = get_deck_digest(parsed_deck)
+        name, created = validated_data.get('name', ''), validated_data['created']
+        if name:
+            existing = Deck.named.filter(digest=digest, name=name, created=created)
+        else:
+            existing = Deck.nameless.filter(digest=digest)
+        if existing.exists():
             return
-        deck = Deck()
-        deck.string = string
+        deck = Deck(name=name, user=validated_data.get('user'))
+        deck.string = write_deckstring(parsed_deck)
+        deck.digest = digest
         deck.created = created
 
-        parsed_deck = parse_deckstring(deck.string)
-        deck.deck_class = Card.objects.get(dbf_id=parsed_deck.heroes[0]).card_class.all().first()
-        deck.deck_format = Format.objects.get(numerical_designation=parsed_deck.format_)
-        deck.save()
-
-        for dbf_id, number in parsed_deck.cards.native:
-            card = Card.includibles.get(dbf_id=dbf_id)
-            ci = Inclusion(deck=deck, card=card, number=number)
-            ci.save()
-
-        for dbf_id, source_dbf_id, number in parsed_deck.cards.additional:
-            card = Card.includibles.get(dbf_id=dbf_id)
-            source_card = Card.includibles.get(dbf_id=source_dbf_id)
-            ci = Inclusion(deck=deck, card=card, number=number, source_card=source_card, is_native=False)
-            ci.save()
+        deck.deck_class_id = Deck.get_hero_class_id(parsed_deck)
+        deck.save_with_cards(parsed_deck)
 
 
 def import_decks(writer, path: Path, file: str):
@@ -114,5 +85,7 @@ def import_decks(writer, path: Path, file: str):
         serializer = DumpDeckListSerializer(data=data, many=True)
         if serializer.is_valid():
             serializer.save()
+            writer(f'Similar decks: {rebuild_similar_decks()} rows')
+            writer(f'Popularity counters: {rebuild_popularity()} rows')
         else:
             writer(f'Invalid JSON dump\n{serializer.errors}')
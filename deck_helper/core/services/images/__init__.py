@@ -10,10 +10,10 @@ from itertools import groupby
 from qrcode import QRCode, constants
 from django.conf import settings
 from django.core.files import File
-from django.db.models import Q
 
 from decks.models import Deck
 from cards.models import Card
+from core.services.catalog import card_catalog
 from .config import SUPPORTED_LANGUAGES, IMAGE_CLASS_MAP, BASE_FONT
 
 COMPONENTS = Path(__file__).resolve().parent / 'components'
@@ -198,15 +198,18 @@ class DeckRender(Picture):
 
     def __get_additional_cards(self) -> list[AdditionalCardGroup]:
         """ Возвращает дополнительные карты в удобном для отображения виде """
-        if not self.deck.additional_cards.exists():
+        additional_cards = self.deck.analytics.additional_cards
+        if not additional_cards:
             return []
 
-        grouped_cards = groupby(self.deck.additional_cards, key=lambda card: card.source)
+        grouped_cards = [(source_id, list(cardlist))
+                         for source_id, cardlist in groupby(additional_cards, key=lambda card: card.source)]
+        # карты-источники, которые можно включить в колоду, определяются по каталогу и загружаются одним запросом
+        source_ids = card_catalog.get_includible_ids(source_id for source_id, _ in grouped_cards)
+        source_cards = Card.objects.in_bulk(source_ids)
         result = []
         for source_id, cardlist in grouped_cards:
-            try:
-                source_card = Card.includibles.get(dbf_id=source_id)
-            except Card.DoesNotExist:
+            if (source_card := source_cards.get(source_id)) is None:
                 continue
             group = AdditionalCardGroup(
                 source=CardCoord(card=source_card),
@@ -226,10 +229,10 @@ class DeckRender(Picture):
 
     def __pre_format_render(self):
         """ Устанавливает разрешение и координаты плейсхолдеров в зависимости от кол-ва карт """
-        cards = self.deck.native_cards
+        cards = self.deck.analytics.native_cards
 
         # --- расчет разрешения рендера ---------------------------------------------------------------
-        amount = cards.count()
+        amount = len(cards)
         vertical_num = 3 if amount <= 30 else (amount + 9) // 10
         horizontal_num = (amount + vertical_num - 1) // vertical_num    # деление с округлением вверх
         if horizontal_num < 6:
@@ -274,7 +277,7 @@ class DeckRender(Picture):
         image_field = SUPPORTED_LANGUAGES[self.language]['field']
 
         # --- карты по умолчанию ----------------------------------------------------------------------------
-        for card, c in zip(self.deck.native_cards, self.coords):
+        for card, c in zip(self.deck.analytics.native_cards, self.coords):
             with Image.open(getattr(card, image_field), 'r') as card_render:
                 if card.number > 1:
                     cr2 = card_render.rotate(angle=-8, center=(350, 150), resample=Image.BICUBIC, expand=True)
@@ -422,8 +425,7 @@ class DeckRender(Picture):
 
     def __draw_mana_curve(self):
         """ Добавляет на рендер столбчатую диаграмму, отражающую распределение карт колоды по стоимости """
-        cards = self.deck.included_cards
-        cost_distribution = self.__calc_cost_distribution(cards)
+        cost_distribution = self.deck.analytics.mana_curve
         mfc_value = max(cost_distribution)
         col_max_height = self.manacurve.size.y - 50
         col_width = int(self.manacurve.size.x / 100 * 8)
@@ -501,7 +503,7 @@ class DeckRender(Picture):
 
         self.__draw.text(
             (int(x1 + x0 + w + 10) // 2, int(y0 + y1) // 2 - 2),
-            text=str(self.deck.craft_cost.get('basic')),
+            text=str(self.deck.analytics.craft_cost['basic']),
             anchor='mm',
             fill='#ffffff',
             font=font,
@@ -611,7 +613,7 @@ class DeckRender(Picture):
             Point(x=x0 + int(types.size.x * 11 / 20), y=y0 + int(types.size.y / 8)),
         )
         for data, icon_top_left in zip(card_types, icon_coordinates):
-            stat = next((x for x in self.deck.types_statistics if x['data'] == data), {'num_cards': '-'})
+            stat = next((x for x in self.deck.analytics.types_statistics if x['data'] == data), {'num_cards': '-'})
             with Image.open(COMPONENTS / f'{data}.png', 'r') as type_icon:
                 w, h = int(types.size.x / 5), int(types.size.y / 4)
                 type_icon = type_icon.resize((w, h))
@@ -663,7 +665,7 @@ class DeckRender(Picture):
             Point(x=x0 + int(rar_area_size.x / 4), y=y0 + int(rar_area_size.y / 4 - 1)),
         )
         for data, text_coord in zip(rarities.keys(), text_coordinates):
-            stat = next((x for x in self.deck.rarity_statistics if x['data'] == data), {'num_cards': '-'})
+            stat = next((x for x in self.deck.analytics.rarity_statistics if x['data'] == data), {'num_cards': '-'})
             self.__draw.text(
                 text_coord,
                 text=str(stat['num_cards']),
@@ -711,19 +713,3 @@ class DeckRender(Picture):
             image = Image.alpha_composite(shadow, image)
 
         return image
-
-    @staticmethod
-    def __calc_cost_distribution(cards) -> tuple[int, ...]:
-        """
-        Возвращает кортеж с распределением карт по стоимости.
-
-        Индексы - стоимости карт, значения - количества карт данной стоимости
-        """
-        cost_distribution = []
-        for cost in range(11):
-            kwargs_1 = Q(cost=cost, number=1) if cost < 10 else Q(cost__gte=cost, number=1)
-            kwargs_2 = Q(cost=cost, number=2) if cost < 10 else Q(cost__gte=cost, number=2)
-            num_cards = cards.filter(kwargs_1).count() + cards.filter(kwargs_2).count() * 2
-            cost_distribution.append(num_cards)
-
-        return tuple(cost_distribution)
@@ -0,0 +1,122 @@
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.middleware.cache import CacheMiddleware
+from django.utils.cache import patch_cache_control
+
+from core.services.catalog import card_catalog
+
+
+class CacheScope:
+    """ Данные, от которых зависит закэшированная страница """
+    CARDS = 'cards'     # данные о картах: меняются только при обновлении БД
+    DECKS = 'decks'     # список колод и похожие колоды: меняются с появлением новых колод
+
+
+class VersionedPageCache:
+    """
+    Кэширование страниц с ключами, зависящими от версии данных
+
+    Ключ страницы содержит пространство имен: версию ``HearthstoneState`` (из каталога карт, без запроса к БД)
+    и счетчики поколений областей ``CacheScope``, хранящиеся в самом кэше. Увеличение счетчика (``bump``)
+    делает недоступными сразу все страницы области - их не нужно удалять по одной, а старые записи
+    вытесняются по истечении времени жизни. Поэтому страницы можно кэшировать надолго.
+    Долгое время жизни действует только в кэше сервера: браузеры и прокси смену поколения не видят,
+    поэтому им разрешается хранить ответ не дольше ``max_age`` секунд.
+
+    Частые изменения (новые колоды) не сбрасывают кэш сразу: область помечается устаревшей (``mark_stale``),
+    а поколение увеличивается периодической задачей (``bump_stale``) - одно на все изменения за период.
+
+    Для каждого представления считаются попадания и промахи кэша (``get_stats``).
+    """
+    generation_key = 'page_cache:generation:{scope}'
+    stale_key = 'page_cache:stale:{scope}'
+    stats_key = 'page_cache:stats:{view}:{outcome}'
+
+    def __init__(self):
+        self.__views: dict[str, None] = {}     # имена представлений в порядке регистрации
+
+    def get_namespace(self, scopes) -> str:
+        keys = [self.generation_key.format(scope=scope) for scope in scopes]
+        generations = cache.get_many(keys)
+        for key in set(keys) - set(generations):
+            # потерянный счетчик начинается с текущего времени, чтобы не вернуться к прежнему пространству имен
+            cache.add(key, time.time_ns(), None)
+            generations[key] = cache.get(key)
+        state = card_catalog.state
+        version = state[0] if state else ''
+        return ':'.join(map(str, [version, *(generations[key] for key in keys)]))
+
+    def bump(self, *scopes):
+        """ Делает устаревшими все страницы, зависящие от ``scopes`` """
+        for scope in scopes:
+            key = self.generation_key.format(scope=scope)
+            if not cache.add(key, time.time_ns(), None):
+                cache.incr(key)
+
+    def mark_stale(self, *scopes):
+        """ Помечает страницы, зависящие от ``scopes``, устаревшими: они сбрасываются при вызове ``bump_stale`` """
+        cache.set_many({self.stale_key.format(scope=scope): 1 for scope in scopes}, None)
+
+    def bump_stale(self, *scopes) -> list:
+        """ Делает устаревшими страницы областей из ``scopes``, помеченных ``mark_stale``; возвращает эти области """
+        # удаление пометки атомарно: изменение, отмеченное во время сброса, дождется следующего вызова
+        bumped = [scope for scope in scopes if cache.delete(self.stale_key.format(scope=scope))]
+        self.bump(*bumped)
+        return bumped
+
+    def __record(self, view: str, outcome: str):
+        key = self.stats_key.format(view=view, outcome=outcome)
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+    def get_stats(self) -> dict[str, dict[str, int]]:
+        """ Попадания и промахи кэша по представлениям: ``{<представление>: {'hits': ..., 'misses': ...}}`` """
+        keys = {
+            (view, outcome): self.stats_key.format(view=view, outcome=outcome)
+            for view in self.__views for outcome in ('hits', 'misses')
+        }
+        values = cache.get_many(keys.values())
+        stats = {view: {'hits': 0, 'misses': 0} for view in self.__views}
+        for (view, outcome), key in keys.items():
+            stats[view][outcome] = values.get(key, 0)
+        return stats
+
+    def cache_page(self, timeout: int, *, name: str, scopes=(CacheScope.CARDS,), max_age: int = settings.CACHE_TTL):
+        """
+        Аналог ``django.views.decorators.cache.cache_page`` с ключами в пространстве имен версии данных
+
+        :param timeout: время жизни страницы в кэше сервера
+        :param name: имя представления в статистике попаданий
+        :param scopes: области ``CacheScope``, при смене поколения которых страница устаревает
+        :param max_age: сколько секунд ответ могут хранить браузеры и прокси
+        """
+        self.__views[name] = None
+
+        def decorator(view):
+            @wraps(view)
+            def wrapper(request, *args, **kwargs):
+                called = False
+
+                def get_response(request):
+                    nonlocal called
+                    called = True
+                    return view(request, *args, **kwargs)
+
+                middleware = CacheMiddleware(get_response, page_timeout=timeout,
+                                             key_prefix=f'{name}:{self.get_namespace(scopes)}')
+                response = middleware(request)
+                if request.method in ('GET', 'HEAD'):
+                    self.__record(name, 'misses' if called else 'hits')
+                    # CacheMiddleware отдает клиентам время жизни серверного кэша
+                    if response.has_header('Expires'):
+                        del response['Expires']
+                    patch_cache_control(response, max_age=max_age)
+                return response
+            return wrapper
+        return decorator
+
+
+page_cache = VersionedPageCache()
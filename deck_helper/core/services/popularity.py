@@ -0,0 +1,80 @@
+from datetime import date, timedelta
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from decks.models import CardUsage, Deck, DeckUsage, Inclusion
+
+
+def record_deck(deck: Deck, card_ids):
+    """ Учитывает новую безымянную колоду ``deck`` с основными картами ``card_ids`` в дневных счетчиках популярности """
+    day = timezone.localdate(deck.created)
+    deck_key = {'deck_class_id': deck.deck_class_id, 'deck_format_id': deck.deck_format_id, 'day': day}
+    card_ids = sorted(set(card_ids))
+    # недостающие строки создаются с нулем, а счетчики увеличиваются UPDATE'ом,
+    # так что одновременно добавленные колоды не теряют приращений
+    with transaction.atomic():
+        DeckUsage.objects.bulk_create([DeckUsage(**deck_key)], ignore_conflicts=True)
+        DeckUsage.objects.filter(**deck_key).update(num_decks=F('num_decks') + 1)
+        CardUsage.objects.bulk_create([CardUsage(card_id=card_id, day=day) for card_id in card_ids],
+                                      ignore_conflicts=True)
+        CardUsage.objects.filter(day=day, card_id__in=card_ids).update(num_decks=F('num_decks') + 1)
+
+
+def rebuild_popularity() -> int:
+    """ Пересчитывает дневные счетчики популярности по всем безымянным колодам. Возвращает кол-во строк """
+    card_rows = (
+        Inclusion.objects.filter(deck__name='', is_native=True)
+        .values('card_id', day=TruncDate('deck__created'))
+        .annotate(num_decks=Count('deck', distinct=True))
+        .order_by()
+    )
+    deck_rows = (
+        Deck.nameless.values('deck_class_id', 'deck_format_id', day=TruncDate('created'))
+        .annotate(num_decks=Count('id'))
+        .order_by()
+    )
+    with transaction.atomic():
+        CardUsage.objects.all().delete()
+        DeckUsage.objects.all().delete()
+        CardUsage.objects.bulk_create((CardUsage(**row) for row in card_rows.iterator()), batch_size=1000)
+        DeckUsage.objects.bulk_create((DeckUsage(**row) for row in deck_rows.iterator()), batch_size=1000)
+    return CardUsage.objects.count() + DeckUsage.objects.count()
+
+
+def _daily_series(rows, days: int) -> list[dict]:
+    """ Ряд ``[{'day': ..., 'num_decks': ...}, ...]`` за последние ``days`` дней, дни без колод - с нулем """
+    counts = dict(rows)
+    today = timezone.localdate()
+    series_days = (today - timedelta(days=offset) for offset in range(days - 1, -1, -1))
+    return [{'day': day, 'num_decks': counts.get(day, 0)} for day in series_days]
+
+
+def _since(days: int) -> date:
+    return timezone.localdate() - timedelta(days=days - 1)
+
+
+def get_popular_card_ids(days: int = 30, limit: int = 10) -> list[int]:
+    """ dbf_id карт, чаще всего встречавшихся в новых колодах за последние ``days`` дней """
+    usage = CardUsage.objects.filter(day__gte=_since(days)).values('card_id').annotate(total=Sum('num_decks'))
+    return list(usage.order_by('-total', 'card_id').values_list('card_id', flat=True)[:limit])
+
+
+def get_card_trend(card_id: int, days: int = 30) -> list[dict]:
+    """ Кол-во новых колод с картой по дням за последние ``days`` дней """
+    rows = CardUsage.objects.filter(card_id=card_id, day__gte=_since(days)).values_list('day', 'num_decks')
+    return _daily_series(rows, days)
+
+
+def get_deck_trend(days: int = 30, *, deck_class_id: int | None = None,
+                   deck_format_id: int | None = None) -> list[dict]:
+    """ Кол-во новых колод (класса ``deck_class_id``, формата ``deck_format_id``) по дням за последние ``days`` дней """
+    usage = DeckUsage.objects.filter(day__gte=_since(days))
+    if deck_class_id is not None:
+        usage = usage.filter(deck_class_id=deck_class_id)
+    if deck_format_id is not None:
+        usage = usage.filter(deck_format_id=deck_format_id)
+    rows = usage.values('day').annotate(num_decks=Sum('num_decks')).order_by().values_list('day', 'num_decks')
+    return _daily_series(rows, days)
@@ -0,0 +1,213 @@
+import threading
+from array import array
+from collections.abc import Iterator
+from functools import reduce
+from itertools import groupby
+from operator import itemgetter, or_
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Min, Q
+
+from core.exceptions import SimilarDecksRebuilding
+from decks.models import Deck, Inclusion, SimilarDeck
+
+# (формат, класс) колоды: похожие колоды ищутся только среди колод того же формата и класса
+Partition = tuple[int, int]
+# dbf_id карты -> кол-во экземпляров -> id колод
+PostingLists = dict[int, dict[int, array]]
+
+# по скольку соседей новой колоды проверяются за запрос (условия по соседям передаются параметрами запроса)
+NEIGHBOURS_BATCH_SIZE = 400
+
+# флаг полного пересчета похожих колод в кэше (с запасом на время пересчета)
+REBUILD_LOCK_KEY = 'similar_decks:rebuild'
+REBUILD_LOCK_TIMEOUT = 60 * 60 * 2
+
+
+class SimilarDeckEngine:
+    """
+    Поиск похожих безымянных колод по инвертированному индексу
+
+    Для каждой пары (формат, класс) хранятся списки вхождений: карта -> кол-во экземпляров -> id колод.
+    Число совпадений колод - сумма ``min(n1, n2)`` по общим основным картам, где n1, n2 -
+    кол-во экземпляров карты в колодах.
+
+    Индекс загружается из БД при первом обращении и дополняется новыми колодами
+    (по возрастанию id) перед каждым поиском.
+    """
+
+    # новые колоды дочитываются с небольшим перекрытием: транзакции с меньшими id могут завершиться позже
+    REFRESH_OVERLAP = 100
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__partitions: dict[Partition, PostingLists] = {}
+        self.__decks: dict[int, Partition] = {}
+        self.__watermark = 0
+
+    def __refresh(self):
+        """ Добавляет в индекс колоды, созданные после последнего обновления """
+        rows = Inclusion.objects.filter(
+            deck__name='',
+            is_native=True,
+            deck_id__gt=self.__watermark - self.REFRESH_OVERLAP,
+        ).exclude(
+            deck_id__in=[pk for pk in self.__decks if pk > self.__watermark - self.REFRESH_OVERLAP],
+        ).values_list(
+            'deck_id', 'deck__deck_format_id', 'deck__deck_class_id', 'card_id', 'number',
+        ).order_by('deck_id')
+
+        for deck_id, format_id, class_id, card_id, number in rows.iterator():
+            partition = (format_id, class_id)
+            self.__decks[deck_id] = partition
+            postings = self.__partitions.setdefault(partition, {}).setdefault(card_id, {})
+            postings.setdefault(number, array('L')).append(deck_id)
+            self.__watermark = max(self.__watermark, deck_id)
+
+    def invalidate(self):
+        """ Сбрасывает индекс; он будет загружен заново при следующем поиске """
+        with self.__lock:
+            self.__partitions = {}
+            self.__decks = {}
+            self.__watermark = 0
+
+    def get_scores(self, deck: Deck, min_score: int | None = None) -> list[tuple[int, int]]:
+        """
+        Возвращает пары (id колоды, число совпадений карт) для колод того же формата и класса,
+        что и ``deck``, с числом совпадений не меньше ``min_score`` (``settings.SIMILAR_DECKS_MIN_MATCHES``).
+        Пары отсортированы по убыванию числа совпадений, затем - по убыванию id (от новых колод к старым)
+        """
+        target_cards = list(deck.inclusions.filter(is_native=True).values_list('card_id', 'number'))
+        # сама колода и ее безымянный экземпляр (если ``deck`` - именованная копия) не считаются похожими
+        excluded = {deck.pk}
+        if deck.digest:
+            excluded.update(Deck.nameless.filter(digest=deck.digest).values_list('pk', flat=True))
+
+        with self.__lock:
+            self.__refresh()
+            return self.score((deck.deck_format_id, deck.deck_class_id), target_cards, excluded, min_score)
+
+    def score(self, partition: Partition, target_cards, excluded, min_score: int | None = None):
+        """
+        Оценивает колоды раздела ``partition`` по картам ``target_cards`` (пары dbf_id, кол-во)
+
+        Вызывается под блокировкой индекса
+        """
+        if min_score is None:
+            min_score = settings.SIMILAR_DECKS_MIN_MATCHES
+
+        postings = self.__partitions.get(partition, {})
+        scores: dict[int, int] = {}
+        for card_id, target_number in target_cards:
+            for number, deck_ids in postings.get(card_id, {}).items():
+                matches = min(number, target_number)
+                for deck_id in deck_ids:
+                    scores[deck_id] = scores.get(deck_id, 0) + matches
+
+        result = [(deck_id, score) for deck_id, score in scores.items()
+                  if score >= min_score and deck_id not in excluded]
+        result.sort(key=lambda pair: (pair[1], pair[0]), reverse=True)
+        return result
+
+    def iter_all_scores(self) -> Iterator[tuple[int, list[tuple[int, int]]]]:
+        """ Перебирает все безымянные колоды индекса с их похожими колодами (для полного пересчета) """
+        with self.__lock:
+            self.__refresh()
+        rows = Inclusion.objects.filter(deck__name='', is_native=True).order_by('deck_id').values_list(
+            'deck_id', 'card_id', 'number',
+        )
+        for deck_id, deck_rows in groupby(rows.iterator(), key=itemgetter(0)):
+            if (partition := self.__decks.get(deck_id)) is None:
+                continue
+            target_cards = [(card_id, number) for _, card_id, number in deck_rows]
+            with self.__lock:
+                scores = self.score(partition, target_cards, excluded={deck_id})
+            yield deck_id, scores
+
+
+similar_deck_engine = SimilarDeckEngine()
+
+
+def _admit_to_neighbours(deck: Deck, scores: dict[int, int]) -> list[SimilarDeck]:
+    """
+    Возвращает записи (без сохранения), добавляющие колоду ``deck`` в похожие колоды соседей ``scores``
+    (id соседа -> число совпадений), у которых она попадает в число ``settings.SIMILAR_DECKS_LIMIT`` лучших.
+    У соседей с полным списком удаляется худшая похожая колода
+    """
+    lists = SimilarDeck.objects.filter(deck_id__in=scores).values('deck_id').annotate(
+        num=Count('pk'), worst=Min('score'),
+    ).order_by()
+    full = {row['deck_id']: row['worst'] for row in lists if row['num'] >= settings.SIMILAR_DECKS_LIMIT}
+    # при равном числе совпадений список соседа не меняется
+    admitted = [neighbour_id for neighbour_id, score in scores.items()
+                if neighbour_id not in full or score > full[neighbour_id]]
+
+    if evicted := [Q(deck_id=neighbour_id, score=full[neighbour_id]) for neighbour_id in admitted
+                   if neighbour_id in full]:
+        # худшая - с наименьшим числом совпадений, из них - самая старая (см. индекс similar_deck_score_idx)
+        worst_rows = SimilarDeck.objects.filter(reduce(or_, evicted)).order_by('deck_id', 'neighbour_id').values_list(
+            'deck_id', 'pk',
+        )
+        SimilarDeck.objects.filter(
+            pk__in=[next(deck_rows)[1] for _, deck_rows in groupby(worst_rows, key=itemgetter(0))],
+        ).delete()
+
+    return [SimilarDeck(deck_id=neighbour_id, neighbour_id=deck.pk, score=scores[neighbour_id])
+            for neighbour_id in admitted]
+
+
+def update_similar_decks(deck: Deck) -> int:
+    """
+    Записывает лучшие похожие колоды (не больше ``settings.SIMILAR_DECKS_LIMIT``) для новой безымянной
+    колоды ``deck``; сама колода добавляется в похожие колоды тех соседей, у которых она попадает в число лучших.
+    Возвращает кол-во похожих колод
+
+    :raises SimilarDecksRebuilding: идет полный пересчет таблицы похожих колод
+    """
+    if cache.get(REBUILD_LOCK_KEY):
+        raise SimilarDecksRebuilding()
+
+    scores = similar_deck_engine.get_scores(deck)
+    best = scores[:settings.SIMILAR_DECKS_LIMIT]
+    rows = [SimilarDeck(deck_id=deck.pk, neighbour_id=neighbour_id, score=score) for neighbour_id, score in best]
+
+    with transaction.atomic():
+        SimilarDeck.objects.filter(Q(deck=deck) | Q(neighbour=deck)).delete()
+        # похожесть симметрична: колода - кандидат в похожие для каждого из соседей
+        for start in range(0, len(scores), NEIGHBOURS_BATCH_SIZE):
+            rows.extend(_admit_to_neighbours(deck, dict(scores[start:start + NEIGHBOURS_BATCH_SIZE])))
+        SimilarDeck.objects.bulk_create(rows, batch_size=1000)
+    return len(best)
+
+
+def rebuild_similar_decks() -> int:
+    """
+    Полностью пересчитывает таблицу похожих колод
+    (не больше ``settings.SIMILAR_DECKS_LIMIT`` лучших для каждой колоды). Возвращает кол-во записей
+
+    На время пересчета колоды не обновляются по одной (``update_similar_decks``); пересчет,
+    запущенный во время другого пересчета, не выполняется и возвращает 0
+    """
+    if not cache.add(REBUILD_LOCK_KEY, True, REBUILD_LOCK_TIMEOUT):
+        return 0
+    try:
+        similar_deck_engine.invalidate()
+        num_rows = 0
+        with transaction.atomic():
+            SimilarDeck.objects.all().delete()
+            rows = []
+            for deck_id, scores in similar_deck_engine.iter_all_scores():
+                rows.extend(SimilarDeck(deck_id=deck_id, neighbour_id=neighbour_id, score=score)
+                            for neighbour_id, score in scores[:settings.SIMILAR_DECKS_LIMIT])
+                if len(rows) >= 1000:
+                    # записи колоды, обновленной по одной до начала пересчета, уже могут быть в таблице
+                    SimilarDeck.objects.bulk_create(rows, ignore_conflicts=True)
+                    num_rows += len(rows)
+                    rows = []
+            SimilarDeck.objects.bulk_create(rows, ignore_conflicts=True)
+            num_rows += len(rows)
+    finally:
+        cache.delete(REBUILD_LOCK_KEY)
+    return num_rows
@@ -1,16 +1,24 @@
 from collections import namedtuple
 
+from django.conf import settings
+from django.core.cache import cache
 from django.db.models import Count, Q
+from django.utils import timezone, translation
 from django.utils.translation import gettext_lazy as _
 from django.urls import reverse_lazy
 
 from cards.models import Card, Mechanic
+from core.services.catalog import card_catalog
+from core.services.deck_bitmaps import InFormat, deck_bitmap_index
 from decks.models import Deck, Format
 
 StatSection = namedtuple('StatSection', ['header', 'cells'])
 StatCell = namedtuple('StatCell', ['header', 'items_'])
 StatItem = namedtuple('StatItem', ['label', 'value', 'link', 'css'])
 
+STATISTICS_SNAPSHOT_KEY = 'statistics:snapshot'
+STATISTICS_PENDING_KEY = 'statistics:pending'
+
 
 def _get_card_num_stat() -> StatCell:
     num_cards_all = Card.objects.count()
@@ -92,14 +100,20 @@ def _get_most_popular_mechanics_stat(top: int) -> StatCell:
 
 
 def _get_most_popular_cards_stat(top: int) -> StatCell:
-    """ Самые популярные карты в колодах БД сайта """
-    cards = Card.includibles.annotate(num_decks=Count('deck', filter=Q(deck__name='', deck__user=None)))
-    most_popular = cards.order_by('-num_decks')[:top]
+    """ Самые популярные карты в колодах БД сайта (по битовому индексу колод) """
+    card_counts = deck_bitmap_index.card_counts()
+    popular_ids = sorted(
+        (dbf_id for dbf_id in card_counts if (record := card_catalog.get(dbf_id)) and record.includible),
+        key=lambda dbf_id: (card_counts[dbf_id], dbf_id),
+        reverse=True,
+    )[:top]
+    cards = Card.objects.in_bulk(popular_ids)
     items = []
-    for card in most_popular:
+    for dbf_id in popular_ids:
+        card = cards[dbf_id]
         item = StatItem(
             label=card.name,
-            value=card.num_decks,
+            value=card_counts[dbf_id],
             link=card.get_absolute_url(),
             css=''
         )
@@ -134,13 +148,12 @@ def _get_deck_num_stat() -> StatCell:
 
 
 def _get_deck_format_stat() -> StatCell:
-    decks = Deck.nameless.all()
     standard = Format.objects.get(numerical_designation=2)
     wild = Format.objects.get(numerical_designation=1)
     classic = Format.objects.get(numerical_designation=3)
-    num_standard = decks.filter(deck_format=standard).count()
-    num_wild = decks.filter(deck_format=wild).count()
-    num_classic = decks.filter(deck_format=classic).count()
+    num_standard = deck_bitmap_index.count(InFormat(standard.pk))
+    num_wild = deck_bitmap_index.count(InFormat(wild.pk))
+    num_classic = deck_bitmap_index.count(InFormat(classic.pk))
     return StatCell(
         header=_('Formats'),
         items_=(
@@ -194,3 +207,34 @@ def get_statistics_context() -> dict:
         'decks': _get_decks_statistics(),
     }
     return context
+
+
+def build_statistics_snapshot() -> dict:
+    """
+    Рассчитывает статистику для всех языков сайта и сохраняет ее в кэше (без срока хранения)
+
+    Снимок обновляется периодической задачей и после обновления БД (см. ``core.tasks.update_statistics``):
+    ``{'generated_at': <время расчета>, 'languages': {<язык>: <контекст статистики>, ...}}``
+    """
+    snapshot = {'generated_at': timezone.now(), 'languages': {}}
+    for language in dict(settings.LANGUAGES):
+        # названия карт и механик, ссылки с префиксом языка - на языке снимка
+        with translation.override(language):
+            snapshot['languages'][language] = get_statistics_context()
+    cache.set(STATISTICS_SNAPSHOT_KEY, snapshot, None)
+    return snapshot
+
+
+def get_statistics_snapshot(language: str) -> dict | None:
+    """
+    Статистика на языке ``language`` из снимка (с ключом ``generated_at``). Если снимка нет, возвращает ``None``
+    и ставит в очередь его расчет (не чаще раза в ``settings.CACHE_TTL`` секунд)
+    """
+    if (snapshot := cache.get(STATISTICS_SNAPSHOT_KEY)) is None:
+        if cache.add(STATISTICS_PENDING_KEY, True, settings.CACHE_TTL):
+            from core.tasks import update_statistics  # импорт здесь во избежание перекрестного импорта
+            update_statistics.delay()
+        return None
+    languages = snapshot['languages']
+    context = languages.get((language or '')[:2]) or next(iter(languages.values()))     # 'en-us' -> 'en'
+    return context | {'generated_at': snapshot['generated_at']}
@@ -6,13 +6,16 @@ from tqdm import tqdm
 from django.utils.text import slugify
 from django.conf import settings
 
-from core.services.deck_utils import parse_deckstring
+from core.services.deck_codes import parse_deckstrings
+from core.services.catalog import card_catalog
+from core.services.deck_bitmaps import deck_bitmap_index
+from core.services.page_cache import CacheScope, page_cache
 from core.services.api_workers import HsRapidApiWorker
 from core.services.images import CardRender, Thumbnail
 from core.exceptions import UpdateError
 from core.models import HearthstoneState
 from cards.models import Card, CardClass, Tribe, CardSet, Mechanic
-from decks.models import Deck, Format, Inclusion
+from decks.models import Deck, DeckSummary, Format, Inclusion
 
 C_TYPES = {
     'minion': Card.CardTypes.MINION,
@@ -48,6 +51,7 @@ class Updater:
     def __init__(self, writer, progress_bars: bool = True, rewrite: bool = False, reload_images: bool = False):
         self.__bar = progress_bars
         self.__rewrite = rewrite
+        self.__changed_cards: set[int] = set()     # dbf_id карт, у которых изменились данные для сводок колод
         self.__reload_images = reload_images
         self.__writer = writer
         self.__en_cards = []
@@ -304,6 +308,8 @@ class Updater:
                 # - карта коллекционная, но не имеет сохраненного рендера или миниатюры
                 continue
             r_card, card_created = Card.objects.get_or_create(dbf_id=int(j_card['dbfId']))
+            # данные карты, по которым считаются сводки колод (см. DeckSummary)
+            summary_data = (r_card.cost, r_card.rarity, r_card.card_type)
             r_card.card_id = j_card['cardId']
             r_card.name = j_card['name']
             r_card.service_name = r_card.name
@@ -318,6 +324,8 @@ class Updater:
             r_card.rarity = self.__align_rarity(j_card.get('rarity', ''))
             r_card.spell_school = self.__align_spellschool(j_card.get('spellSchool', ''))
             r_card.slug = f'{slugify(r_card.name)}-{str(r_card.dbf_id)}'
+            if not card_created and (r_card.cost, r_card.rarity, r_card.card_type) != summary_data:
+                self.__changed_cards.add(r_card.dbf_id)
 
             if card_created:
                 r_card.artist = j_card.get('artist', '')
@@ -425,42 +433,46 @@ class Updater:
     def __rebuild_decks(self):
         """ Пересборка существующих колод после обновления данных о картах """
         if not self.__rewrite:
+            # колоды не пересобираются, но сводки колод с измененными картами пересчитываются
+            if self.__changed_cards:
+                # колоды выбираются подзапросом, без загрузки их id
+                affected_decks = Deck.objects.filter(
+                    pk__in=Inclusion.objects.filter(card_id__in=self.__changed_cards).values('deck_id'),
+                )
+                DeckSummary.objects.rebuild(affected_decks)
             return
 
-        for deck in tqdm(Deck.objects.all(), desc='Rebuilding decks', ncols=100):
-            parsed_deck = parse_deckstring(deck.string)
-            deck.deck_class = Card.objects.get(dbf_id=parsed_deck.heroes[0]).card_class.all().first()
-            deck.deck_format = Format.objects.get(numerical_designation=parsed_deck.format_)
-            deck.save()
-
-            for dbf_id, number in parsed_deck.cards.native:
-                card = Card.includibles.get(dbf_id=dbf_id)
-                ci = Inclusion(deck=deck, card=card, number=number)
-                ci.save()
-
-            for dbf_id, source_dbf_id, number in parsed_deck.cards.additional:
-                card = Card.includibles.get(dbf_id=dbf_id)
-                source_card = Card.includibles.get(dbf_id=source_dbf_id)
-                ci = Inclusion(deck=deck, card=card, number=number, source_card=source_card, is_native=False)
-                ci.save()
+        card_catalog.invalidate()     # колоды пересобираются по новым данным о картах
+        decks = Deck.objects.all()
+        for deck, parsed_deck in tqdm(zip(decks, parse_deckstrings(deck.string for deck in decks)),
+                                      total=len(decks), desc='Rebuilding decks', ncols=100):
+            deck.deck_class_id = Deck.get_hero_class_id(parsed_deck)
+            deck.save_with_cards(parsed_deck)
 
     def update(self):
         """ Выполняет обновление БД """
 
         self.__prepare_update()
 
-        with transaction.atomic():
-            if self.__rewrite:
-                self.__clear_database()
-            self.__write_classes()
-            self.__write_tribes()
-            self.__write_formats()
-            self.__write_sets()
-            self.__write_mechanics()
-            self.__write_cards()
-            self.__update_classes()
-            self.__rebuild_decks()
-            self.__update_version()
+        try:
+            with transaction.atomic():
+                if self.__rewrite:
+                    self.__clear_database()
+                self.__write_classes()
+                self.__write_tribes()
+                self.__write_formats()
+                self.__write_sets()
+                self.__write_mechanics()
+                self.__write_cards()
+                self.__update_classes()
+                self.__rebuild_decks()
+                self.__update_version()
+        finally:
+            # каталог карт мог быть загружен внутри транзакции; другие процессы обнаружат
+            # обновление по изменившемуся HearthstoneState
+            card_catalog.invalidate()
+            deck_bitmap_index.invalidate()
+            page_cache.bump(CacheScope.CARDS, CacheScope.DECKS)
 
 
 def _clear_unreadable(text: str) -> str:
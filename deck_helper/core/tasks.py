@@ -1,4 +1,5 @@
 from deck_helper.celery import app
+from celery import chain
 from celery.utils.log import get_task_logger
 from django.conf import settings
 from django.core.management import call_command
@@ -8,6 +9,11 @@ from datetime import datetime, timedelta
 from decks.models import Deck, Render
 from core.services.images import DeckRender
 from core.services.api_workers import HsRapidApiWorker
+from core.exceptions import SimilarDecksRebuilding
+from core.services import similarity
+from core.services.statistics import build_statistics_snapshot
+from core.services.cache_warmup import get_warmup_deck_ids, get_warmup_urls, warm_up_deck, warm_up_url
+from core.services.page_cache import CacheScope, page_cache
 
 logger = get_task_logger(__name__)
 
@@ -73,4 +79,82 @@ def run_update_db():
         return False
 
     call_command('update_db', '--disableprogressbars')
+    # кэши после обновления устарели: прогреваются, когда пересчитаны похожие колоды
+    chain(rebuild_similar_decks.si(), warm_up_caches.si()).delay()
     return True
+
+
+@app.task(bind=True, max_retries=None, default_retry_delay=60)
+def update_similar_decks(self, deck_id: int) -> int:
+    """ Рассчитывает похожие колоды для новой колоды; во время полного пересчета - откладывается """
+    try:
+        deck = Deck.nameless.get(pk=deck_id)
+    except Deck.DoesNotExist:
+        return 0
+    try:
+        num_rows = similarity.update_similar_decks(deck)
+    except SimilarDecksRebuilding as e:
+        raise self.retry(exc=e)
+    return num_rows
+
+
+@app.task
+def rebuild_similar_decks() -> int:
+    """ Полностью пересчитывает таблицу похожих колод """
+    num_rows = similarity.rebuild_similar_decks()
+    page_cache.bump(CacheScope.DECKS)
+    logger.info(f'Similar decks rebuilt: {num_rows} rows')
+    return num_rows
+
+
+@app.task(ignore_result=True)
+def bump_stale_pages():
+    """ Сбрасывает кэш страниц со списками колод, если с прошлого запуска появились новые колоды """
+    page_cache.bump_stale(CacheScope.DECKS)
+
+
+@app.task
+def update_statistics():
+    """ Пересчитывает снимок статистики сайта (см. core.services.statistics) """
+    snapshot = build_statistics_snapshot()
+    logger.info(f'Statistics snapshot updated at {snapshot["generated_at"]:%d.%m.%Y %H:%M}')
+
+
+@app.task
+def warm_up_caches() -> int:
+    """
+    Прогрев кэшей после обновления БД: пересчитывает снимок статистики, ставит в очередь прогрев фрагментов
+    страниц колод с первых страниц списка колод и, если задан ``settings.CACHE_WARMUP_HOST``, - запросы
+    самых посещаемых страниц, кэшируемых целиком. Возвращает кол-во поставленных в очередь задач
+    """
+    build_statistics_snapshot()
+    deck_ids = get_warmup_deck_ids()
+    for deck_id in deck_ids:
+        warm_up_deck_page.delay(deck_id)
+
+    urls = []
+    if settings.CACHE_WARMUP_HOST:
+        urls = get_warmup_urls()
+        for url in urls:
+            warm_up_page.delay(url)
+    else:
+        logger.warning('Cache warm-up: CACHE_WARMUP_HOST is not set, whole pages are not warmed up')
+    logger.info(f'Cache warm-up: {len(deck_ids)} decks, {len(urls)} pages queued')
+    return len(deck_ids) + len(urls)
+
+
+# ограничение частоты не дает прогреву занять воркеры: между запросами страниц выполняются другие задачи
+@app.task(rate_limit=settings.CACHE_WARMUP_RATE_LIMIT, ignore_result=True)
+def warm_up_page(url: str):
+    """ Запрашивает страницу, чтобы она попала в кэш """
+    if (status_code := warm_up_url(url)) != 200:
+        logger.warning(f'Cache warm-up: {url} returned {status_code}')
+
+
+@app.task(rate_limit=settings.CACHE_WARMUP_RATE_LIMIT, ignore_result=True)
+def warm_up_deck_page(deck_id: int):
+    """ Прогревает фрагменты страницы колоды """
+    try:
+        warm_up_deck(deck_id)
+    except Deck.DoesNotExist:
+        pass    # колода удалена после постановки задачи в очередь
@@ -4,6 +4,7 @@ from django.utils.translation import to_locale, get_language, gettext_lazy as _
 from collections import namedtuple
 
 from cards.models import Card
+from core.services.catalog import card_catalog
 
 register = template.Library()
 Parameter = namedtuple('Parameter', ['name', 'icon', 'value'])
@@ -19,14 +20,18 @@ def get_item(dictionary, key):
 def get_cardclass_css(card):
     """ Возвращает классы CSS соответствующего Hearthstone-класса """
 
-    match card.card_class.count():
+    if record := card_catalog.get(card.pk):
+        slugs = record.class_slugs
+    else:
+        slugs = [''.join(cls.service_name.lower().split()) for cls in card.card_class.all()]
+
+    match len(slugs):
         case 0:
             return 'neutral'
         case 1:
-            return ''.join(card.card_class.all()[0].service_name.lower().split())
+            return slugs[0]
         case _:
-            lst = [''.join(cls.service_name.lower().split()) for cls in card.card_class.all()]
-            return f'multiclass {"-".join(lst)}'
+            return f'multiclass {"-".join(slugs)}'
 
 
 @register.filter(name='dclass')
@@ -1,10 +1,10 @@
 from django.shortcuts import render, redirect
 from django.http import HttpRequest, JsonResponse
 from django.urls import reverse_lazy
-from django.utils.translation import gettext_lazy as _
+from django.utils.translation import gettext_lazy as _, get_language
 from django.conf import settings
 
-from .services.statistics import get_statistics_context
+from .services.statistics import get_statistics_snapshot
 
 
 def contact(request: HttpRequest):
@@ -18,7 +18,7 @@ def contact(request: HttpRequest):
 def statistics(request: HttpRequest):
     context = {
         'title': _('Statistics'),
-        'statistics': get_statistics_context(),
+        'statistics': get_statistics_snapshot(get_language()),
     }
     return render(request=request, template_name='core/statistics.html', context=context)
 
@@ -14,5 +14,13 @@ app.conf.beat_schedule = {
     'check_for_hs_api_updates': {
         'task': 'core.tasks.check_for_hs_api_updates',
         'schedule': crontab(minute=0, hour=0),      # ежедневно в полночь
-    }
+    },
+    'update_statistics': {
+        'task': 'core.tasks.update_statistics',
+        'schedule': crontab(minute='*/15'),         # каждые 15 минут
+    },
+    'bump_stale_pages': {
+        'task': 'core.tasks.bump_stale_pages',
+        'schedule': crontab(),                      # ежеминутно
+    },
 }
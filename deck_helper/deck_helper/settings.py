@@ -23,6 +23,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'core',
     'cards',
     'decks',
@@ -132,6 +133,11 @@ REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': (
         'django_filters.rest_framework.DjangoFilterBackend',
     ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        'api.services.renderers.ColumnarJSONRenderer',
+    ),
 }
 
 LOGIN_REDIRECT_URL = '/'
@@ -254,3 +260,30 @@ CACHES = {
 
 # Время жизни кэша (в секундах)
 CACHE_TTL = 60
+# Время жизни кэша страниц, которые устаревают только с обновлением данных (см. core.services.page_cache)
+CACHE_TTL_LONG = 60 * 60 * 24 * 7
+
+# Сколько (в секундах) браузеры и прокси могут использовать ответ с данными о картах без повторной проверки
+# (после - условный запрос с ETag, см. core.mixins.ConditionalGetMixin)
+HTTP_CACHE_MAX_AGE = 60 * 60
+
+# Как часто (в секундах) каталог карт проверяет, не обновилась ли БД (см. core.services.catalog)
+CARD_CATALOG_CHECK_INTERVAL = 30
+
+# Минимальное число совпадающих карт у похожих колод
+SIMILAR_DECKS_MIN_MATCHES = 20
+# Сколько лучших похожих колод хранится для каждой колоды (см. core.services.similarity)
+SIMILAR_DECKS_LIMIT = 45
+
+# Сколько id колод, отобранных по битовому индексу (см. core.services.deck_bitmaps), передается в запрос к БД;
+# если колод больше, фильтр колод по картам выполняется подзапросом
+DECK_BITMAP_MAX_IDS = 500
+
+# Прогрев кэша после обновления БД (см. core.services.cache_warmup)
+# хост и схема, по которым посетители открывают сайт: ключи кэша страниц зависят от них,
+# поэтому без явно заданного хоста страницы целиком не прогреваются (только данные и фрагменты)
+CACHE_WARMUP_HOST = os.environ.get('CACHE_WARMUP_HOST', default='')
+CACHE_WARMUP_SECURE = int(os.environ.get('CACHE_WARMUP_SECURE', default=1))
+CACHE_WARMUP_POPULAR_CARDS = 50     # сколько самых популярных за месяц карт
+CACHE_WARMUP_DECK_PAGES = 2         # сколько первых страниц списка колод для каждой пары класс/формат
+CACHE_WARMUP_RATE_LIMIT = '5/s'     # не больше стольких страниц в секунду на воркер
@@ -14,3 +14,12 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'deck_helper.settings')
 
 application = get_wsgi_application()
+
+# индекс подсказок по названиям карт строится при старте воркера, а не при первом запросе
+from core.services.autocomplete import card_name_index  # noqa: E402
+from django.db import DatabaseError  # noqa: E402
+
+try:
+    card_name_index.warm_up()
+except DatabaseError:
+    pass    # БД еще не готова (например, до миграций): индекс будет построен при первом запросе
@@ -2,7 +2,7 @@ from django import forms
 from django.utils.translation import gettext_lazy as _
 
 from cards.models import CardClass
-from .models import Format
+from .models import DeckQuerySet, Format
 
 
 class DeckstringForm(forms.Form):
@@ -34,5 +34,10 @@ class DeckFilterForm(forms.Form):
     FORMATS = Format.objects.exclude(numerical_designation=0)
     deck_format = forms.ModelChoiceField(queryset=FORMATS, required=False, label=_('Format'))
 
+    cards = forms.CharField(max_length=255, required=False, label=_('Cards'))
+    cards_match = forms.ChoiceField(choices=DeckQuerySet.CardsMatch.choices, required=False, label=_('Cards match'))
+
     deck_class.widget.attrs.update({'class': 'form-input'})
     deck_format.widget.attrs.update({'class': 'form-input'})
+    cards.widget.attrs.update({'class': 'form-input', 'placeholder': _('Comma-separated card IDs (dbf_id)')})
+    cards_match.widget.attrs.update({'class': 'form-input'})
@@ -0,0 +1,36 @@
+from django.db import migrations
+
+from core.exceptions import DecodeError
+from core.services.deck_codes import get_canonical_deckstring
+
+BATCH_SIZE = 500
+
+
+def canonicalize_deckstrings(apps, schema_editor):
+    """ Переводит коды сохраненных колод в канонический вид пакетами по ``BATCH_SIZE`` """
+    Deck = apps.get_model('decks', 'Deck')
+    decks = Deck._base_manager.only('pk', 'string').order_by('pk')
+    last_pk = 0
+    while batch := list(decks.filter(pk__gt=last_pk)[:BATCH_SIZE]):
+        changed = []
+        for deck in batch:
+            try:
+                canonical = get_canonical_deckstring(deck.string)
+            except DecodeError:
+                continue
+            if canonical != deck.string:
+                deck.string = canonical
+                changed.append(deck)
+        Deck._base_manager.bulk_update(changed, ['string'])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('decks', '0002_inclusion_is_native_inclusion_source_card'),
+    ]
+
+    operations = [
+        migrations.RunPython(canonicalize_deckstrings, migrations.RunPython.noop),
+    ]
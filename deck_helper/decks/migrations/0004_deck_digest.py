@@ -0,0 +1,18 @@
+# Generated by Django 4.0.4 on 2026-10-18 06:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('decks', '0003_canonical_deckstrings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deck',
+            name='digest',
+            field=models.CharField(blank=True, default='', editable=False, help_text='Hash of the format, heroes and cards of the deck.', max_length=40, verbose_name='Digest'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+from django.db import migrations
+from django.db.models import Count, Min
+
+from core.exceptions import DecodeError
+from core.services.deck_codes import parse_deckstring, get_deck_digest
+
+BATCH_SIZE = 500
+
+
+def backfill_digests(apps, schema_editor):
+    """ Заполняет отпечатки колод пакетами по ``BATCH_SIZE`` """
+    Deck = apps.get_model('decks', 'Deck')
+    decks = Deck._base_manager.only('pk', 'string').order_by('pk')
+    last_pk = 0
+    while batch := list(decks.filter(pk__gt=last_pk)[:BATCH_SIZE]):
+        for deck in batch:
+            try:
+                deck.digest = get_deck_digest(parse_deckstring(deck.string))
+            except DecodeError:
+                deck.digest = ''
+        Deck._base_manager.bulk_update(batch, ['digest'])
+        last_pk = batch[-1].pk
+
+
+def release_nameless_duplicates(apps, schema_editor):
+    """
+    Отпечаток одинаковых безымянных колод остается только у самой ранней (необходимо для уникального индекса)
+
+    Остальные колоды не удаляются (на них могут ссылаться рендеры и ссылки на страницы колод),
+    а лишь теряют отпечаток: новые такие же колоды будут сопоставляться с самой ранней
+    """
+    Deck = apps.get_model('decks', 'Deck')
+    nameless = Deck._base_manager.filter(name='').exclude(digest='')
+    duplicates = nameless.values('digest').annotate(num=Count('pk'), first_pk=Min('pk')).filter(num__gt=1)
+    for duplicate in duplicates:
+        nameless.filter(digest=duplicate['digest']).exclude(pk=duplicate['first_pk']).update(digest='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('decks', '0004_deck_digest'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_digests, migrations.RunPython.noop),
+        migrations.RunPython(release_nameless_duplicates, migrations.RunPython.noop),
+    ]
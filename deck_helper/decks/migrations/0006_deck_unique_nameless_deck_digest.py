@@ -0,0 +1,17 @@
+# Generated by Django 4.0.4 on 2026-10-18 06:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('decks', '0005_backfill_deck_digest'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='deck',
+            constraint=models.UniqueConstraint(condition=models.Q(('name', ''), models.Q(('digest', ''), _negated=True)), fields=('digest',), name='unique_nameless_deck_digest'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.0.4 on 2026-10-18 07:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('decks', '0006_deck_unique_nameless_deck_digest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeckSummary',
+            fields=[
+                ('deck', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='decks.deck', verbose_name='Deck')),
+                ('craft_cost', models.PositiveIntegerField(default=0, verbose_name='Craft cost')),
+                ('craft_cost_gold', models.PositiveIntegerField(default=0, verbose_name='Craft cost (golden)')),
+                ('mana_curve', models.JSONField(default=list, help_text='Number of cards per mana cost (0-9 and 10+).', verbose_name='Mana curve')),
+                ('card_count', models.PositiveSmallIntegerField(default=0, verbose_name='Number of cards')),
+                ('type_counts', models.JSONField(default=dict, verbose_name='Number of cards by type')),
+                ('rarity_counts', models.JSONField(default=dict, verbose_name='Number of cards by rarity')),
+                ('is_highlander', models.BooleanField(db_index=True, default=False, help_text='All cards of the deck are included in a single copy.', verbose_name='Highlander')),
+            ],
+            options={
+                'verbose_name': 'Deck summary',
+                'verbose_name_plural': 'Deck summaries',
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+from itertools import groupby
+from operator import itemgetter
+
+from django.db import migrations
+
+from core.services.deck_analytics import summarize_cards
+
+BATCH_SIZE = 500
+
+
+def backfill_summaries(apps, schema_editor):
+    """ Рассчитывает сводки существующих колод пакетами по ``BATCH_SIZE`` колод """
+    Deck = apps.get_model('decks', 'Deck')
+    DeckSummary = apps.get_model('decks', 'DeckSummary')
+    Inclusion = apps.get_model('decks', 'Inclusion')
+
+    deck_ids = Deck._base_manager.order_by('pk').values_list('pk', flat=True)
+    last_pk = 0
+    while batch := list(deck_ids.filter(pk__gt=last_pk)[:BATCH_SIZE]):
+        rows = Inclusion._base_manager.filter(deck_id__in=batch).order_by('deck_id').values_list(
+            'deck_id', 'card__cost', 'card__rarity', 'card__card_type', 'number', 'is_native',
+        )
+        DeckSummary._base_manager.bulk_create([
+            DeckSummary(deck_id=deck_id, **summarize_cards(row[1:] for row in deck_rows))
+            for deck_id, deck_rows in groupby(rows, key=itemgetter(0))
+        ])
+        last_pk = batch[-1]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('decks', '0007_deck_summary'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
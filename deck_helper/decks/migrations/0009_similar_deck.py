@@ -0,0 +1,35 @@
+# Generated by Django 4.0.4 on 2026-10-18 07:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('decks', '0008_backfill_deck_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarDeck',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.PositiveSmallIntegerField(verbose_name='Number of matching cards')),
+                ('deck', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_decks', to='decks.deck', verbose_name='Deck')),
+                ('neighbour', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='decks.deck', verbose_name='Similar deck')),
+            ],
+            options={
+                'verbose_name': 'Similar deck',
+                'verbose_name_plural': 'Similar decks',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='similardeck',
+            index=models.Index(fields=['deck', '-score', '-neighbour'], name='similar_deck_score_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='similardeck',
+            constraint=models.UniqueConstraint(fields=('deck', 'neighbour'), name='unique_similar_deck'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.0.4 on 2026-10-18 07:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('decks', '0009_similar_deck'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='inclusion',
+            index=models.Index(fields=['card', 'number', 'deck'], name='inclusion_card_number_deck_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.0.4 on 2026-10-18 07:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('decks', '0010_inclusion_card_number_deck_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='deck',
+            index=models.Index(fields=['-created', '-id'], name='deck_created_id_idx'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.0.4 on 2026-10-18 07:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0005_card_cost_dbf_id_idx'),
+        ('decks', '0011_deck_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeckUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='Day')),
+                ('num_decks', models.PositiveIntegerField(default=0, verbose_name='Number of decks')),
+                ('deck_class', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='cards.cardclass', verbose_name='Class')),
+                ('deck_format', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='decks.format', verbose_name='Format')),
+            ],
+            options={
+                'verbose_name': 'Deck usage',
+                'verbose_name_plural': 'Deck usage',
+            },
+        ),
+        migrations.CreateModel(
+            name='CardUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='Day')),
+                ('num_decks', models.PositiveIntegerField(default=0, verbose_name='Number of decks')),
+                ('card', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='cards.card', verbose_name='Card')),
+            ],
+            options={
+                'verbose_name': 'Card usage',
+                'verbose_name_plural': 'Card usage',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='deckusage',
+            constraint=models.UniqueConstraint(fields=('deck_class', 'deck_format', 'day'), name='unique_deck_usage'),
+        ),
+        migrations.AddIndex(
+            model_name='cardusage',
+            index=models.Index(fields=['card', 'day', 'num_decks'], name='card_usage_day_num_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='cardusage',
+            constraint=models.UniqueConstraint(fields=('card', 'day'), name='unique_card_usage'),
+        ),
+    ]
@@ -1,12 +1,27 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.utils.translation import gettext_lazy as _
 from django.utils.timezone import now
+from django.utils.functional import cached_property
 from django.urls.base import reverse_lazy
 from django.contrib.auth.models import User
 
+from functools import partial
+from itertools import groupby
+from operator import itemgetter
+
 from cards.models import Card, CardClass
 from core.exceptions import UnsupportedCards
-from core.services.deck_codes import parse_deckstring
+from core.services.catalog import card_catalog
+from core.services.deck_analytics import DeckAnalytics, summarize_cards
+from core.services.page_cache import CacheScope, page_cache
+from core.services.deck_codes import (
+    ParsedDeckstring,
+    parse_deckstring,
+    canonicalize,
+    write_deckstring,
+    get_deck_digest,
+    DECK_DIGEST_LENGTH,
+)
 
 
 class IncluSionManager(models.QuerySet):
@@ -18,13 +33,50 @@ class IncluSionManager(models.QuerySet):
         return self.exclude(deck__name='')
 
 
-class NamelessDeckManager(models.Manager):
+class DeckQuerySet(models.QuerySet):
+
+    class CardsMatch(models.TextChoices):
+        ALL = 'all', _('All of the cards')
+        ANY = 'any', _('Any of the cards')
+
+    def containing(self, dbf_ids, *, match: str = CardsMatch.ALL, min_copies: int = 1):
+        """
+        Колоды, содержащие все (``match='all'``) или хотя бы одну (``match='any'``) из карт ``dbf_ids``,
+        каждую - не менее чем в ``min_copies`` экземплярах
+
+        Вместо отдельного соединения с вхождениями на каждую карту выполняется один подзапрос
+        с группировкой вхождений по колодам (использует индекс ``inclusion_card_number_deck_idx``).
+        """
+        dbf_ids = set(dbf_ids)
+        if not dbf_ids:
+            return self
+
+        inclusions = Inclusion.objects.filter(card_id__in=dbf_ids, number__gte=min_copies)
+        if match == self.CardsMatch.ALL:
+            inclusions = inclusions.values('deck_id').annotate(
+                num_cards=models.Count('card_id', distinct=True),
+            ).filter(num_cards=len(dbf_ids))
+        return self.filter(pk__in=inclusions.values('deck_id'))
+
+    def with_analytics(self):
+        """
+        Загружает вхождения карт колод (с картами, их наборами, классами и механиками) для ``Deck.analytics``
+        постоянным числом запросов, независимо от кол-ва колод
+        """
+        inclusions = DeckAnalytics.inclusions_queryset(Inclusion.objects.all())
+        return self.prefetch_related(models.Prefetch('inclusions', queryset=inclusions, to_attr='analytics_inclusions'))
+
+
+DeckManager = models.Manager.from_queryset(DeckQuerySet)
+
+
+class NamelessDeckManager(DeckManager):
 
     def get_queryset(self):
         return super().get_queryset().filter(name='').prefetch_related('deck_class', 'deck_format')
 
 
-class NamedDeckManager(models.Manager):
+class NamedDeckManager(DeckManager):
 
     def get_queryset(self):
         return super().get_queryset().exclude(name='').prefetch_related('deck_class', 'deck_format')
@@ -55,6 +107,9 @@ class Deck(models.Model):
                              verbose_name=_('User'))
     string = models.TextField(max_length=1500, verbose_name=_('Deck code'),
                               help_text=_('The string used to identify the cards that make up the deck.'))
+    digest = models.CharField(max_length=DECK_DIGEST_LENGTH, default='', blank=True, editable=False,
+                              verbose_name=_('Digest'),
+                              help_text=_('Hash of the format, heroes and cards of the deck.'))
     cards = models.ManyToManyField(
         Card,
         through='Inclusion',
@@ -70,58 +125,121 @@ class Deck(models.Model):
     created = models.DateTimeField(default=now, verbose_name=_('Time of creation'))
 
     nameless = NamelessDeckManager()
-    objects = models.Manager()
+    objects = DeckManager()
     named = NamedDeckManager()
 
     class Meta:
         verbose_name = _('Deck')
         verbose_name_plural = _('Decks')
         ordering = ['-created']
+        indexes = [
+            # keyset-пагинация колод в API (см. ``api.services.pagination.DeckPagination``)
+            models.Index(fields=['-created', '-id'], name='deck_created_id_idx'),
+        ]
+        constraints = [
+            # безымянная колода (общая база колод) существует в единственном экземпляре
+            models.UniqueConstraint(
+                fields=['digest'],
+                condition=models.Q(name='') & ~models.Q(digest=''),
+                name='unique_nameless_deck_digest',
+            ),
+        ]
 
     def __str__(self):
         kinda_name = self.name if self.name else f'id_{self.pk}'
         return f'{kinda_name} ({self.deck_format}, {self.deck_class})'
 
     @classmethod
-    def from_deckstring(cls, deckstring: str, *, named: bool = False):
-        """ Создает экземпляр колоды из кода, сохраняет и возвращает его """
+    def from_deckstring(cls, deckstring: str, *, named: bool = False, name: str = '', user: User | None = None):
+        """
+        Создает экземпляр колоды из кода, сохраняет и возвращает его
+
+        :param named: создать именованную колоду (копию колоды для пользователя ``user``)
+        :param name: название именованной колоды; по умолчанию - название класса
+        """
+
+        # колода хранится под каноническим кодом: одинаковые колоды из разных клиентов дают один и тот же код
+        parsed_deck = canonicalize(parse_deckstring(deckstring))
+        deckstring = write_deckstring(parsed_deck)
+        digest = get_deck_digest(parsed_deck)
 
         # если точно такая же колода уже есть в БД - она же и возвращается вместо создания нового экземпляра
-        nameless_deck = Deck.nameless.filter(string=deckstring)
-        if not named and nameless_deck.exists():
-            return nameless_deck.first()
-
-        instance = cls()
-        parsed_deck = parse_deckstring(deckstring)
-        instance.deck_class = Card.objects.get(dbf_id=parsed_deck.heroes[0]).card_class.all().first()
-        instance.deck_format = Format.objects.get(numerical_designation=parsed_deck.format_)
-        instance.string = deckstring
-        instance.save()
-        for dbf_id, number in parsed_deck.cards.native:
-            try:
-                card = Card.includibles.get(dbf_id=dbf_id)
-            except Card.DoesNotExist:
-                msg = _('No card data (id %(id)s)') % {'id': dbf_id}
-                raise UnsupportedCards(msg)
-            ci = Inclusion(deck=instance, card=card, number=number)
-            ci.save()
-
-        for dbf_id, source_dbf_id, number in parsed_deck.cards.additional:
-            try:
-                card = Card.includibles.get(dbf_id=dbf_id)
-                source_card = Card.includibles.get(dbf_id=source_dbf_id)
-            except Card.DoesNotExist:
-                msg = _('No additional card data')
-                raise UnsupportedCards(msg)
-            ci = Inclusion(deck=instance, card=card, number=number, source_card=source_card, is_native=False)
-            ci.save()
+        if not named and (nameless_deck := Deck.nameless.filter(digest=digest).first()):
+            return nameless_deck
 
+        instance = cls(digest=digest, user=user)
+        instance.deck_class_id = cls.get_hero_class_id(parsed_deck)
+        instance.string = deckstring
+        if named:
+            # именованная колода не должна совпадать с безымянной (см. Meta.constraints)
+            instance.name = name or str(instance.deck_class)
+            instance.save_with_cards(parsed_deck)
+            return instance
+
+        try:
+            # save_with_cards выполняется в точке сохранения: при ошибке откатывается только вставка колоды
+            instance.save_with_cards(parsed_deck)
+        except IntegrityError:
+            # такую же колоду одновременно сохранил другой запрос (см. Meta.constraints)
+            return Deck.nameless.get(digest=digest)
+
+        from core.services.popularity import record_deck  # импорт здесь во избежание перекрестного импорта
+        from core.tasks import update_similar_decks  # импорт здесь во избежание перекрестного импорта
+        record_deck(instance, (card.dbf_id for card in parsed_deck.cards.native))
+        transaction.on_commit(partial(update_similar_decks.delay, instance.pk))
+        # страницы со списками колод сбрасываются не на каждую колоду, а периодически (см. core.tasks)
+        transaction.on_commit(partial(page_cache.mark_stale, CacheScope.DECKS))
         return instance
 
+    @staticmethod
+    def get_hero_class_id(parsed_deck: ParsedDeckstring) -> int | None:
+        """ Возвращает id класса колоды по первому герою из кода колоды """
+        return card_catalog[parsed_deck.heroes[0]].class_id
+
+    @staticmethod
+    def resolve_inclusions(parsed_deck: ParsedDeckstring) -> list['Inclusion']:
+        """
+        Проверяет по каталогу карт, что все карты колоды есть в БД,
+        и возвращает несохраненные вхождения карт (без привязки к колоде)
+
+        :raises UnsupportedCards: в сообщении перечислены все отсутствующие в БД карты
+        """
+        native = parsed_deck.cards.native
+        additional = parsed_deck.cards.additional
+        dbf_ids = {card.dbf_id for card in native}
+        dbf_ids.update(card.dbf_id for card in additional)
+        dbf_ids.update(card.source_dbf_id for card in additional)
+
+        known_ids = card_catalog.get_includible_ids(dbf_ids)
+        if unknown_ids := dbf_ids - known_ids:
+            msg = _('No card data (id %(id)s)') % {'id': ', '.join(map(str, sorted(unknown_ids)))}
+            raise UnsupportedCards(msg)
+
+        inclusions = [Inclusion(card_id=dbf_id, number=number) for dbf_id, number in native]
+        inclusions.extend(
+            Inclusion(card_id=dbf_id, number=number, source_card_id=source_dbf_id, is_native=False)
+            for dbf_id, source_dbf_id, number in additional
+        )
+        return inclusions
+
+    @transaction.atomic
+    def save_with_cards(self, parsed_deck: ParsedDeckstring):
+        """
+        Определяет формат колоды по расшифрованному коду, сохраняет колоду,
+        записывает вхождения всех ее карт одним запросом и сводку колоды (``DeckSummary``)
+        """
+        self.deck_format = Format.objects.get(numerical_designation=parsed_deck.format_)
+        inclusions = self.resolve_inclusions(parsed_deck)   # колода не сохраняется, если каких-то карт нет в БД
+        self.save()
+        for inclusion in inclusions:
+            inclusion.deck = self
+        Inclusion.objects.bulk_create(inclusions)
+        DeckSummary.objects.build(self.pk, inclusions).save()
+
     @property
     def is_named(self):
         """ Возвращает ``True``, если колода была сохранена пользователем """
-        return self.name != '' and self.user is not None
+        return self.name != '' and self.user_id is not None
 
     @property
     def included_cards(self):
@@ -163,53 +281,28 @@ class Deck(models.Model):
         from .forms import DeckStringCopyForm  # импорт здесь во избежание перекрестного импорта
         return DeckStringCopyForm(initial={'deckstring': self.string})
 
+    @cached_property
+    def analytics(self) -> DeckAnalytics:
+        """
+        Аналитика колоды (стоимость, кривая маны, статистика); список карт загружается один раз
+        или берется из загруженных заранее (см. ``DeckQuerySet.with_analytics``)
+        """
+        inclusions = getattr(self, 'analytics_inclusions', None)
+        if inclusions is None:
+            inclusions = DeckAnalytics.inclusions_queryset(self.inclusions.all())
+        return DeckAnalytics(inclusions)
+
     @property
     def craft_cost(self):
         """
         Возвращает суммарную стоимость (во внутриигровой валюте)
         создания карт из колоды (в обычном и золотом варианте)
         """
-        craft_cost, craft_cost_gold = 0, 0
-        rarities = Card.Rarities
-        prices = {rarities.UNKNOWN: (0, 0),
-                  rarities.NO_RARITY: (0, 0),
-                  rarities.COMMON: (40, 400),
-                  rarities.RARE: (100, 800),
-                  rarities.EPIC: (100, 1600),
-                  rarities.LEGENDARY: (1600, 3200)}
-        for card in self.included_cards:
-            craft_cost += prices[card.rarity][0] * card.number
-            craft_cost_gold += prices[card.rarity][1] * card.number
-        return {'basic': craft_cost, 'gold': craft_cost_gold}
-
-    def __get_statistics(self, field: str) -> list[dict]:
-        """
-        Возвращает данные о количестве карт в колоде,
-        соответствующих различным значением поля ``field``
-        """
-        lst = []
-        result = []
-        for card in self.included_cards:
-            try:
-                data = getattr(card, field)
-            except AttributeError:
-                return []  # отразится в шаблоне как отсутствие данных
-
-            if field == 'card_type':
-                verbose_data = Card.CardTypes(data)
-            elif field == 'rarity':
-                verbose_data = Card.Rarities(data)
-            else:
-                verbose_data = data
-
-            if verbose_data not in lst:
-                lst.append(verbose_data)
-                result.append({'name': verbose_data, 'data': data, 'num_cards': card.number})
-            else:
-                d = next(stat for stat in result if stat['name'] == verbose_data)
-                d['num_cards'] += card.number
-
-        return sorted(result, key=lambda stat: stat['num_cards'], reverse=True)
+        try:
+            summary = self.summary
+        except DeckSummary.DoesNotExist:
+            return self.analytics.craft_cost
+        return {'basic': summary.craft_cost, 'gold': summary.craft_cost_gold}
 
     @property
     def sets_statistics(self):
@@ -217,17 +310,17 @@ class Deck(models.Model):
         Возвращает данные о наборах карт, используемых в колоде,
         и о кол-ве карт каждого набора
         """
-        return self.__get_statistics('card_set')
+        return self.analytics.sets_statistics
 
     @property
     def types_statistics(self):
         """ Возвращает данные о типах карт в колоде и кол-ве карт каждого типа """
-        return self.__get_statistics('card_type')
+        return self.analytics.types_statistics
 
     @property
     def rarity_statistics(self):
         """ Возвращает данные о редкостях карт в колоде и кол-ве карт каждой редкости """
-        return self.__get_statistics('rarity')
+        return self.analytics.rarity_statistics
 
     @property
     def mechanics_statistics(self):
@@ -235,19 +328,7 @@ class Deck(models.Model):
         Возвращает данные о механиках Hearthstone, использующихся
         картами колоды, и о кол-ве этих карт на каждую механику
         """
-        mechanics = []
-        result: list[dict] = []
-        for card in self.included_cards:
-            for mech in card.mechanic.all():
-                if mech not in mechanics:
-                    mechanics.append(mech)
-                    result.append({'mech': mech, 'num_cards': card.number})
-                else:
-                    m = next(m for m in result if m['mech'] == mech)
-                    m['num_cards'] += card.number
-
-        result.sort(key=lambda mech_: mech_['num_cards'], reverse=True)
-        return result
+        return self.analytics.mechanics_statistics
 
     def get_absolute_url(self):
         return reverse_lazy('decks:deck_detail', kwargs={'deck_id': self.pk})
@@ -271,6 +352,153 @@ class Inclusion(models.Model):
 
     objects = IncluSionManager.as_manager()
 
+    class Meta:
+        indexes = [
+            # поиск колод по содержащимся в них картам (см. ``DeckQuerySet.containing``)
+            models.Index(fields=['card', 'number', 'deck'], name='inclusion_card_number_deck_idx'),
+        ]
+
+
+class DeckSummaryManager(models.Manager):
+
+    def build(self, deck_id: int, inclusions: list[Inclusion]) -> 'DeckSummary':
+        """ Создает (без сохранения) сводку колоды по ее вхождениям карт и каталогу карт """
+        rows = []
+        for inclusion in inclusions:
+            record = card_catalog[inclusion.card_id]
+            rows.append((record.cost, record.rarity, record.card_type, inclusion.number, inclusion.is_native))
+        return self.model(deck_id=deck_id, **summarize_cards(rows))
+
+    def rebuild(self, decks) -> int:
+        """
+        Пересчитывает сводки колод ``decks`` (queryset или список) по данным о картах в БД,
+        например, после обновления БД. Возвращает кол-во пересчитанных сводок
+        """
+        rows = Inclusion.objects.filter(deck__in=decks).order_by('deck_id').values_list(
+            'deck_id', 'card__cost', 'card__rarity', 'card__card_type', 'number', 'is_native',
+        )
+        summaries = [
+            self.model(deck_id=deck_id, **summarize_cards(row[1:] for row in deck_rows))
+            for deck_id, deck_rows in groupby(rows.iterator(), key=itemgetter(0))
+        ]
+        with transaction.atomic():
+            self.filter(deck__in=decks).delete()
+            self.bulk_create(summaries, batch_size=500)
+        return len(summaries)
+
+
+class DeckSummary(models.Model):
+    """ Сводные показатели колоды, рассчитываемые при ее создании (колода не меняется после расшифровки) """
+
+    deck = models.OneToOneField(Deck, on_delete=models.CASCADE, primary_key=True, related_name='summary',
+                                verbose_name=_('Deck'))
+    craft_cost = models.PositiveIntegerField(default=0, verbose_name=_('Craft cost'))
+    craft_cost_gold = models.PositiveIntegerField(default=0, verbose_name=_('Craft cost (golden)'))
+    mana_curve = models.JSONField(default=list, verbose_name=_('Mana curve'),
+                                  help_text=_('Number of cards per mana cost (0-9 and 10+).'))
+    card_count = models.PositiveSmallIntegerField(default=0, verbose_name=_('Number of cards'))
+    type_counts = models.JSONField(default=dict, verbose_name=_('Number of cards by type'))
+    rarity_counts = models.JSONField(default=dict, verbose_name=_('Number of cards by rarity'))
+    is_highlander = models.BooleanField(default=False, db_index=True, verbose_name=_('Highlander'),
+                                        help_text=_('All cards of the deck are included in a single copy.'))
+
+    objects = DeckSummaryManager()
+
+    class Meta:
+        verbose_name = _('Deck summary')
+        verbose_name_plural = _('Deck summaries')
+
+    def __str__(self):
+        return f'{self.deck_id}: {self.craft_cost} | {self.craft_cost_gold}'
+
+
+class SimilarDeckManager(models.Manager):
+
+    def neighbours(self, deck: Deck):
+        """
+        Похожие колоды для ``deck`` по убыванию числа совпадений карт.
+        Для именованной колоды возвращаются колоды, похожие на ее безымянный экземпляр
+        """
+        if deck.name:
+            similar = self.filter(deck__name='', deck__digest=deck.digest) if deck.digest else self.none()
+        else:
+            similar = self.filter(deck=deck)
+        return similar.select_related(
+            'neighbour',
+            'neighbour__summary',
+            'neighbour__deck_class',
+            'neighbour__deck_format',
+        ).order_by('-score', '-neighbour_id')
+
+
+class SimilarDeck(models.Model):
+    """ Похожая колода (рассчитывается заранее, см. ``core.services.similarity``) """
+
+    deck = models.ForeignKey(Deck, on_delete=models.CASCADE, related_name='similar_decks', verbose_name=_('Deck'))
+    neighbour = models.ForeignKey(Deck, on_delete=models.CASCADE, related_name='+', verbose_name=_('Similar deck'))
+    score = models.PositiveSmallIntegerField(verbose_name=_('Number of matching cards'))
+
+    objects = SimilarDeckManager()
+
+    class Meta:
+        verbose_name = _('Similar deck')
+        verbose_name_plural = _('Similar decks')
+        constraints = [
+            models.UniqueConstraint(fields=['deck', 'neighbour'], name='unique_similar_deck'),
+        ]
+        indexes = [
+            # выборка похожих колод - проход по индексу в порядке убывания совпадений
+            models.Index(fields=['deck', '-score', '-neighbour'], name='similar_deck_score_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.deck_id} ~ {self.neighbour_id} ({self.score})'
+
+
+class CardUsage(models.Model):
+    """ Кол-во новых безымянных колод с картой за день (см. ``core.services.popularity``) """
+
+    card = models.ForeignKey(Card, on_delete=models.CASCADE, related_name='+', verbose_name=_('Card'))
+    day = models.DateField(verbose_name=_('Day'))
+    num_decks = models.PositiveIntegerField(default=0, verbose_name=_('Number of decks'))
+
+    objects = models.Manager()
+
+    class Meta:
+        verbose_name = _('Card usage')
+        verbose_name_plural = _('Card usage')
+        constraints = [
+            models.UniqueConstraint(fields=['card', 'day'], name='unique_card_usage'),
+        ]
+        indexes = [
+            # динамика популярности карты читается только из индекса
+            models.Index(fields=['card', 'day', 'num_decks'], name='card_usage_day_num_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.card_id} {self.day}: {self.num_decks}'
+
+
+class DeckUsage(models.Model):
+    """ Кол-во новых безымянных колод класса и формата за день (см. ``core.services.popularity``) """
+
+    deck_class = models.ForeignKey(CardClass, on_delete=models.CASCADE, related_name='+', verbose_name=_('Class'))
+    deck_format = models.ForeignKey(Format, on_delete=models.CASCADE, related_name='+', verbose_name=_('Format'))
+    day = models.DateField(verbose_name=_('Day'))
+    num_decks = models.PositiveIntegerField(default=0, verbose_name=_('Number of decks'))
+
+    objects = models.Manager()
+
+    class Meta:
+        verbose_name = _('Deck usage')
+        verbose_name_plural = _('Deck usage')
+        constraints = [
+            models.UniqueConstraint(fields=['deck_class', 'deck_format', 'day'], name='unique_deck_usage'),
+        ]
+
+    def __str__(self):
+        return f'{self.deck_class_id}/{self.deck_format_id} {self.day}: {self.num_decks}'
+
 
 class Render(models.Model):
     """ Детализированное изображение колоды """
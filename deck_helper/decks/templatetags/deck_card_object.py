@@ -24,10 +24,7 @@ def card_in_deck(deck: Deck, card: Card, tooltip_cls: str = ''):
     if card.dbf_id not in settings.KNOWN_EXPANDER_ID_LIST:
         return context
 
-    if not deck.additional_cards.exists():
-        return context
-
-    cards_added_by_current_card = deck.additional_cards.filter(source=card.dbf_id)
+    cards_added_by_current_card = deck.analytics.get_additional_cards(card.dbf_id)
     context['additional_cards'] = cards_added_by_current_card
-    context['truncate'] = 22 - 2 * cards_added_by_current_card.count()
+    context['truncate'] = 22 - 2 * len(cards_added_by_current_card)
     return context
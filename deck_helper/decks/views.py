@@ -2,7 +2,6 @@ from django.http import HttpRequest, JsonResponse
 from django.shortcuts import render, redirect
 from django.urls import reverse_lazy
 from django.views import generic
-from django.views.decorators.cache import cache_page
 from django.core.exceptions import PermissionDenied
 from django.contrib import messages
 from django.contrib.messages.views import SuccessMessageMixin
@@ -15,13 +14,28 @@ from celery.result import AsyncResult
 
 from random import choice
 
-from .models import Deck
+from .models import Deck, DeckQuerySet, SimilarDeck
 from .forms import DeckstringForm, DeckFilterForm, DeckSaveForm
 from core.tasks import generate_deck_render
 from core.services.deck_codes import get_clean_deckstring
-from core.services.deck_utils import find_similar_decks
+from core.services.deck_analytics import DeckAnalytics
 from core.exceptions import DecodeError, UnsupportedCards
 from core.mixins import CacheMixin
+from core.services.page_cache import CacheScope, page_cache
+
+
+def get_deck_cache_context() -> dict:
+    """
+    Параметры кэширования фрагментов страницы колоды, зависящих только от ее карт
+    (список карт, стоимость, статистика - см. ``decks/deck_detail.html``)
+
+    Ключ фрагмента - id колоды, язык и версия данных о картах, поэтому фрагменты устаревают
+    только с обновлением БД карт
+    """
+    return {
+        'deck_cache_timeout': settings.CACHE_TTL_LONG,
+        'deck_cache_version': page_cache.get_namespace((CacheScope.CARDS,)),
+    }
 
 
 def create_deck(request: HttpRequest):
@@ -40,7 +54,7 @@ def create_deck(request: HttpRequest):
                     with transaction.atomic():
                         deck = Deck.from_deckstring(deckstring)
                         deck_name_init = f'{deck.deck_class}-{deck.pk}'
-                        deck_save_form = DeckSaveForm(initial={'string_to_save': deckstring,
+                        deck_save_form = DeckSaveForm(initial={'string_to_save': deck.string,
                                                                'deck_name': deck_name_init})
                         title = deck
                 except DecodeError as de:
@@ -50,10 +64,12 @@ def create_deck(request: HttpRequest):
                     msg = _('%(error)s. The database will be updated shortly.') % {'error': u}
                     deckstring_form.add_error(None, msg)
         if 'deck_name' in request.POST:  # название колоды отправлено с формы DeckSaveForm
-            deck = Deck.from_deckstring(request.POST['string_to_save'], named=True)
-            deck.user = request.user
-            deck.name = request.POST['deck_name']
-            deck.save()
+            deck = Deck.from_deckstring(
+                request.POST['string_to_save'],
+                named=True,
+                name=request.POST['deck_name'],
+                user=request.user,
+            )
             return redirect(deck)
     else:
         deckstring_form = DeckstringForm()
@@ -61,8 +77,7 @@ def create_deck(request: HttpRequest):
     context = {'title': title,
                'deckstring_form': deckstring_form,
                'deck_save_form': deck_save_form,
-               'deck': deck,
-               'similar': find_similar_decks(deck)}
+               'deck': deck} | get_deck_cache_context()
 
     return render(request, template_name='decks/deck_detail.html', context=context)
 
@@ -108,37 +123,53 @@ def get_deck_render(request: HttpRequest, task_id):
     return JsonResponse(result, status=200)
 
 
+def filter_decks_by_cards(decks: DeckQuerySet, request: HttpRequest) -> DeckQuerySet:
+    """
+    Фильтрует колоды по картам из GET-параметра ``cards`` (``dbf_id`` через запятую);
+    ``cards_match`` - должна ли колода содержать все (по умолчанию) или любую из карт
+    """
+    dbf_ids = [int(dbf_id) for dbf_id in request.GET.get('cards', '').split(',') if dbf_id.strip().isdigit()]
+    match = request.GET.get('cards_match')
+    if match not in DeckQuerySet.CardsMatch.values:
+        match = DeckQuerySet.CardsMatch.ALL
+    return decks.containing(dbf_ids, match=match)
+
+
 class NamelessDecksListView(CacheMixin, generic.ListView):
     """ Вывод списка всех имеющихся в базе уникальных колод """
     model = Deck
     context_object_name = 'decks'
     template_name = 'decks/deck_list.html'
     paginate_by = 18
+    cache_scopes = (CacheScope.CARDS, CacheScope.DECKS)
 
     def get_context_data(self, *, object_list=None, **kwargs):
         context = super().get_context_data(**kwargs)
 
         search_initial_values = {'deck_class': self.request.GET.get('deck_class', ''),
-                                 'deck_format': self.request.GET.get('deck_format', '')}
+                                 'deck_format': self.request.GET.get('deck_format', ''),
+                                 'cards': self.request.GET.get('cards', ''),
+                                 'cards_match': self.request.GET.get('cards_match', '')}
 
         context |= {
             'title': _('Decks'),
             'form': DeckFilterForm(initial=search_initial_values),
             'deck_expanders': settings.KNOWN_EXPANDER_ID_LIST,
         }
+        DeckAnalytics.for_decks(context['decks'])
         return context
 
     def get_queryset(self):
         deck_class = self.request.GET.get('deck_class')
         deck_format = self.request.GET.get('deck_format')
 
-        object_list = self.model.nameless.all()
+        object_list = self.model.nameless.select_related('summary')
         if deck_class:
             object_list = object_list.filter(deck_class=deck_class)
         if deck_format:
             object_list = object_list.filter(deck_format=deck_format)
 
-        return object_list
+        return filter_decks_by_cards(object_list, self.request)
 
 
 class UserDecksListView(LoginRequiredMixin, generic.ListView):
@@ -154,13 +185,16 @@ class UserDecksListView(LoginRequiredMixin, generic.ListView):
         context = super().get_context_data(**kwargs)
 
         search_initial_values = {'deck_class': self.request.GET.get('deck_class', ''),
-                                 'deck_format': self.request.GET.get('deck_format', '')}
+                                 'deck_format': self.request.GET.get('deck_format', ''),
+                                 'cards': self.request.GET.get('cards', ''),
+                                 'cards_match': self.request.GET.get('cards_match', '')}
 
         context |= {
             'title': _('Decks'),
             'form': DeckFilterForm(initial=search_initial_values),
             'deck_expanders': settings.KNOWN_EXPANDER_ID_LIST,
         }
+        DeckAnalytics.for_decks(context['decks'])
         return context
 
     def get_queryset(self):
@@ -168,16 +202,15 @@ class UserDecksListView(LoginRequiredMixin, generic.ListView):
         deck_class = self.request.GET.get('deck_class')
         deck_format = self.request.GET.get('deck_format')
 
-        object_list = self.model.named.filter(user=self.request.user)
+        object_list = self.model.named.filter(user=self.request.user).select_related('summary')
         if deck_class:
             object_list = object_list.filter(deck_class=deck_class)
         if deck_format:
             object_list = object_list.filter(deck_format=deck_format)
 
-        return object_list
+        return filter_decks_by_cards(object_list, self.request)
 
 
-@cache_page(settings.CACHE_TTL)
 def deck_view(request, deck_id):
     """ Просмотр конкретной колоды """
 
@@ -201,16 +234,19 @@ def deck_view(request, deck_id):
                 return redirect(reverse_lazy('accounts:signin'))
 
             # доступно сохранение колоды (т.е. создание именованного экземпляра той же колоды)
-            deck_to_save = Deck.from_deckstring(request.POST['string_to_save'], named=True)
-            deck_to_save.user = request.user
-            deck_to_save.name = request.POST['deck_name']
-            deck_to_save.save()
+            deck_to_save = Deck.from_deckstring(
+                request.POST['string_to_save'],
+                named=True,
+                name=request.POST['deck_name'],
+                user=request.user,
+            )
             return redirect(deck_to_save)
 
-    similar = find_similar_decks(deck)
-    paginator = Paginator(similar, 9)
+    # похожие колоды рассчитываются заранее (см. core.tasks.update_similar_decks)
+    paginator = Paginator(SimilarDeck.objects.neighbours(deck), 9)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
+    page_obj.object_list = DeckAnalytics.for_decks(similar.neighbour for similar in page_obj.object_list)
 
     context = {
         'title': deck,
@@ -219,7 +255,7 @@ def deck_view(request, deck_id):
         'paginator': paginator,
         'page_obj': page_obj,
         'deck_expanders': settings.KNOWN_EXPANDER_ID_LIST,
-    }
+    } | get_deck_cache_context()
 
     return render(request, template_name='decks/deck_detail.html', context=context)
 
@@ -1,5 +1,6 @@
 import pytest
 
+from django.core.cache import cache
 from django.core.management import call_command
 
 pytest_plugins = [
@@ -14,3 +15,16 @@ def django_db_setup(django_db_setup, django_db_blocker):
     with django_db_blocker.unblock():
         call_command('loaddata', 'common_fixture.json')
         call_command('loaddata', 'card_fixture.json')
+
+
+# индексы колод, каталог карт и кэш страниц переживают тест, а тестовая БД откатывается после каждого теста
+@pytest.fixture(autouse=True)
+def reset_deck_indexes():
+    from core.services.similarity import similar_deck_engine
+    from core.services.deck_bitmaps import deck_bitmap_index
+    from core.services.catalog import card_catalog
+    yield
+    similar_deck_engine.invalidate()
+    deck_bitmap_index.invalidate()
+    card_catalog.invalidate()
+    cache.clear()
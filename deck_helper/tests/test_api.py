@@ -1,7 +1,18 @@
 import pytest
 import json
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
 
+from core.models import HearthstoneState
+from core.services.catalog import card_catalog
+from core.services.deck_codes import parse_deckstring, write_deckstring
+from core.services.popularity import rebuild_popularity
+from core.services.similarity import update_similar_decks
+from api.serializers import DeckDetailSerializer
+from cards.models import Card
+from decks.models import CardUsage, Deck
+
 
 class TestAPICards:
 
@@ -16,9 +27,39 @@ class TestAPICards:
         }
         response = api_client.get('/api/v1/cards/', data=params)
         assert response.status_code == status.HTTP_200_OK, 'эндпойнт /cards/ недоступен'
-        assert len(response.data) == 4, 'возвращено неверное кол-во карт'
-        assert all(card['card_class'][0] == 'Rogue' for card in response.data), 'возвращен неверный список карт'
-        assert any(card['dbf_id'] == 45531 for card in response.data), 'в списке не обнаружена искомая карта'
+        cards = response.data['results']
+        assert len(cards) == 4, 'возвращено неверное кол-во карт'
+        assert all(card['card_class'][0] == 'Rogue' for card in cards), 'возвращен неверный список карт'
+        assert any(card['dbf_id'] == 45531 for card in cards), 'в списке не обнаружена искомая карта'
+
+    @pytest.mark.django_db
+    def test_card_list_pagination_api(self, api_client):
+        response = api_client.get('/api/v1/cards/', data={'page_size': 7})
+        assert len(response.data['results']) == 7, 'не учтен размер страницы'
+        pages = [response.data['results']]
+        while response.data['next']:
+            response = api_client.get(response.data['next'])
+            pages.append(response.data['results'])
+        dbf_ids = [card['dbf_id'] for page in pages for card in page]
+        assert len(dbf_ids) == len(set(dbf_ids)), 'страницы не должны пересекаться'
+
+        response = api_client.get('/api/v1/cards/', data={'stream': 'ndjson'})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        assert sorted(row['dbf_id'] for row in rows) == sorted(dbf_ids), 'выгрузка должна содержать все карты'
+
+    @pytest.mark.django_db
+    def test_card_list_compact_api(self, api_client):
+        full = api_client.get('/api/v1/cards/', data={'page_size': 5})
+        params = {'page_size': 5, 'fields': 'dbf_id,name', 'format': 'columnar'}
+        response = api_client.get('/api/v1/cards/', data=params)
+        assert response.status_code == status.HTTP_200_OK, 'компактный формат недоступен'
+        data = json.loads(response.content)
+        assert data['columns'] == ['dbf_id', 'name'], 'должны возвращаться только запрошенные поля'
+        assert [row[0] for row in data['rows']] == [card['dbf_id'] for card in full.data['results']], \
+            'строки должны соответствовать объектам списка'
+
+        response = api_client.get('/api/v1/cards/45975/', data={'exclude': 'text,flavor'})
+        assert 'text' not in response.data and 'name' in response.data, 'исключенные поля не должны возвращаться'
 
     @pytest.mark.django_db
     def test_card_retrieve_api(self, api_client):
@@ -27,11 +68,78 @@ class TestAPICards:
         data = json.loads(response.content)
         assert data['card_id'] == 'ICC_910', 'возвращена неверная карта'
 
+    @pytest.mark.django_db
+    def test_card_retrieve_api_not_modified(self, api_client):
+        HearthstoneState.load().save()
+        card_catalog.invalidate()
+        response = api_client.get('/api/v1/cards/45975/')
+        assert response.has_header('ETag') and response.has_header('Last-Modified'), \
+            'ответ должен содержать ETag и Last-Modified'
+
+        response = api_client.get('/api/v1/cards/45975/', HTTP_IF_NONE_MATCH=response['ETag'])
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED, 'при неизменной БД должен возвращаться 304'
+
+        HearthstoneState.load().save()     # обновление БД карт
+        card_catalog.invalidate()
+        response = api_client.get('/api/v1/cards/45975/', HTTP_IF_NONE_MATCH=response['ETag'])
+        assert response.status_code == status.HTTP_200_OK, 'после обновления БД ETag должен измениться'
+
+    @pytest.mark.django_db
+    def test_card_bulk_api(self, api_client):
+        response = api_client.get('/api/v1/cards/bulk/', data={'ids': '45975, ICC_910,0'})
+        assert response.status_code == status.HTTP_200_OK, 'эндпойнт /cards/bulk/ недоступен'
+        assert list(response.data) == ['45975', 'ICC_910', '0'], 'карты должны возвращаться по запрошенным id'
+        assert response.data['45975'] == response.data['ICC_910'], 'карта должна находиться и по dbf_id, и по card_id'
+        assert response.data['0'] is None, 'для несуществующей карты должен возвращаться null'
+
+        response = api_client.get('/api/v1/cards/bulk/', data={'ids': ','.join(map(str, range(1, 302)))})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST, 'число id в запросе должно быть ограничено'
+
+    @pytest.mark.django_db
+    def test_card_search_api(self, api_client):
+        response = api_client.get('/api/v1/cards/', data={'name': 'оватый'})
+        assert 45975 in [card['dbf_id'] for card in response.data['results']], 'карта не найдена по русскому названию'
+
+        found = Card.objects.filter(collectible=True).search_by_name('st').values_list('dbf_id', flat=True)
+        response = api_client.get('/api/v1/cards/', data={'name': 'st', 'page_size': 3})
+        paged = response.data['results']
+        while response.data['next']:
+            response = api_client.get(response.data['next'])
+            paged += response.data['results']
+        assert [card['dbf_id'] for card in paged] == list(found), \
+            'страницы результатов поиска должны идти в порядке релевантности'
+
+    @pytest.mark.django_db
+    def test_card_facets_api(self, api_client):
+        params = {'ctype': 'M', 'classes': 'Rogue', 'cost_min': 1, 'cost_max': 4}
+        cards = api_client.get('/api/v1/cards/', data=params).data['results']
+        response = api_client.get('/api/v1/cards/facets/', data=params)
+        assert response.status_code == status.HTTP_200_OK, 'эндпойнт /cards/facets/ недоступен'
+        assert response.data['card_type'] == {'M': len(cards)}, 'неверно посчитаны карты по типам'
+        assert sum(response.data['rarity'].values()) == len(cards), 'неверно посчитаны карты по редкостям'
+
+    @pytest.mark.django_db
+    def test_card_autocomplete_api(self, api_client):
+        response = api_client.get('/api/v1/cards/autocomplete/', data={'q': 'spectral pil'})
+        assert response.status_code == status.HTTP_200_OK, 'эндпойнт /cards/autocomplete/ недоступен'
+        assert [card['dbf_id'] for card in response.data] == [45975], 'карта не найдена по началу названия'
+
+        response = api_client.get('/api/v1/cards/autocomplete/', data={'q': 'Пилл', 'language': 'ru'})
+        assert not response.data, 'подсказки должны искаться по названиям на указанном языке'
+        response = api_client.get('/api/v1/cards/autocomplete/', data={'q': 'дух', 'language': 'ru'})
+        assert 45975 in [card['dbf_id'] for card in response.data], 'карта не найдена по началу слова названия'
+        assert len(response.data) <= 10, 'превышено кол-во подсказок'
+
+        response = api_client.get('/api/v1/cards/autocomplete/', data={'q': 'spectral pil', 'collectible': 'false'})
+        assert not response.data, 'не учтен фильтр по коллекционности'
+
 
 class TestAPIDecks:
 
     @pytest.mark.django_db
-    def test_deck_list_api(self, api_client, deck, deckstring):
+    @pytest.mark.parametrize('bitmap_max_ids', [500, 0])
+    def test_deck_list_api(self, api_client, deck, deckstring, settings, bitmap_max_ids):
+        settings.DECK_BITMAP_MAX_IDS = bitmap_max_ids   # 0 - колоды отбираются подзапросом, без битового индекса
         params = {
             'dformat': 'Wild',
             'dclass': 'Rogue',
@@ -39,10 +147,39 @@ class TestAPIDecks:
         }
         response = api_client.get('/api/v1/decks/', data=params)
         assert response.status_code == status.HTTP_200_OK, 'эндпойнт /decks/ недоступен'
-        data = json.loads(response.content)
+        data = json.loads(response.content)['results']
         assert len(data) == 1, 'в ответе должна быть ровно 1 тестовая колода'
         assert data[0]['string'] == deckstring, 'код колоды в ответе не совпал с кодом тестовой колоды'
 
+        response = api_client.get('/api/v1/decks/', data={'cards': '45975,1', 'cards_match': 'any'})
+        assert len(response.data['results']) == 1, 'колода содержит одну из указанных карт'
+        response = api_client.get('/api/v1/decks/', data={'cards': '45975', 'min_copies': 3})
+        assert not response.data['results'], 'не учтено минимальное кол-во экземпляров карты'
+        response = api_client.get('/api/v1/decks/', data={'dclass': 'Rogue', 'without_cards': '1,45975'})
+        assert not response.data['results'], 'колода содержит одну из исключенных карт'
+
+    @pytest.mark.django_db
+    def test_deck_list_api_num_queries(self, api_client, deck, deckstring):
+        parsed = parse_deckstring(deckstring)
+        for _ in range(4):
+            parsed.cards.native.pop()
+            Deck.from_deckstring(write_deckstring(parsed))
+
+        def get_page(num_decks: int) -> int:
+            with CaptureQueriesContext(connection) as queries:
+                response = api_client.get('/api/v1/decks/', data={'page_size': num_decks})
+            assert len(response.data['results']) == num_decks
+            return len(queries)
+
+        def serialize_decks(num_decks: int) -> int:
+            with CaptureQueriesContext(connection) as queries:
+                decks = Deck.nameless.select_related('summary').with_analytics()[:num_decks]
+                assert len(DeckDetailSerializer(decks, many=True).data) == num_decks
+            return len(queries)
+
+        assert get_page(1) == get_page(5), 'число запросов не должно зависеть от числа колод на странице'
+        assert serialize_decks(1) == serialize_decks(5), 'карты колод должны загружаться постоянным числом запросов'
+
     @pytest.mark.django_db
     def test_deck_retrieve_api(self, api_client, deck, deckstring):
         response = api_client.get(f'/api/v1/decks/{deck.pk}/')
@@ -50,6 +187,12 @@ class TestAPIDecks:
         data = json.loads(response.content)
         assert data['string'] == deckstring, 'код колоды в ответе не совпал с кодом тестовой колоды'
 
+        with CaptureQueriesContext(connection) as queries:
+            response = api_client.get(f'/api/v1/decks/{deck.pk}/', data={'exclude': 'cards'})
+        assert 'cards' not in response.data
+        assert not any('decks_inclusion' in query['sql'] for query in queries), \
+            'карты колоды не должны загружаться, если список карт исключен из ответа'
+
     @pytest.mark.django_db
     def test_deck_decode_api(self, api_client, deckstring):
         response = api_client.post('/api/v1/decks/', data={'string': 'some invalid deckstring'})
@@ -61,3 +204,35 @@ class TestAPIDecks:
         data = json.loads(response.content)
         assert data['string'] == deckstring, 'код колоды в ответе не совпал с кодом тестовой колоды'
         assert data['deck_class'] == 'Rogue', 'ошибка в расшифровке кода колоды'
+
+    @pytest.mark.django_db
+    def test_deck_similar_api(self, api_client, deck, deckstring):
+        parsed = parse_deckstring(deckstring)
+        parsed.cards.native.pop()
+        similar_deck = Deck.from_deckstring(write_deckstring(parsed))
+        assert update_similar_decks(similar_deck) == 1
+
+        response = api_client.get(f'/api/v1/decks/{deck.pk}/similar/')
+        assert response.status_code == status.HTTP_200_OK, 'эндпойнт /decks/<id>/similar/ недоступен'
+        data = json.loads(response.content)
+        assert [item['deck']['id'] for item in data['results']] == [similar_deck.pk], \
+            'похожие колоды должны записываться для обеих колод'
+        assert 'next' in data, 'ответ должен содержать курсор следующей страницы'
+
+    @pytest.mark.django_db
+    def test_trend_api(self, api_client, deck):
+        card_id = deck.inclusions.filter(is_native=True).first().card_id
+        response = api_client.get(f'/api/v1/cards/{card_id}/trend/', data={'days': 7})
+        assert response.status_code == status.HTTP_200_OK, 'эндпойнт /cards/<dbf_id>/trend/ недоступен'
+        assert len(response.data) == 7, 'ряд должен содержать все дни периода'
+        assert response.data[-1]['num_decks'] == 1, 'новая колода должна учитываться в счетчике карты'
+
+        response = api_client.get('/api/v1/decks/trend/', data={'dclass': 'Rogue'})
+        assert response.data[-1]['num_decks'] == 1, 'новая колода должна учитываться в счетчике класса'
+        response = api_client.get('/api/v1/decks/trend/', data={'dclass': 'Mage'})
+        assert response.data[-1]['num_decks'] == 0, 'колода другого класса не должна учитываться'
+
+        counters = list(CardUsage.objects.values_list('card_id', 'day', 'num_decks').order_by('card_id'))
+        rebuild_popularity()
+        assert list(CardUsage.objects.values_list('card_id', 'day', 'num_decks').order_by('card_id')) == counters, \
+            'пересчет должен совпадать с инкрементальными счетчиками'
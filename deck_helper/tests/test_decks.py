@@ -1,9 +1,23 @@
 import pytest
+from django.core.cache import cache
 
-from core.services.deck_codes import parse_deckstring, ParsedDeckstring
+from core.services.deck_codes import (
+    parse_deckstring,
+    parse_deckstrings,
+    write_deckstring,
+    canonicalize,
+    ParsedDeckstring,
+    ParsedCard,
+    ParsedAdditionalCard,
+)
 from core.services.images import DeckRender
-from core.exceptions import DecodeError
-from decks.models import Deck, Render
+from core.exceptions import DecodeError, SimilarDecksRebuilding, UnsupportedCards
+from core.services.catalog import card_catalog
+from core.services.deck_bitmaps import DeckBitmap, HasCard, InFormat, OfClass, deck_bitmap_index
+from core.services.deck_utils import DumpDeckListSerializer
+from core.services.similarity import REBUILD_LOCK_KEY, similar_deck_engine, update_similar_decks
+from core.models import HearthstoneState
+from decks.models import Deck, DeckSummary, Render, SimilarDeck
 from cards.models import Card, Mechanic
 
 
@@ -28,6 +42,91 @@ def test_parse_deckstring(deck_code):
         assert card[1] in [1, 2], 'кол-во вхождений карты в колоду должно быть равно 1 или 2'
 
 
+def test_parse_deckstrings(deckstring, deck_code):
+    results = list(parse_deckstrings([deckstring, 'some invalid string', deck_code], skip_invalid=True))
+    assert len(results) == 3, 'результат должен быть получен для каждого кода колоды'
+    assert results[1] is None, 'некорректный код должен давать None при skip_invalid=True'
+    assert results[0] == parse_deckstring(deckstring), 'пакетная расшифровка не совпала с поштучной'
+    assert results[2] == parse_deckstring(deck_code), 'пакетная расшифровка не совпала с поштучной'
+    assert sum(card.number for card in results[0].cards.native) == 30, 'в колоде должно быть ровно 30 карт'
+
+    with pytest.raises(DecodeError):
+        list(parse_deckstrings(['some invalid string']))
+
+
+def test_write_deckstring(deckstring, deck_code):
+    for code in (deckstring, deck_code):
+        parsed = parse_deckstring(code)
+        assert parse_deckstring(write_deckstring(parsed)) == parsed, 'код колоды расшифрован не в исходную колоду'
+
+    parsed = parse_deckstring(deckstring)
+    parsed.cards.native.reverse()
+    shuffled = write_deckstring(parsed)
+    assert shuffled != deckstring
+    assert write_deckstring(canonicalize(parse_deckstring(shuffled))) == deckstring, \
+        'одинаковые колоды должны иметь одинаковый канонический код'
+
+
+def test_write_deckstring_additional_cards(deckstring):
+    parsed = parse_deckstring(deckstring)
+    parsed.heroes = [930, 274]
+    parsed.cards.additional = [
+        ParsedAdditionalCard(102983, 90749),
+        ParsedAdditionalCard(102983, 90749),   # повтор карты: в каноническом виде - 2 экземпляра
+        ParsedAdditionalCard(102984, 90749, 2),
+        ParsedAdditionalCard(102985, 90749, 3),
+    ]
+    assert parse_deckstring(write_deckstring(parsed)) == parsed, 'доп. карты потеряны при шифровании колоды'
+
+    canonical = canonicalize(parsed)
+    assert ParsedAdditionalCard(102983, 90749, 2) in canonical.cards.additional
+    assert canonicalize(parse_deckstring(write_deckstring(canonical))) == canonical, \
+        'канонический код должен расшифровываться в ту же колоду'
+    assert canonical.heroes == parsed.heroes, 'первый герой определяет класс колоды: порядок героев сохраняется'
+
+
+@pytest.mark.django_db
+def test_deck_from_deckstring_dedupe(deckstring):
+    parsed = parse_deckstring(deckstring)
+    parsed.cards.native.reverse()
+    first = Deck.from_deckstring(deckstring)
+    second = Deck.from_deckstring(write_deckstring(parsed))
+    assert first.pk == second.pk, 'одинаковые колоды в разном порядке карт должны давать один экземпляр'
+    assert Deck.nameless.count() == 1
+    assert len(first.digest) == 40, 'отпечаток колоды должен иметь фиксированную длину'
+
+    named = Deck.from_deckstring(deckstring, named=True)
+    assert named.pk != first.pk, 'именованная колода должна создаваться отдельным экземпляром'
+    assert named.digest == first.digest
+    assert named.name, 'именованная колода должна получить название по умолчанию'
+
+
+@pytest.mark.django_db
+def test_deck_from_deckstring_race(deckstring, monkeypatch):
+    first = Deck.from_deckstring(deckstring)
+    # другой запрос сохранил колоду между проверкой и вставкой: проверка ее не видит
+    monkeypatch.setattr(Deck.nameless, 'filter', lambda **kwargs: Deck.objects.none())
+    second = Deck.from_deckstring(deckstring)
+    assert second.pk == first.pk, 'при одновременном сохранении должна вернуться уже сохраненная колода'
+    assert Deck.nameless.count() == 1
+
+
+@pytest.mark.django_db
+def test_dump_deck_import(deckstring, admin_user):
+    rows = [
+        {'string': deckstring, 'created': '2022-05-01T00:00:00Z', 'name': '', 'user': None},
+        {'string': deckstring, 'created': '2022-05-01T00:00:00Z', 'name': ''},
+        {'string': deckstring, 'created': '2022-05-02T00:00:00Z', 'name': 'Saved', 'user': admin_user.pk},
+    ]
+    for _ in range(2):  # повторный импорт дампа не создает колоды заново
+        serializer = DumpDeckListSerializer(data=rows, many=True)
+        assert serializer.is_valid(), serializer.errors
+        serializer.save()
+    assert Deck.nameless.count() == 1, 'одинаковые безымянные колоды из дампа должны импортироваться один раз'
+    assert Deck.named.filter(name='Saved', user=admin_user).count() == 1, \
+        'именованная колода из дампа должна сохраниться с названием и владельцем'
+
+
 @pytest.mark.django_db
 def test_deck_from_deckstring(db, deckstring, deck_code):
     with pytest.raises(Card.DoesNotExist):
@@ -41,6 +140,32 @@ def test_deck_from_deckstring(db, deckstring, deck_code):
     assert calc_deck_cards(deck) == 30, 'в колоде должно быть ровно 30 карт'
 
 
+@pytest.mark.django_db
+def test_deck_from_deckstring_unsupported_cards(deckstring):
+    parsed = parse_deckstring(deckstring)
+    parsed.cards.native.extend([ParsedCard(999991, 1), ParsedCard(999992, 2)])
+    with pytest.raises(UnsupportedCards) as exc_info:
+        Deck.from_deckstring(write_deckstring(parsed))
+    assert '999991' in str(exc_info.value) and '999992' in str(exc_info.value), \
+        'в сообщении должны быть перечислены все отсутствующие карты'
+    assert not Deck.objects.exists(), 'колода с отсутствующими картами не должна сохраняться'
+
+
+@pytest.mark.django_db
+def test_card_catalog(deck, settings):
+    settings.CARD_CATALOG_CHECK_INTERVAL = 0
+    card = deck.cards.first()
+    record = card_catalog[card.pk]
+    assert record.name_en == card.name_en and record.cost == card.cost, 'запись каталога не соответствует карте'
+    assert record.includible, 'карта из колоды должна быть доступна для включения в колоду'
+
+    Card.objects.filter(pk=card.pk).update(cost=card.cost + 1)
+    assert card_catalog[card.pk].cost == card.cost, 'каталог не должен перезагружаться без обновления БД'
+    HearthstoneState.load().save()
+    assert card_catalog[card.pk].cost == card.cost + 1, 'каталог должен перезагружаться после обновления БД'
+    card_catalog.invalidate()
+
+
 class TestDeckStatistics:
 
     @pytest.mark.django_db
@@ -112,6 +237,124 @@ def test_deck_craft_cost(db, deck):
     assert cost['gold'] == 30800, 'неверно посчитана стоимость крафта колоды в золоте'
 
 
+@pytest.mark.django_db
+def test_deck_analytics(deck, django_assert_max_num_queries):
+    deck = Deck.objects.get(pk=deck.pk)
+    with django_assert_max_num_queries(4):
+        analytics = deck.analytics
+        assert deck.types_statistics is analytics.types_statistics, 'статистика колоды должна считаться один раз'
+    assert sum(analytics.mana_curve) == analytics.card_count == 30, 'кривая маны должна учитывать все карты колоды'
+    assert len(analytics.mana_curve) == 11, 'кривая маны должна состоять из 11 столбцов (0-9 и 10+)'
+
+
+@pytest.mark.django_db
+def test_deck_summary(deck):
+    summary = DeckSummary.objects.get(deck=deck)
+    assert (summary.craft_cost, summary.craft_cost_gold) == (5340, 30800), 'неверно посчитана сводка колоды'
+    assert summary.card_count == 30 and sum(summary.mana_curve) == 30
+    assert not summary.is_highlander, 'колода с картами в двух экземплярах не является хайлендером'
+
+    DeckSummary.objects.all().delete()
+    assert DeckSummary.objects.rebuild(Deck.objects.all()) == 1
+    rebuilt = DeckSummary.objects.get(deck=deck)
+    assert (rebuilt.craft_cost, rebuilt.mana_curve, rebuilt.rarity_counts) == \
+           (summary.craft_cost, summary.mana_curve, summary.rarity_counts), 'пересчитанная сводка отличается от исходной'
+
+
+@pytest.mark.django_db
+def test_similar_deck_scores(deck, deckstring):
+    parsed = parse_deckstring(deckstring)
+    removed = parsed.cards.native.pop()
+    similar_deck = Deck.from_deckstring(write_deckstring(parsed))
+    assert similar_deck_engine.get_scores(deck) == [(similar_deck.pk, 30 - removed.number)], \
+        'похожая колода не найдена или неверно посчитано число совпадений'
+
+    del parsed.cards.native[:10]
+    Deck.from_deckstring(write_deckstring(parsed))    # индекс дополняется новыми колодами
+    assert len(similar_deck_engine.get_scores(deck)) == 1, \
+        'колода с малым числом совпадений не должна считаться похожей'
+    named = Deck.from_deckstring(deckstring, named=True)
+    assert [deck_id for deck_id, _ in similar_deck_engine.get_scores(named)] == [similar_deck.pk], \
+        'безымянный экземпляр именованной колоды не должен считаться похожим'
+
+
+@pytest.mark.django_db
+def test_update_similar_decks_limit(deck, deckstring, settings):
+    settings.SIMILAR_DECKS_LIMIT = 1
+    parsed = parse_deckstring(deckstring)
+    parsed.cards.native.pop()
+    closer = Deck.from_deckstring(write_deckstring(parsed))
+    update_similar_decks(closer)
+    parsed.cards.native.pop()
+    farther = Deck.from_deckstring(write_deckstring(parsed))
+    assert update_similar_decks(farther) == 1, 'должно храниться не больше SIMILAR_DECKS_LIMIT похожих колод'
+
+    def neighbours(target):
+        return list(SimilarDeck.objects.filter(deck=target).values_list('neighbour_id', flat=True))
+
+    assert neighbours(deck) == [closer.pk], 'у соседей должны остаться только лучшие похожие колоды'
+    assert neighbours(closer) == [deck.pk]
+    assert neighbours(farther) == [closer.pk]
+
+
+@pytest.mark.django_db
+def test_update_similar_decks_eviction(deck, deckstring, settings):
+    settings.SIMILAR_DECKS_LIMIT = 1
+    parsed = parse_deckstring(deckstring)
+    removed = parsed.cards.native[-2:]
+    del parsed.cards.native[-2:]
+    farther = Deck.from_deckstring(write_deckstring(parsed))
+    update_similar_decks(farther)
+    parsed.cards.native.append(removed[0])
+    closer = Deck.from_deckstring(write_deckstring(parsed))
+    update_similar_decks(closer)
+    assert list(SimilarDeck.objects.filter(deck=deck).values_list('neighbour_id', flat=True)) == [closer.pk], \
+        'лучшая новая колода должна вытеснять худшую похожую колоду соседа'
+
+    cache.add(REBUILD_LOCK_KEY, True)
+    with pytest.raises(SimilarDecksRebuilding):
+        update_similar_decks(closer)
+
+
+@pytest.mark.django_db
+def test_deck_containing_cards(deck):
+    inclusion = deck.inclusions.filter(is_native=True).first()
+    other = deck.inclusions.exclude(card_id=inclusion.card_id).first()
+    dbf_ids = [inclusion.card_id, other.card_id]
+
+    assert list(Deck.nameless.containing(dbf_ids)) == [deck], 'колода содержит все указанные карты'
+    assert not Deck.nameless.containing(dbf_ids + [1]).exists(), 'колода не содержит всех указанных карт'
+    assert list(Deck.nameless.containing(dbf_ids + [1], match='any')) == [deck], \
+        'колода содержит хотя бы одну из указанных карт'
+    assert not Deck.nameless.containing([inclusion.card_id], min_copies=inclusion.number + 1).exists(), \
+        'не учтено минимальное кол-во экземпляров карты'
+
+
+@pytest.mark.django_db
+def test_deck_bitmap_index(deck, deckstring):
+    card_a, card_b = deck.inclusions.filter(is_native=True).values_list('card_id', flat=True)[:2]
+    assert deck_bitmap_index.deck_ids(HasCard(card_a)) == [deck.pk], 'индекс не загружен из БД'
+    parsed = parse_deckstring(deckstring)
+    parsed.cards.native = [card for card in parsed.cards.native if card.dbf_id != card_b]
+    other = Deck.from_deckstring(write_deckstring(parsed))    # индекс дополняется новыми колодами
+
+    same_kind = InFormat(deck.deck_format_id) & OfClass(deck.deck_class_id)
+    assert deck_bitmap_index.deck_ids(HasCard(card_a) & same_kind) == [deck.pk, other.pk], \
+        'обе колоды содержат карту'
+    assert deck_bitmap_index.deck_ids(HasCard(card_a) & ~HasCard(card_b)) == [other.pk], \
+        'неверно вычислено дополнение'
+    assert deck_bitmap_index.count(HasCard(card_b) | HasCard(1)) == 1, 'неверно вычислено объединение'
+
+
+def test_deck_bitmap():
+    dense, sparse = set(range(0, 20000, 2)), {1, 3, 70000, 5 << 16}    # блок-битмап и блоки-массивы
+    left, right = DeckBitmap.from_ids(dense | {70000}), DeckBitmap.from_ids(sparse)
+    assert list(left & right) == [70000], 'неверно вычислено пересечение'
+    assert list(left | right) == sorted(dense | sparse), 'неверно вычислено объединение'
+    assert list(left - right) == sorted(dense), 'неверно вычислена разность'
+    assert len(left - DeckBitmap.from_ids(range(2, 20000, 2))) == 2, 'неверно вычислена разность блоков-битмапов'
+
+
 @pytest.mark.django_db
 def test_deck_rendering(db, deck):
     dr = DeckRender(name='Qwerty', deck=deck, language='en')
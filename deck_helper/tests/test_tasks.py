@@ -1,9 +1,81 @@
 import pytest
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import translation
 
-from core.tasks import generate_deck_render
+from core.services.page_cache import CacheScope, page_cache
+from core.services.statistics import STATISTICS_SNAPSHOT_KEY
+from core.tasks import (
+    bump_stale_pages, generate_deck_render, update_statistics, warm_up_caches, warm_up_deck_page, warm_up_page,
+)
 
 
 @pytest.mark.django_db
 def test_generate_deck_render(deck):
     assert generate_deck_render.run(deck.pk, 'some name', 'en')
     deck.renders.first().render.delete(save=True)  # удаление тестового рендера вручную
+
+
+@pytest.mark.django_db
+def test_bump_stale_pages():
+    namespace = page_cache.get_namespace((CacheScope.DECKS,))
+    page_cache.mark_stale(CacheScope.DECKS)     # новые колоды
+    page_cache.mark_stale(CacheScope.DECKS)
+    assert page_cache.get_namespace((CacheScope.DECKS,)) == namespace, 'кэш не должен сбрасываться на каждую колоду'
+    bump_stale_pages.run()
+    bumped = page_cache.get_namespace((CacheScope.DECKS,))
+    assert bumped != namespace, 'после появления новых колод кэш списков колод должен устареть'
+    bump_stale_pages.run()
+    assert page_cache.get_namespace((CacheScope.DECKS,)) == bumped, 'без новых колод кэш не должен сбрасываться'
+
+
+@pytest.mark.django_db
+def test_update_statistics(client, deck):
+    update_statistics.run()
+    snapshot = cache.get(STATISTICS_SNAPSHOT_KEY)
+    assert set(snapshot['languages']) == {'en', 'ru'}, 'статистика должна рассчитываться для всех языков'
+
+    with translation.override('ru'), CaptureQueriesContext(connection) as queries:
+        response = client.get(reverse('statistics'))
+    assert response.status_code == 200, 'раздел Статистика недоступен'
+    assert response.context['statistics']['decks'] == snapshot['languages']['ru']['decks'], \
+        'страница должна выводить статистику из снимка'
+    assert not any('decks_deck' in query['sql'] for query in queries), 'статистика не должна рассчитываться заново'
+
+
+@pytest.mark.django_db
+def test_warm_up_caches(settings, deck, monkeypatch):
+    settings.CACHE_WARMUP_HOST = ''
+    queued_decks, queued_pages = [], []
+    monkeypatch.setattr(warm_up_deck_page, 'delay', queued_decks.append)
+    monkeypatch.setattr(warm_up_page, 'delay', queued_pages.append)
+    assert warm_up_caches.run() == len(queued_decks) == 1, 'в очередь должны ставиться колоды с первых страниц'
+    assert not queued_pages, 'без явно заданного хоста страницы целиком не прогреваются'
+    assert cache.get(STATISTICS_SNAPSHOT_KEY), 'прогрев должен пересчитывать снимок статистики'
+
+    warm_up_deck_page.run(deck.pk)
+    version = page_cache.get_namespace((CacheScope.CARDS,))
+    for language in ('en', 'ru'):
+        assert cache.get(make_template_fragment_key('deck_cards', [deck.pk, language, version])), \
+            'прогрев должен заполнять кэш фрагментов страницы колоды на всех языках'
+
+    settings.CACHE_WARMUP_HOST, settings.CACHE_WARMUP_SECURE = 'testserver', 0
+    queued_decks.clear()
+    assert warm_up_caches.run() == len(queued_decks) + len(queued_pages), 'в очередь должны ставиться все задачи'
+    popular_card = deck.inclusions.filter(is_native=True).first().card
+    with translation.override('en'):
+        card_url = reverse('cards:card_detail', kwargs={'card_slug': popular_card.slug})
+        deck_list_url = reverse('decks:all_decks')
+    assert card_url in queued_pages, 'в прогрев должны попадать страницы популярных карт'
+    assert f'{deck_list_url}?deck_class={deck.deck_class_id}&deck_format={deck.deck_format_id}' in queued_pages, \
+        'в прогрев должны попадать списки колод по классу и формату'
+
+    warm_up_page.run(card_url)
+    stats = page_cache.get_stats()['CardDetailView']
+    Client().get(card_url)
+    assert page_cache.get_stats()['CardDetailView']['hits'] == stats['hits'] + 1, \
+        'прогретая страница должна обслуживаться из кэша'
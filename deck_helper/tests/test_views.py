@@ -3,10 +3,17 @@ import json
 from django.urls import reverse_lazy
 from django.utils import translation
 from django.http import JsonResponse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.template.loader import render_to_string
 from rest_framework import status
 
-from core.services.deck_codes import parse_deckstring
+from core.services.deck_codes import parse_deckstring, write_deckstring
+from core.services.deck_analytics import DeckAnalytics
+from core.services.page_cache import CacheScope, page_cache
 from core.exceptions import DecodeError
+from core.tasks import update_statistics
+from cards.models import Card
 from decks.models import Deck
 
 
@@ -23,6 +30,16 @@ class TestDeckViews:
         response = client.get(reverse_lazy('decks:all_decks'))
         assert response.status_code == status.HTTP_200_OK, 'Список всех колод недоступен'
 
+    @pytest.mark.django_db
+    def test_all_decks_view_client_cache(self, client, settings):
+        translation.activate('en')
+        url = reverse_lazy('decks:all_decks')
+        for _ in range(2):  # промах и попадание кэша
+            response = client.get(url)
+            assert response.headers['Cache-Control'] == f'max-age={settings.CACHE_TTL}', \
+                'браузерам нельзя хранить список колод дольше CACHE_TTL: новые колоды до них не дойдут'
+            assert 'Expires' not in response.headers, 'Expires не должен отдавать время жизни серверного кэша'
+
     @pytest.mark.django_db
     def test_user_decks_superuser_view(self, admin_client):
         response = admin_client.get(reverse_lazy('decks:user_decks'))
@@ -105,6 +122,37 @@ class TestDeckViews:
         assert not Deck.named.filter(name=old_deck_name).exists(), 'колода осталась с прежним названием'
         assert Deck.named.filter(name=new_deck_name).exists(), 'колода с новым названием в БД не обнаружена'
 
+    @pytest.mark.django_db
+    def test_deck_detail_fragment_cache(self, client, deck):
+        translation.activate('en')
+        url = reverse_lazy('decks:deck_detail', kwargs={'deck_id': deck.pk})
+        with CaptureQueriesContext(connection) as first:
+            first_response = client.get(url)
+        with CaptureQueriesContext(connection) as second:
+            second_response = client.get(url)
+        assert len(second) < len(first), 'список карт и статистика колоды должны браться из кэша'
+
+        def deck_cards(response) -> str:
+            return response.content.decode().split('<tbody class="deck-cards">')[1].split('</tbody>')[0]
+
+        assert deck_cards(first_response) == deck_cards(second_response), 'список карт из кэша не должен отличаться'
+
+    @pytest.mark.django_db
+    def test_deck_list_num_queries(self, deckstring):
+        parsed = parse_deckstring(deckstring)
+        for _ in range(4):
+            parsed.cards.native.pop()
+            Deck.from_deckstring(write_deckstring(parsed))
+
+        def render_page(num_decks: int) -> int:
+            decks = Deck.nameless.select_related('summary')[:num_decks]
+            with CaptureQueriesContext(connection) as queries:
+                for deck in DeckAnalytics.for_decks(decks):
+                    render_to_string('decks/tags/deck-accordion.html', {'deck': deck})
+            return len(queries)
+
+        assert render_page(1) == render_page(4), 'число запросов не должно зависеть от числа колод на странице'
+
 
 class TestCardViews:
 
@@ -119,6 +167,30 @@ class TestCardViews:
         response = client.get(reverse_lazy('cards:card_detail', kwargs={'card_slug': slug}))
         assert response.status_code == status.HTTP_200_OK, f'Тестовая карта {slug} недоступна'
 
+    @pytest.mark.django_db
+    def test_card_admin_search(self, admin_client):
+        card = Card.objects.exclude(card_set=None).first()
+        url = reverse_lazy('admin:cards_card_changelist')
+        for search_term in (card.card_set.name, card.name):
+            response = admin_client.get(url, {'q': search_term})
+            assert card in response.context['cl'].result_list, \
+                f'поиск в админке по "{search_term}" не нашел карту {card}'
+
+    @pytest.mark.django_db
+    def test_card_list_view_cache(self, client):
+        translation.activate('en')
+        url = reverse_lazy('cards:card_list')
+        client.get(url)
+        stats = page_cache.get_stats()['CardListView']
+        client.get(url)
+        assert page_cache.get_stats()['CardListView']['hits'] == stats['hits'] + 1, \
+            'повторный запрос страницы должен обслуживаться из кэша'
+
+        page_cache.bump(CacheScope.CARDS)     # обновление БД карт
+        client.get(url)
+        assert page_cache.get_stats()['CardListView']['misses'] == stats['misses'] + 1, \
+            'после обновления БД кэш страницы должен устареть'
+
 
 class TestCoreViews:
 
@@ -143,9 +215,14 @@ class TestCoreViews:
         assert 'email' in data, 'contact вернул ответ без "email"'
 
     @pytest.mark.django_db
-    def test_statistics_view(self, client):
+    def test_statistics_view(self, client, monkeypatch):
+        queued = []
+        monkeypatch.setattr(update_statistics, 'delay', lambda: queued.append(True))
         response = client.get(reverse_lazy('statistics'))
         assert response.status_code == status.HTTP_200_OK, 'раздел Статистика недоступен'
+        assert response.context['statistics'] is None, 'без снимка статистика не должна рассчитываться в запросе'
+        client.get(reverse_lazy('statistics'))
+        assert len(queued) == 1, 'расчет снимка статистики должен ставиться в очередь один раз'
 
     def test_api_greeting_view(self, client):
         response = client.get(reverse_lazy('api_greeting'))